@@ -0,0 +1,155 @@
+import logging
+import time
+from dimension_bridges import bridge_column, has_value_lists, values_column
+
+logger = logging.getLogger(__name__)
+
+CUBE_DIMENSIONS = [
+    'region_group', 'region', 'country', 'class', 'data_center', 'data_center_site'
+]
+
+# Every breakdown the dashboards slice with rows(); () is the grand total.
+# Multi-valued columns are served per value by values() instead
+GROUPING_SETS = [
+    (),
+    ('region_group',),
+    ('region',),
+    ('country',),
+    ('class',),
+    ('data_center',),
+    ('data_center_site',)
+]
+
+# Distinct-host measures; when host is unique (it is the primary key in every
+# schema we build) these collapse to plain counts, which are ~3x cheaper
+DISTINCT_MEASURES = {
+    'hosts': ("COUNT(DISTINCT host)", "COUNT(*)"),
+    'cmdb_hosts': ("COUNT(DISTINCT host) FILTER (WHERE cmdb)", "COUNT_IF(cmdb)"),
+    'url_fqdn_hosts': ("COUNT(DISTINCT host) FILTER (WHERE url_fqdn)", "COUNT_IF(url_fqdn)")
+}
+
+MEASURES = {
+    'rows': "COUNT(*)",
+    'cmdb': "COUNT_IF(cmdb)",
+    'tanium': "COUNT_IF(tanium)",
+    'splunk': "COUNT_IF(splunk)",
+    'gso': "COUNT_IF(gso)",
+    'crowdstrike': "COUNT_IF(crowdstrike)",
+    'dlp': "COUNT_IF(dlp)",
+    'ssc': "COUNT_IF(ssc)",
+    'splunk_and_gso': "COUNT_IF(splunk AND gso)",
+    'no_logging': "COUNT_IF(NOT splunk AND NOT gso)"
+}
+
+# host_coverage columns the measures read
+MEASURE_COLUMNS = ['host', 'url_fqdn', 'cmdb', 'tanium', 'splunk', 'gso', 'crowdstrike', 'dlp', 'ssc']
+
+def _grouping_id(dims):
+    # GROUPING_ID sets a bit for every dimension that is *not* grouped, first argument highest
+    n = len(CUBE_DIMENSIONS)
+    return sum(1 << (n - 1 - i) for i, dim in enumerate(CUBE_DIMENSIONS) if dim not in dims)
+
+class CoverageCube:
+    """Result of one GROUPING SETS scan over host_coverage, sliced per breakdown"""
+
+    def __init__(self, slices, exploded=None):
+        self._slices = slices
+        self._exploded = exploded or {}
+
+    def rows(self, *dims, null_as=None):
+        """Rows of one grouping set as dicts of its dimensions plus every measure.
+
+        Rows are ordered by row count, largest first. `null_as` replaces NULL
+        dimension values, like COALESCE(dim, ...) in the original queries.
+        """
+        rows = self._slices.get(tuple(dims), [])
+        if null_as is None:
+            return rows
+        return [{k: (null_as if k in dims and v is None else v) for k, v in row.items()} for row in rows]
+
+    def values(self, column):
+        """Measures per individual value of a multi-valued column (from its bridge table).
+
+        Rows carry the value under 'value'. values('class') yields the extracted
+        "Class N" labels, unlike rows('class') which groups the raw strings.
+        """
+        return self._exploded.get(column, [])
+
+    def total(self):
+        rows = self.rows()
+        return rows[0] if rows else {name: 0 for name in list(MEASURES) + list(DISTINCT_MEASURES)}
+
+def _build_exploded(conn, source, bridges, measures, from_lists=False):
+    names = list(bridges)
+    if from_lists:
+        # Unnesting the parsed value lists skips the bridge join entirely
+        selects = [
+            f"SELECT {i} AS bridge_id, value, {measures} FROM ("
+            f"SELECT {', '.join(MEASURE_COLUMNS)}, UNNEST({values_column(bridge_column(name))}) AS value "
+            f"FROM {source}) GROUP BY value"
+            for i, name in enumerate(names)
+        ]
+    else:
+        selects = [
+            f"SELECT {i} AS bridge_id, value, {measures} FROM {bridges[name]} JOIN {source} USING (host) GROUP BY value"
+            for i, name in enumerate(names)
+        ]
+    exploded = {bridge_column(name): [] for name in names}
+    for record in conn.execute(' UNION ALL '.join(selects)).fetchall():
+        exploded[bridge_column(names[record[0]])].append(record[1:])
+    return exploded
+
+def build_cube(conn, source='host_coverage', bridges=None, run_concurrently=None):
+    """Scan the grouping sets and, with `bridges`, the per-value explosions.
+
+    The two scans are independent; `run_concurrently(tasks)` (such as
+    DatabaseManager.run_concurrently) lets them run on separate cursors at once.
+    """
+    started = time.time()
+    dims = ', '.join(CUBE_DIMENSIONS)
+    sets = ', '.join(f"({', '.join(gs)})" for gs in GROUPING_SETS)
+    unique_hosts = conn.execute(f"SELECT COUNT(*) = COUNT(DISTINCT host) FROM {source}").fetchone()[0]
+    measure_exprs = dict(MEASURES)
+    for name, (distinct_expr, plain_expr) in DISTINCT_MEASURES.items():
+        measure_exprs[name] = plain_expr if unique_hosts else distinct_expr
+    measures = ', '.join(f"{expr} AS {name}" for name, expr in measure_exprs.items())
+
+    cube_sql = f"""
+        SELECT GROUPING_ID({dims}) AS grouping_id, {dims}, {measures}
+        FROM {source}
+        GROUP BY GROUPING SETS ({sets})
+    """
+    scans = [lambda cursor: cursor.execute(cube_sql).fetchall()]
+    if bridges:
+        # Bridge rows are distinct per (host, value); a row's own list only
+        # matches that when every host has a single row
+        from_lists = unique_hosts and has_value_lists(conn, source)
+        scans.append(lambda cursor: _build_exploded(cursor, source, bridges, measures, from_lists))
+    if run_concurrently is None:
+        results = [scan(conn) for scan in scans]
+    else:
+        results = run_concurrently(scans)
+    records = results[0]
+
+    set_by_id = {_grouping_id(gs): gs for gs in GROUPING_SETS}
+    slices = {gs: [] for gs in GROUPING_SETS}
+    measure_names = list(measure_exprs)
+    position = {dim: i for i, dim in enumerate(CUBE_DIMENSIONS, 1)}
+    offset = 1 + len(CUBE_DIMENSIONS)
+
+    for record in records:
+        gs = set_by_id[record[0]]
+        row = {dim: record[position[dim]] for dim in gs}
+        row.update(zip(measure_names, record[offset:]))
+        slices[gs].append(row)
+
+    exploded = {}
+    if bridges:
+        for column, value_records in results[1].items():
+            exploded[column] = [dict(zip(['value'] + measure_names, record)) for record in value_records]
+
+    for rows in list(slices.values()) + list(exploded.values()):
+        rows.sort(key=lambda r: r['rows'], reverse=True)
+
+    logger.info(f"Built coverage cube: {len(records)} cells in {time.time() - started:.2f}s")
+    return CoverageCube(slices, exploded)
@@ -1,10 +1,20 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
+from urllib.parse import parse_qsl, urlencode
+from werkzeug.exceptions import HTTPException
 from flask_cors import CORS
 import logging
-import duckdb
 from collections import Counter, defaultdict
 from datetime import datetime
 import os
+from db_manager import DatabaseManager
+from coverage_snapshot import coverage_relation
+from aggregation import build_cube
+from dimension_bridges import bridge_relations, has_value_lists, values_column
+from cmdb_metadata import get_metadata
+from response_cache import ResponseCache
+from host_search import HostSearchIndex, SEARCH_MODES
+from coverage_history import HISTORY_DIMENSIONS, INTERVALS, trend_series
+from query_profiler import QueryProfiler
 
 app = Flask(__name__)
 CORS(app)
@@ -12,26 +22,58 @@ CORS(app)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+profiler = QueryProfiler(
+    enabled=os.getenv('CMDB_PROFILE', '1') != '0',
+    slow_query_ms=float(os.getenv('CMDB_SLOW_QUERY_MS', '250')),
+    explain_slow=os.getenv('CMDB_EXPLAIN_SLOW', '0') == '1'
+)
+profiler.init_app(app)
+
+# CMDB_SNAPSHOT_DIR serves a Parquet snapshot directory instead of the .db file
+db = DatabaseManager(
+    wrap_cursor=profiler.wrap,
+    snapshot_dir=os.getenv('CMDB_SNAPSHOT_DIR') or None,
+    materialize_snapshot=os.getenv('CMDB_SNAPSHOT_MATERIALIZE', '0') == '1'
+)
+
+@app.before_request
+def pin_database_version():
+    # Every query of the request reads the version current when it started. The
+    # token lives in the environ, not g: batch sub-requests share g but not environ
+    try:
+        request.environ['cmdb.db_pin'] = db.pin()
+    except Exception as e:
+        logger.warning(f"Could not pin database version: {e}")
+
+@app.teardown_request
+def unpin_database_version(exc):
+    token = request.environ.pop('cmdb.db_pin', None)
+    if token is not None:
+        db.unpin(token)
+
 def get_db_connection():
-    db_paths = [
-        'universal_cmdb.db',
-        './universal_cmdb.db',
-        '../universal_cmdb.db',
-        os.path.join(os.getcwd(), 'universal_cmdb.db')
-    ]
-    
-    for db_path in db_paths:
-        try:
-            if os.path.exists(db_path):
-                conn = duckdb.connect(db_path, read_only=True)
-                tables = conn.execute("SHOW TABLES").fetchall()
-                if any('universal_cmdb' in str(table).lower() for table in tables):
-                    return conn
-                conn.close()
-        except Exception as e:
-            continue
-    
-    raise Exception("Database file 'universal_cmdb.db' not found")
+    return db.cursor()
+
+def coverage_source(conn):
+    """host_coverage, or an inline equivalent for databases built before it existed"""
+    return db.generation_cached('coverage_source', coverage_relation)
+
+def data_version():
+    """Ingest generation marker, falling back to the file signature for older databases"""
+    return db.generation_cached(
+        'data_version', lambda conn: get_metadata(conn, 'generation') or db.file_signature())
+
+def bridge_sources(conn):
+    """host_<dimension> bridge tables, or inline explosions for databases built before them"""
+    return db.generation_cached('bridge_sources', lambda c: bridge_relations(c, coverage_source(c)))
+
+def coverage_cube():
+    """All dashboard breakdowns from a single GROUPING SETS scan, rebuilt per data generation"""
+    return db.generation_cached(
+        'coverage_cube',
+        lambda conn: build_cube(conn, coverage_source(conn), bridge_sources(conn), db.run_concurrently))
+
+cache = ResponseCache(data_version)
 
 def normalize_region(region):
     if not region:
@@ -47,22 +89,24 @@ def normalize_region(region):
         return 'LATAM'
     return region
 
-def parse_pipe_separated(value):
-    if not value or str(value).lower() in ['null', 'none', 'unknown', '']:
-        return []
-    return [v.strip() for v in str(value).split('|') if v.strip()]
+@app.route('/metrics')
+def metrics():
+    return Response(profiler.render_metrics(), mimetype='text/plain; version=0.0.4')
 
-def parse_comma_separated(value):
-    if not value or str(value).lower() in ['null', 'none', 'unknown', '']:
-        return []
-    return [v.strip() for v in str(value).split(',') if v.strip()]
+@app.route('/api/_debug/profile')
+def debug_profile():
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), 500)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    return jsonify(profiler.snapshot(request.args.get('route'), limit))
 
 @app.route('/api/database_status')
 def database_status():
     try:
         conn = get_db_connection()
-        result = conn.execute("SELECT COUNT(*) FROM universal_cmdb").fetchone()
-        conn.close()
+        source = coverage_source(conn)
+        result = conn.execute(f"SELECT COUNT(*) FROM {source}").fetchone()
         return jsonify({
             'status': 'connected',
             'total_records': result[0] if result else 0
@@ -71,70 +115,23 @@ def database_status():
         return jsonify({'status': 'error', 'error': str(e)}), 500
 
 @app.route('/api/global_view/summary')
+@cache.cached
 def global_view_summary():
     try:
-        conn = get_db_connection()
+        cube = coverage_cube()
         
-        total_assets = conn.execute("SELECT COUNT(DISTINCT host) FROM universal_cmdb").fetchone()[0]
+        totals = cube.total()
+        total_assets, cmdb_covered, url_fqdn_covered = totals['hosts'], totals['cmdb_hosts'], totals['url_fqdn_hosts']
         
-        cmdb_covered = conn.execute("""
-            SELECT COUNT(DISTINCT host) FROM universal_cmdb 
-            WHERE LOWER(present_in_cmdb) LIKE '%yes%'
-        """).fetchone()[0]
+        regional_data = [(r['region_group'], r['hosts'], r['cmdb'], r['tanium'], r['splunk'], r['gso'])
+                         for r in cube.rows('region_group')]
         
-        url_fqdn_covered = conn.execute("""
-            SELECT COUNT(DISTINCT host) FROM universal_cmdb 
-            WHERE (host LIKE '%.%' OR host LIKE 'http%')
-        """).fetchone()[0]
+        country_data = [(r['country'], r['hosts'], r['cmdb'])
+                        for r in cube.rows('country', null_as='Unknown')[:15]]
         
-        regional_data = conn.execute("""
-            SELECT 
-                COALESCE(region, 'Unknown') as region,
-                COUNT(DISTINCT host) as asset_count,
-                SUM(CASE WHEN LOWER(present_in_cmdb) LIKE '%yes%' THEN 1 ELSE 0 END) as cmdb_count,
-                SUM(CASE WHEN LOWER(tanium_coverage) LIKE '%tanium%' THEN 1 ELSE 0 END) as tanium_count,
-                SUM(CASE WHEN LOWER(logging_in_splunk) LIKE '%yes%' OR LOWER(logging_in_splunk) LIKE '%splunk%' THEN 1 ELSE 0 END) as splunk_count,
-                SUM(CASE WHEN LOWER(logging_in_gso) LIKE '%yes%' OR LOWER(logging_in_gso) LIKE '%gso%' THEN 1 ELSE 0 END) as gso_count
-            FROM universal_cmdb
-            GROUP BY region
-            ORDER BY asset_count DESC
-        """).fetchall()
-        
-        country_data = conn.execute("""
-            SELECT 
-                COALESCE(country, 'Unknown') as country,
-                COUNT(DISTINCT host) as asset_count,
-                SUM(CASE WHEN LOWER(present_in_cmdb) LIKE '%yes%' THEN 1 ELSE 0 END) as cmdb_count
-            FROM universal_cmdb
-            GROUP BY country
-            ORDER BY asset_count DESC
-            LIMIT 15
-        """).fetchall()
-        
-        datacenter_data = conn.execute("""
-            SELECT 
-                CASE 
-                    WHEN data_center IS NULL OR data_center = '' THEN 'Unknown'
-                    ELSE SUBSTRING(data_center, 1, POSITION(' ' IN data_center || ' ') - 1)
-                END as data_center,
-                COUNT(DISTINCT host) as asset_count
-            FROM universal_cmdb
-            GROUP BY data_center
-            ORDER BY asset_count DESC
-            LIMIT 10
-        """).fetchall()
-        
-        cloud_data = conn.execute("""
-            SELECT 
-                COALESCE(cloud_region, 'Unknown') as cloud_region,
-                COUNT(DISTINCT host) as asset_count
-            FROM universal_cmdb
-            WHERE cloud_region IS NOT NULL AND cloud_region != ''
-            GROUP BY cloud_region
-            ORDER BY asset_count DESC
-        """).fetchall()
+        datacenter_data = [(r['data_center_site'], r['hosts']) for r in cube.rows('data_center_site')[:10]]
         
-        conn.close()
+        cloud_data = [(r['value'], r['hosts']) for r in cube.values('cloud_region')]
         
         cmdb_coverage_pct = (cmdb_covered / total_assets * 100) if total_assets > 0 else 0
         url_fqdn_coverage_pct = (url_fqdn_covered / total_assets * 100) if total_assets > 0 else 0
@@ -143,12 +140,11 @@ def global_view_summary():
         region_aggregates = defaultdict(lambda: {'assets': 0, 'cmdb': 0, 'tanium': 0, 'splunk': 0, 'gso': 0})
         
         for region, assets, cmdb, tanium, splunk, gso in regional_data:
-            normalized_region = normalize_region(region)
-            region_aggregates[normalized_region]['assets'] += assets
-            region_aggregates[normalized_region]['cmdb'] += cmdb
-            region_aggregates[normalized_region]['tanium'] += tanium
-            region_aggregates[normalized_region]['splunk'] += splunk
-            region_aggregates[normalized_region]['gso'] += gso
+            region_aggregates[region]['assets'] += assets
+            region_aggregates[region]['cmdb'] += cmdb
+            region_aggregates[region]['tanium'] += tanium
+            region_aggregates[region]['splunk'] += splunk
+            region_aggregates[region]['gso'] += gso
         
         for region, data in region_aggregates.items():
             assets = data['assets']
@@ -177,15 +173,9 @@ def global_view_summary():
                        'percentage': round((a / total_assets * 100) if total_assets > 0 else 0, 2)} 
                       for d, a in datacenter_data]
         
-        cloud_regions = []
-        for region_str, assets in cloud_data:
-            regions_list = parse_pipe_separated(region_str)
-            for r in regions_list[:5]:
-                cloud_regions.append({
-                    'region': r,
-                    'assets': assets,
-                    'percentage': round((assets / total_assets * 100) if total_assets > 0 else 0, 2)
-                })
+        cloud_regions = [{'region': r, 'assets': a,
+                          'percentage': round((a / total_assets * 100) if total_assets > 0 else 0, 2)}
+                         for r, a in cloud_data]
         
         return jsonify({
             'global_metrics': {
@@ -208,36 +198,17 @@ def global_view_summary():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/infrastructure_type/breakdown')
+@cache.cached
 def infrastructure_breakdown():
     try:
-        conn = get_db_connection()
-        
-        result = conn.execute("""
-            SELECT 
-                COALESCE(infrastructure_type, 'Unknown') as infra_type,
-                COUNT(DISTINCT host) as total_assets,
-                SUM(CASE WHEN LOWER(present_in_cmdb) LIKE '%yes%' THEN 1 ELSE 0 END) as cmdb_registered,
-                SUM(CASE WHEN LOWER(tanium_coverage) LIKE '%tanium%' THEN 1 ELSE 0 END) as tanium_deployed,
-                SUM(CASE WHEN LOWER(logging_in_splunk) LIKE '%yes%' OR LOWER(logging_in_splunk) LIKE '%splunk%' THEN 1 ELSE 0 END) as splunk_logging,
-                SUM(CASE WHEN LOWER(presence_in_crowdstrike) LIKE '%yes%' OR LOWER(presence_in_crowdstrike) LIKE '%crowdstrike%' THEN 1 ELSE 0 END) as crowdstrike_edr
-            FROM universal_cmdb
-            GROUP BY infrastructure_type
-            ORDER BY total_assets DESC
-        """).fetchall()
+        cube = coverage_cube()
         
         infrastructure_data = []
-        type_aggregates = defaultdict(lambda: {'total': 0, 'cmdb': 0, 'tanium': 0, 'splunk': 0, 'crowdstrike': 0})
-        
-        for row in result:
-            infra_type_str, total, cmdb, tanium, splunk, crowdstrike = row
-            infra_types = parse_pipe_separated(infra_type_str)
-            
-            for infra_type in infra_types:
-                type_aggregates[infra_type]['total'] += total
-                type_aggregates[infra_type]['cmdb'] += cmdb
-                type_aggregates[infra_type]['tanium'] += tanium
-                type_aggregates[infra_type]['splunk'] += splunk
-                type_aggregates[infra_type]['crowdstrike'] += crowdstrike
+        type_aggregates = {
+            r['value']: {'total': r['hosts'], 'cmdb': r['cmdb'], 'tanium': r['tanium'],
+                         'splunk': r['splunk'], 'crowdstrike': r['crowdstrike']}
+            for r in cube.values('infrastructure_type')
+        }
         
         category_totals = defaultdict(lambda: {'total': 0, 'cmdb': 0, 'tanium': 0, 'splunk': 0, 'crowdstrike': 0})
         
@@ -292,8 +263,6 @@ def infrastructure_breakdown():
                     'overall_visibility': round((totals['cmdb'] + totals['tanium'] + totals['splunk'] + totals['crowdstrike']) / (totals['total'] * 4) * 100, 2)
                 })
         
-        conn.close()
-        
         return jsonify({
             'infrastructure_breakdown': infrastructure_data[:20],
             'category_summary': category_summary,
@@ -305,81 +274,53 @@ def infrastructure_breakdown():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/bu_application/breakdown')
+@cache.cached
 def bu_application_breakdown():
     try:
         conn = get_db_connection()
+        source = coverage_source(conn)
+        bridges = bridge_sources(conn)
         
-        bu_result = conn.execute("""
+        # The cube may still have to be built; the per-BU scan does not need it
+        bu_sql = f"""
             SELECT 
-                COALESCE(business_unit, 'Unknown') as bu,
-                COALESCE(cio, 'Unknown') as cio,
-                COALESCE(class, 'Unknown') as app_class,
+                COALESCE(host_business_unit.value, 'Unknown') as bu,
                 COUNT(DISTINCT host) as total_assets,
-                SUM(CASE WHEN LOWER(present_in_cmdb) LIKE '%yes%' THEN 1 ELSE 0 END) as cmdb_registered,
-                SUM(CASE WHEN LOWER(tanium_coverage) LIKE '%tanium%' THEN 1 ELSE 0 END) as tanium_deployed,
-                SUM(CASE WHEN LOWER(logging_in_splunk) LIKE '%yes%' OR LOWER(logging_in_splunk) LIKE '%splunk%' THEN 1 ELSE 0 END) as splunk_logging
-            FROM universal_cmdb
-            GROUP BY business_unit, cio, class
+                COUNT(DISTINCT host) FILTER (WHERE cmdb) as cmdb_registered,
+                COUNT(DISTINCT host) FILTER (WHERE tanium) as tanium_deployed,
+                COUNT(DISTINCT host) FILTER (WHERE splunk) as splunk_logging,
+                COUNT(DISTINCT host_cio.value) FILTER (WHERE NOT regexp_full_match(host_cio.value, '\\d+')) as cio_count,
+                COUNT(DISTINCT host_class.value) as app_class_count
+            FROM {source}
+            LEFT JOIN {bridges['host_business_unit']} USING (host)
+            LEFT JOIN {bridges['host_cio']} USING (host)
+            LEFT JOIN {bridges['host_class']} USING (host)
+            GROUP BY 1
             ORDER BY total_assets DESC
-        """).fetchall()
-        
-        bu_aggregates = defaultdict(lambda: {
-            'total_assets': 0,
-            'cio_owners': set(),
-            'app_classes': set(),
-            'cmdb_registered': 0,
-            'tanium_deployed': 0,
-            'splunk_logging': 0
-        })
-        
-        app_class_totals = defaultdict(int)
-        cio_totals = defaultdict(int)
+        """
+        cube, bu_result = db.run_concurrently([
+            lambda cursor: coverage_cube(),
+            lambda cursor: cursor.execute(bu_sql).fetchall()
+        ])
         
-        for row in bu_result:
-            bu_str, cio_str, app_class_str, total, cmdb, tanium, splunk = row
-            
-            bus = parse_comma_separated(bu_str)
-            if not bus:
-                bus = parse_pipe_separated(bu_str)
-            if not bus:
-                bus = [bu_str]
-            
-            for bu in bus:
-                bu_aggregates[bu]['total_assets'] += total
-                bu_aggregates[bu]['cmdb_registered'] += cmdb
-                bu_aggregates[bu]['tanium_deployed'] += tanium
-                bu_aggregates[bu]['splunk_logging'] += splunk
-                
-                if cio_str and cio_str != 'Unknown':
-                    cio_values = parse_pipe_separated(cio_str)
-                    for cio in cio_values:
-                        if cio and not cio.isdigit():
-                            bu_aggregates[bu]['cio_owners'].add(cio)
-                            cio_totals[cio] += total
-                
-                if app_class_str and app_class_str != 'Unknown':
-                    import re
-                    class_matches = re.findall(r'class\s*(\d+)', app_class_str.lower())
-                    for match in class_matches:
-                        class_name = f"Class {match}"
-                        bu_aggregates[bu]['app_classes'].add(class_name)
-                        app_class_totals[class_name] += total
+        app_class_totals = {r['value']: r['hosts'] for r in cube.values('class')}
+        cio_totals = {r['value']: r['hosts'] for r in cube.values('cio') if not r['value'].isdigit()}
         
         business_units = []
-        for bu, data in bu_aggregates.items():
-            if data['total_assets'] > 0:
-                visibility_score = ((data['cmdb_registered'] + data['tanium_deployed'] + data['splunk_logging']) / 
-                                  (data['total_assets'] * 3) * 100)
+        for bu, total_assets, cmdb_registered, tanium_deployed, splunk_logging, cio_count, app_class_count in bu_result:
+            if total_assets > 0:
+                visibility_score = ((cmdb_registered + tanium_deployed + splunk_logging) / 
+                                  (total_assets * 3) * 100)
                 
                 business_units.append({
                     'business_unit': bu,
-                    'total_assets': data['total_assets'],
-                    'cio_count': len(data['cio_owners']),
-                    'app_class_count': len(data['app_classes']),
+                    'total_assets': total_assets,
+                    'cio_count': cio_count,
+                    'app_class_count': app_class_count,
                     'visibility_metrics': {
-                        'cmdb': round((data['cmdb_registered'] / data['total_assets'] * 100), 2),
-                        'tanium': round((data['tanium_deployed'] / data['total_assets'] * 100), 2),
-                        'splunk': round((data['splunk_logging'] / data['total_assets'] * 100), 2)
+                        'cmdb': round((cmdb_registered / total_assets * 100), 2),
+                        'tanium': round((tanium_deployed / total_assets * 100), 2),
+                        'splunk': round((splunk_logging / total_assets * 100), 2)
                     },
                     'overall_visibility': round(visibility_score, 2),
                     'risk_level': 'CRITICAL' if visibility_score < 30 else 'HIGH' if visibility_score < 60 else 'MEDIUM' if visibility_score < 80 else 'LOW'
@@ -393,8 +334,6 @@ def bu_application_breakdown():
         cio_list = [{'cio': cio, 'total_assets': total} for cio, total in cio_totals.items()]
         cio_list.sort(key=lambda x: x['total_assets'], reverse=True)
         
-        conn.close()
-        
         return jsonify({
             'business_units': business_units[:20],
             'application_classes': app_classes[:15],
@@ -409,51 +348,38 @@ def bu_application_breakdown():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/system_classification/breakdown')
+@cache.cached
 def system_classification_breakdown():
     try:
-        conn = get_db_connection()
-        
-        result = conn.execute("""
-            SELECT 
-                COALESCE(system_classification, 'Unknown') as system_class,
-                COUNT(DISTINCT host) as total_assets,
-                SUM(CASE WHEN LOWER(present_in_cmdb) LIKE '%yes%' THEN 1 ELSE 0 END) as cmdb_registered,
-                SUM(CASE WHEN LOWER(tanium_coverage) LIKE '%tanium%' THEN 1 ELSE 0 END) as tanium_deployed
-            FROM universal_cmdb
-            GROUP BY system_classification
-            ORDER BY total_assets DESC
-        """).fetchall()
+        cube = coverage_cube()
         
         system_aggregates = defaultdict(lambda: {'total': 0, 'cmdb': 0, 'tanium': 0})
         system_categories = defaultdict(lambda: {'total': 0, 'cmdb': 0, 'tanium': 0})
         
-        for row in result:
-            system_str, total, cmdb, tanium = row
-            systems = parse_pipe_separated(system_str)
+        for row in cube.values('system_classification'):
+            system, total, cmdb, tanium = row['value'], row['hosts'], row['cmdb'], row['tanium']
+            system_aggregates[system]['total'] += total
+            system_aggregates[system]['cmdb'] += cmdb
+            system_aggregates[system]['tanium'] += tanium
             
-            for system in systems:
-                system_aggregates[system]['total'] += total
-                system_aggregates[system]['cmdb'] += cmdb
-                system_aggregates[system]['tanium'] += tanium
-                
-                category = 'Other'
-                system_lower = system.lower()
-                if 'windows' in system_lower:
-                    category = 'Windows Server'
-                elif 'linux' in system_lower:
-                    category = 'Linux Server'
-                elif any(x in system_lower for x in ['aix', 'solaris', 'unix']):
-                    category = '*Nix'
-                elif 'mainframe' in system_lower:
-                    category = 'Mainframe'
-                elif 'database' in system_lower:
-                    category = 'Database'
-                elif any(x in system_lower for x in ['fw', 'ndr', 'switch', 'router']):
-                    category = 'Network Appliance'
-                
-                system_categories[category]['total'] += total
-                system_categories[category]['cmdb'] += cmdb
-                system_categories[category]['tanium'] += tanium
+            category = 'Other'
+            system_lower = system.lower()
+            if 'windows' in system_lower:
+                category = 'Windows Server'
+            elif 'linux' in system_lower:
+                category = 'Linux Server'
+            elif any(x in system_lower for x in ['aix', 'solaris', 'unix']):
+                category = '*Nix'
+            elif 'mainframe' in system_lower:
+                category = 'Mainframe'
+            elif 'database' in system_lower:
+                category = 'Database'
+            elif any(x in system_lower for x in ['fw', 'ndr', 'switch', 'router']):
+                category = 'Network Appliance'
+            
+            system_categories[category]['total'] += total
+            system_categories[category]['cmdb'] += cmdb
+            system_categories[category]['tanium'] += tanium
         
         system_data = []
         for system, data in system_aggregates.items():
@@ -482,8 +408,6 @@ def system_classification_breakdown():
         
         category_summary.sort(key=lambda x: x['total_assets'], reverse=True)
         
-        conn.close()
-        
         return jsonify({
             'system_breakdown': system_data[:20],
             'category_summary': category_summary,
@@ -495,42 +419,26 @@ def system_classification_breakdown():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/security_control/coverage')
+@cache.cached
 def security_control_coverage():
     try:
-        conn = get_db_connection()
+        cube = coverage_cube()
         
-        result = conn.execute("""
-            SELECT 
-                COUNT(DISTINCT host) as total_assets,
-                SUM(CASE WHEN LOWER(tanium_coverage) LIKE '%tanium%' THEN 1 ELSE 0 END) as tanium,
-                SUM(CASE WHEN LOWER(dlp_agent_coverage) LIKE '%dlp%' OR LOWER(dlp_agent_coverage) LIKE '%agent%' THEN 1 ELSE 0 END) as dlp,
-                SUM(CASE WHEN LOWER(presence_in_crowdstrike) LIKE '%yes%' OR LOWER(presence_in_crowdstrike) LIKE '%crowdstrike%' THEN 1 ELSE 0 END) as crowdstrike,
-                SUM(CASE WHEN LOWER(ssc_coverage) IS NOT NULL AND LOWER(ssc_coverage) != '' THEN 1 ELSE 0 END) as ssc
-            FROM universal_cmdb
-        """).fetchone()
+        totals = cube.total()
+        result = (totals['hosts'], totals['tanium'], totals['dlp'], totals['crowdstrike'], totals['ssc'])
         
         total, tanium, dlp, crowdstrike, ssc = result
         
-        regional_coverage = conn.execute("""
-            SELECT 
-                COALESCE(region, 'Unknown') as region,
-                COUNT(DISTINCT host) as total,
-                SUM(CASE WHEN LOWER(tanium_coverage) LIKE '%tanium%' THEN 1 ELSE 0 END) as tanium,
-                SUM(CASE WHEN LOWER(dlp_agent_coverage) LIKE '%dlp%' OR LOWER(dlp_agent_coverage) LIKE '%agent%' THEN 1 ELSE 0 END) as dlp,
-                SUM(CASE WHEN LOWER(presence_in_crowdstrike) LIKE '%yes%' OR LOWER(presence_in_crowdstrike) LIKE '%crowdstrike%' THEN 1 ELSE 0 END) as crowdstrike
-            FROM universal_cmdb
-            GROUP BY region
-            ORDER BY total DESC
-        """).fetchall()
+        regional_coverage = [(r['region_group'], r['hosts'], r['tanium'], r['dlp'], r['crowdstrike'])
+                             for r in cube.rows('region_group')]
         
         regional_aggregates = defaultdict(lambda: {'total': 0, 'tanium': 0, 'dlp': 0, 'crowdstrike': 0})
         
         for region, reg_total, reg_tanium, reg_dlp, reg_crowdstrike in regional_coverage:
-            normalized = normalize_region(region)
-            regional_aggregates[normalized]['total'] += reg_total
-            regional_aggregates[normalized]['tanium'] += reg_tanium
-            regional_aggregates[normalized]['dlp'] += reg_dlp
-            regional_aggregates[normalized]['crowdstrike'] += reg_crowdstrike
+            regional_aggregates[region]['total'] += reg_total
+            regional_aggregates[region]['tanium'] += reg_tanium
+            regional_aggregates[region]['dlp'] += reg_dlp
+            regional_aggregates[region]['crowdstrike'] += reg_crowdstrike
         
         regional_data = []
         for region, data in regional_aggregates.items():
@@ -545,8 +453,6 @@ def security_control_coverage():
         
         regional_data.sort(key=lambda x: x['total_assets'], reverse=True)
         
-        conn.close()
-        
         overall_coverage = {
             'tanium': {'deployed': tanium, 'coverage': round((tanium / total * 100) if total > 0 else 0, 2)},
             'dlp': {'deployed': dlp, 'coverage': round((dlp / total * 100) if total > 0 else 0, 2)},
@@ -569,31 +475,13 @@ def security_control_coverage():
 # Add these additional API endpoints to your app.py file
 
 @app.route('/api/source_tables')
+@cache.cached
 def api_source_tables():
     try:
-        conn = get_db_connection()
-        
-        result = conn.execute("""
-            SELECT 
-                COALESCE(source_tables, 'unknown') as source_tables,
-                COUNT(*) as frequency
-            FROM universal_cmdb 
-            GROUP BY source_tables
-            ORDER BY frequency DESC
-        """).fetchall()
-        
-        source_intelligence = {}
-        total_mentions = 0
-        
-        for row in result:
-            source_tables, frequency = row
-            if source_tables and source_tables != 'unknown':
-                source_values = [s.strip() for s in str(source_tables).split(',') if s.strip()]
-                for source in source_values:
-                    source_intelligence[source] = source_intelligence.get(source, 0) + frequency
-                    total_mentions += frequency
+        cube = coverage_cube()
         
-        conn.close()
+        source_intelligence = {r['value']: r['rows'] for r in cube.values('source_tables')}
+        total_mentions = sum(source_intelligence.values())
         
         return jsonify({
             'source_intelligence': source_intelligence,
@@ -605,33 +493,21 @@ def api_source_tables():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/domain_metrics')
+@cache.cached
 def api_domain_metrics():
     try:
-        conn = get_db_connection()
-        
-        result = conn.execute("""
-            SELECT 
-                COALESCE(domain, '') as domain,
-                COUNT(*) as count
-            FROM universal_cmdb
-            GROUP BY domain
-        """).fetchall()
+        cube = coverage_cube()
         
         domain_analysis = {'1dc': 0, 'fead': 0, 'other': 0}
         
-        for row in result:
-            domain, count = row
-            if domain:
-                domain_values = [d.strip() for d in str(domain).split('|') if d.strip()]
-                for d in domain_values:
-                    if '1dc' in d.lower():
-                        domain_analysis['1dc'] += count
-                    elif 'fead' in d.lower():
-                        domain_analysis['fead'] += count
-                    else:
-                        domain_analysis['other'] += count
-        
-        conn.close()
+        for row in cube.values('domain'):
+            d = row['value'].lower()
+            if '1dc' in d:
+                domain_analysis['1dc'] += row['rows']
+            elif 'fead' in d:
+                domain_analysis['fead'] += row['rows']
+            else:
+                domain_analysis['other'] += row['rows']
         
         return jsonify({
             'domain_analysis': domain_analysis
@@ -641,29 +517,12 @@ def api_domain_metrics():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/infrastructure_type')
+@cache.cached
 def api_infrastructure_type():
     try:
-        conn = get_db_connection()
+        cube = coverage_cube()
         
-        result = conn.execute("""
-            SELECT 
-                COALESCE(infrastructure_type, 'unknown') as infrastructure_type,
-                COUNT(*) as count
-            FROM universal_cmdb
-            GROUP BY infrastructure_type
-            ORDER BY count DESC
-        """).fetchall()
-        
-        infrastructure_matrix = {}
-        
-        for row in result:
-            infra_type, count = row
-            if infra_type and infra_type != 'unknown':
-                infra_values = [i.strip() for i in str(infra_type).split('|') if i.strip()]
-                for i_type in infra_values:
-                    infrastructure_matrix[i_type] = infrastructure_matrix.get(i_type, 0) + count
-        
-        conn.close()
+        infrastructure_matrix = {r['value']: r['rows'] for r in cube.values('infrastructure_type')}
         
         return jsonify({
             'infrastructure_matrix': infrastructure_matrix
@@ -673,18 +532,12 @@ def api_infrastructure_type():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/region_metrics')
+@cache.cached
 def api_region_metrics():
     try:
-        conn = get_db_connection()
+        cube = coverage_cube()
         
-        result = conn.execute("""
-            SELECT 
-                COALESCE(region, 'unknown') as region,
-                COUNT(*) as count
-            FROM universal_cmdb
-            GROUP BY region
-            ORDER BY count DESC
-        """).fetchall()
+        result = [(r['region'], r['rows']) for r in cube.rows('region', null_as='unknown')]
         
         global_surveillance = {}
         total_coverage = 0
@@ -696,8 +549,6 @@ def api_region_metrics():
                 global_surveillance[normalized] = global_surveillance.get(normalized, 0) + count
                 total_coverage += count
         
-        conn.close()
-        
         return jsonify({
             'global_surveillance': global_surveillance,
             'total_coverage': total_coverage
@@ -707,18 +558,12 @@ def api_region_metrics():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/country_metrics')
+@cache.cached
 def api_country_metrics():
     try:
-        conn = get_db_connection()
+        cube = coverage_cube()
         
-        result = conn.execute("""
-            SELECT 
-                COALESCE(country, 'unknown') as country,
-                COUNT(*) as count
-            FROM universal_cmdb
-            GROUP BY country
-            ORDER BY count DESC
-        """).fetchall()
+        result = [(r['country'], r['rows']) for r in cube.rows('country', null_as='unknown')]
         
         global_intelligence = {}
         total_countries = 0
@@ -730,8 +575,6 @@ def api_country_metrics():
                 global_intelligence[normalized] = count
                 total_countries += 1
         
-        conn.close()
-        
         return jsonify({
             'global_intelligence': global_intelligence,
             'total_countries': total_countries
@@ -741,18 +584,12 @@ def api_country_metrics():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/data_center_metrics')
+@cache.cached
 def api_data_center_metrics():
     try:
-        conn = get_db_connection()
+        cube = coverage_cube()
         
-        result = conn.execute("""
-            SELECT 
-                COALESCE(data_center, 'unknown') as data_center,
-                COUNT(*) as count
-            FROM universal_cmdb
-            GROUP BY data_center
-            ORDER BY count DESC
-        """).fetchall()
+        result = [(r['data_center'], r['rows']) for r in cube.rows('data_center', null_as='unknown')]
         
         facility_intelligence = {}
         
@@ -762,8 +599,6 @@ def api_data_center_metrics():
                 first_word = str(data_center).split()[0] if str(data_center).split() else str(data_center)
                 facility_intelligence[first_word] = facility_intelligence.get(first_word, 0) + count
         
-        conn.close()
-        
         return jsonify({
             'facility_intelligence': facility_intelligence
         })
@@ -772,28 +607,12 @@ def api_data_center_metrics():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/cloud_region_metrics')
+@cache.cached
 def api_cloud_region_metrics():
     try:
-        conn = get_db_connection()
-        
-        result = conn.execute("""
-            SELECT DISTINCT 
-                COALESCE(cloud_region, 'unknown') as cloud_region
-            FROM universal_cmdb
-            WHERE cloud_region IS NOT NULL AND cloud_region != ''
-        """).fetchall()
-        
-        cloud_matrix = []
-        
-        for row in result:
-            cloud_region = row[0]
-            if cloud_region and cloud_region != 'unknown':
-                cloud_values = [c.strip() for c in str(cloud_region).split('|') if c.strip()]
-                for cr in cloud_values:
-                    if cr not in cloud_matrix:
-                        cloud_matrix.append(cr)
+        cube = coverage_cube()
         
-        conn.close()
+        cloud_matrix = [r['value'] for r in cube.values('cloud_region')]
         
         return jsonify({
             'cloud_matrix': cloud_matrix
@@ -803,19 +622,12 @@ def api_cloud_region_metrics():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/class_metrics')
+@cache.cached
 def api_class_metrics():
     try:
-        conn = get_db_connection()
+        cube = coverage_cube()
         
-        result = conn.execute("""
-            SELECT 
-                COALESCE(class, 'unknown') as class,
-                COUNT(*) as count
-            FROM universal_cmdb
-            WHERE class IS NOT NULL AND class != ''
-            GROUP BY class
-            ORDER BY count DESC
-        """).fetchall()
+        result = [(r['class'], r['rows']) for r in cube.rows('class') if r['class']]
         
         classification_matrix = {}
         
@@ -831,8 +643,6 @@ def api_class_metrics():
                 else:
                     classification_matrix[str(class_name)] = count
         
-        conn.close()
-        
         return jsonify({
             'classification_matrix': classification_matrix
         })
@@ -841,29 +651,12 @@ def api_class_metrics():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/system_classification_metrics')
+@cache.cached
 def api_system_classification_metrics():
     try:
-        conn = get_db_connection()
-        
-        result = conn.execute("""
-            SELECT 
-                COALESCE(system, 'unknown') as system,
-                COUNT(*) as count
-            FROM universal_cmdb
-            GROUP BY system
-            ORDER BY count DESC
-        """).fetchall()
-        
-        system_matrix = {}
-        
-        for row in result:
-            system_name, count = row
-            if system_name and system_name != 'unknown':
-                system_values = [s.strip() for s in str(system_name).split('|') if s.strip()]
-                for s in system_values:
-                    system_matrix[s] = system_matrix.get(s, 0) + count
+        cube = coverage_cube()
         
-        conn.close()
+        system_matrix = {r['value']: r['rows'] for r in cube.values('system')}
         
         return jsonify({
             'system_matrix': system_matrix
@@ -873,39 +666,12 @@ def api_system_classification_metrics():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/business_unit_metrics')
+@cache.cached
 def api_business_unit_metrics():
     try:
-        conn = get_db_connection()
-        
-        result = conn.execute("""
-            SELECT 
-                COALESCE(business_unit, 'unknown') as business_unit,
-                COUNT(*) as count
-            FROM universal_cmdb
-            GROUP BY business_unit
-            ORDER BY count DESC
-        """).fetchall()
+        cube = coverage_cube()
         
-        business_intelligence = {}
-        
-        for row in result:
-            bu_name, count = row
-            if bu_name and bu_name != 'unknown':
-                # Parse both comma and pipe separated values
-                separators = [',', '|']
-                units = [bu_name]
-                
-                for sep in separators:
-                    new_units = []
-                    for unit in units:
-                        new_units.extend([u.strip() for u in str(unit).split(sep) if u.strip()])
-                    units = new_units
-                
-                for unit in units:
-                    if unit:
-                        business_intelligence[unit] = business_intelligence.get(unit, 0) + count
-        
-        conn.close()
+        business_intelligence = {r['value']: r['rows'] for r in cube.values('business_unit')}
         
         return jsonify({
             'business_intelligence': business_intelligence
@@ -915,32 +681,14 @@ def api_business_unit_metrics():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/cio_metrics')
+@cache.cached
 def api_cio_metrics():
     try:
-        conn = get_db_connection()
+        cube = coverage_cube()
         
-        result = conn.execute("""
-            SELECT 
-                COALESCE(cio, 'unknown') as cio,
-                COUNT(*) as count
-            FROM universal_cmdb
-            WHERE cio IS NOT NULL AND cio != ''
-            GROUP BY cio
-            ORDER BY count DESC
-        """).fetchall()
-        
-        operative_intelligence = {}
-        
-        for row in result:
-            cio_name, count = row
-            if cio_name and cio_name != 'unknown':
-                cio_values = [c.strip() for c in str(cio_name).split('|') if c.strip()]
-                for c in cio_values:
-                    # Only include if it's not a number and has reasonable length
-                    if c and not c.isdigit() and len(c) > 1:
-                        operative_intelligence[c] = operative_intelligence.get(c, 0) + count
-        
-        conn.close()
+        # Only include if it's not a number and has reasonable length
+        operative_intelligence = {r['value']: r['rows'] for r in cube.values('cio')
+                                  if not r['value'].isdigit() and len(r['value']) > 1}
         
         return jsonify({
             'operative_intelligence': operative_intelligence
@@ -950,22 +698,18 @@ def api_cio_metrics():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/tanium_coverage')
+@cache.cached
 def api_tanium_coverage():
     try:
-        conn = get_db_connection()
+        cube = coverage_cube()
         
-        tanium_count = conn.execute("""
-            SELECT COUNT(*) 
-            FROM universal_cmdb 
-            WHERE LOWER(COALESCE(tanium_coverage, '')) LIKE '%tanium%'
-        """).fetchone()[0]
+        totals = cube.total()
+        tanium_count = totals['tanium']
         
-        total_count = conn.execute("SELECT COUNT(*) FROM universal_cmdb").fetchone()[0]
+        total_count = totals['rows']
         
         coverage_percentage = (tanium_count / total_count * 100) if total_count > 0 else 0
         
-        conn.close()
-        
         return jsonify({
             'tanium_deployed': tanium_count,
             'total_assets': total_count,
@@ -976,22 +720,18 @@ def api_tanium_coverage():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/cmdb_presence')
+@cache.cached
 def api_cmdb_presence():
     try:
-        conn = get_db_connection()
+        cube = coverage_cube()
         
-        yes_count = conn.execute("""
-            SELECT COUNT(*) 
-            FROM universal_cmdb 
-            WHERE LOWER(COALESCE(present_in_cmdb, '')) LIKE '%yes%'
-        """).fetchone()[0]
+        totals = cube.total()
+        yes_count = totals['cmdb']
         
-        total_count = conn.execute("SELECT COUNT(*) FROM universal_cmdb").fetchone()[0]
+        total_count = totals['rows']
         
         registration_rate = (yes_count / total_count * 100) if total_count > 0 else 0
         
-        conn.close()
-        
         return jsonify({
             'cmdb_registered': yes_count,
             'total_assets': total_count,
@@ -1001,35 +741,83 @@ def api_cmdb_presence():
         logger.error(f"CMDB presence error: {e}")
         return jsonify({'error': str(e)}), 500
 
+def analytics_segments(conn):
+    """Per (region, infrastructure_type) and per-region measures from one grouped scan.
+
+    Business-unit diversity counts individual units from the parsed value
+    lists when host_coverage has them; the raw column would count each
+    "a | b" combination as a unit of its own.
+    """
+    source = coverage_source(conn)
+    if has_value_lists(conn, source):
+        bu_diversity = f"len(list_distinct(flatten(array_agg(DISTINCT {values_column('business_unit')}))))"
+    else:
+        bu_diversity = "COUNT(DISTINCT business_unit)"
+    rows = conn.execute(f"""
+        SELECT
+            GROUPING(infrastructure_type) AS region_total,
+            COALESCE(CAST(region AS VARCHAR), 'unknown') AS region,
+            COALESCE(CAST(infrastructure_type AS VARCHAR), 'unknown') AS infrastructure_type,
+            COUNT(*) AS assets,
+            COUNT_IF(cmdb) AS cmdb_count,
+            COUNT_IF(tanium) AS tanium_count,
+            {bu_diversity} AS business_unit_diversity,
+            COUNT(DISTINCT data_center) AS datacenter_diversity
+        FROM {source}
+        GROUP BY GROUPING SETS ((region, infrastructure_type), (region))
+        ORDER BY assets DESC, region, infrastructure_type
+    """).fetchall()
+    segments, regions = [], []
+    for region_total, *values in rows:
+        (regions if region_total else segments).append(values)
+    return segments, regions
+
+def coverage_scores(assets, cmdb_count, tanium_count):
+    cmdb_coverage = (cmdb_count / assets * 100) if assets > 0 else 0
+    tanium_coverage = (tanium_count / assets * 100) if assets > 0 else 0
+    return cmdb_coverage, tanium_coverage, (cmdb_coverage + tanium_coverage) / 2
+
 @app.route('/api/advanced_analytics')
+@cache.cached
 def api_advanced_analytics():
+    """Region x infrastructure type correlation and per-region rollups.
+
+    ?top (20) correlation segments and ?top_regions (10) regions, largest
+    first. A security score (mean of CMDB and Tanium coverage) at or above
+    ?low_risk (75) is LOW, at or above ?medium_risk (50) MEDIUM, else HIGH;
+    HIGH segments with more than ?min_assets (10) assets are listed as
+    high-risk combinations.
+    """
     try:
-        conn = get_db_connection()
-        
-        # Get correlation analysis
-        result = conn.execute("""
-            SELECT 
-                COALESCE(region, 'unknown') as region,
-                COALESCE(infrastructure_type, 'unknown') as infrastructure_type,
-                SUM(CASE WHEN LOWER(COALESCE(present_in_cmdb, '')) LIKE '%yes%' THEN 1 ELSE 0 END) as cmdb_count,
-                SUM(CASE WHEN LOWER(COALESCE(tanium_coverage, '')) LIKE '%tanium%' THEN 1 ELSE 0 END) as tanium_count,
-                COUNT(*) as total_count
-            FROM universal_cmdb
-            GROUP BY region, infrastructure_type
-            ORDER BY total_count DESC
-            LIMIT 20
-        """).fetchall()
-        
+        try:
+            top = min(max(int(request.args.get('top', 20)), 1), 500)
+            top_regions = min(max(int(request.args.get('top_regions', 10)), 1), 100)
+            low_risk = float(request.args.get('low_risk', 75))
+            medium_risk = float(request.args.get('medium_risk', 50))
+            min_assets = max(int(request.args.get('min_assets', 10)), 0)
+        except ValueError:
+            return jsonify({'error': 'top, top_regions and min_assets must be integers, low_risk and medium_risk numbers'}), 400
+        if medium_risk > low_risk:
+            return jsonify({'error': 'medium_risk must not exceed low_risk'}), 400
+
+        def risk_category(score):
+            return 'LOW' if score >= low_risk else 'MEDIUM' if score >= medium_risk else 'HIGH'
+
+        # Thresholds and top-N only shape the output, so the scan runs once per data version
+        segments, regions = db.generation_cached('analytics_segments', analytics_segments)
+
         correlation_analysis = []
         high_risk_combinations = []
-        
-        for row in result:
-            region, infra_type, cmdb_count, tanium_count, total = row
-            
-            cmdb_coverage = (cmdb_count / total * 100) if total > 0 else 0
-            tanium_coverage = (tanium_count / total * 100) if total > 0 else 0
-            security_score = (cmdb_coverage + tanium_coverage) / 2
-            
+        high_risk_segments = Counter()
+
+        for region, infra_type, total, cmdb_count, tanium_count, bu_diversity, dc_diversity in segments:
+            cmdb_coverage, tanium_coverage, security_score = coverage_scores(total, cmdb_count, tanium_count)
+            category = risk_category(security_score)
+            if category == 'HIGH' and total > min_assets:
+                high_risk_segments[region] += 1
+            if len(correlation_analysis) >= top:
+                continue
+
             analysis_entry = {
                 'region': region,
                 'infrastructure_type': infra_type,
@@ -1037,116 +825,150 @@ def api_advanced_analytics():
                 'tanium_coverage': round(tanium_coverage, 2),
                 'security_score': round(security_score, 2),
                 'asset_count': total,
-                'business_unit_diversity': 1,  # Simplified
-                'datacenter_diversity': 1,     # Simplified
-                'risk_category': 'LOW' if security_score >= 75 else 'MEDIUM' if security_score >= 50 else 'HIGH'
+                'business_unit_diversity': bu_diversity,
+                'datacenter_diversity': dc_diversity,
+                'risk_category': category
             }
-            
             correlation_analysis.append(analysis_entry)
-            
-            if security_score < 50 and total > 10:
+            if category == 'HIGH' and total > min_assets:
                 high_risk_combinations.append(analysis_entry)
-        
-        # Trend analysis by region
+
         trend_analysis = {}
-        regions = conn.execute("""
-            SELECT DISTINCT COALESCE(region, 'unknown') as region
-            FROM universal_cmdb
-            LIMIT 10
-        """).fetchall()
-        
-        for (region,) in regions:
-            if region != 'unknown':
-                region_stats = conn.execute("""
-                    SELECT 
-                        COUNT(*) as total_assets,
-                        SUM(CASE WHEN LOWER(COALESCE(tanium_coverage, '')) LIKE '%tanium%' THEN 1 ELSE 0 END) as tanium_count
-                    FROM universal_cmdb
-                    WHERE region = ?
-                """, [region]).fetchone()
-                
-                total_assets, tanium_count = region_stats
-                avg_security_score = (tanium_count / total_assets * 100) if total_assets > 0 else 0
-                
-                trend_analysis[region] = {
-                    'total_assets': total_assets,
-                    'avg_security_score': round(avg_security_score, 2),
-                    'high_risk_segments': 1 if avg_security_score < 50 else 0
-                }
-        
-        conn.close()
-        
+        for region, _, total, cmdb_count, tanium_count, bu_diversity, dc_diversity in regions:
+            if region == 'unknown':
+                continue
+            if len(trend_analysis) >= top_regions:
+                break
+            cmdb_coverage, tanium_coverage, security_score = coverage_scores(total, cmdb_count, tanium_count)
+            trend_analysis[region] = {
+                'total_assets': total,
+                'cmdb_coverage': round(cmdb_coverage, 2),
+                'tanium_coverage': round(tanium_coverage, 2),
+                'avg_security_score': round(security_score, 2),
+                'business_unit_diversity': bu_diversity,
+                'datacenter_diversity': dc_diversity,
+                'high_risk_segments': high_risk_segments[region]
+            }
+
         return jsonify({
             'correlation_analysis': correlation_analysis,
             'high_risk_combinations': high_risk_combinations,
-            'trend_analysis': trend_analysis
+            'trend_analysis': trend_analysis,
+            'parameters': {'top': top, 'top_regions': top_regions, 'low_risk': low_risk,
+                           'medium_risk': medium_risk, 'min_assets': min_assets}
         })
     except Exception as e:
         logger.error(f"Advanced analytics error: {e}")
         return jsonify({'error': str(e)}), 500
 
+def parse_date_arg(name):
+    value = request.args.get(name)
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+
+@app.route('/api/trends')
+@cache.cached
+def api_trends():
+    """Coverage over time from the per-ingest coverage_history snapshots.
+
+    ?interval=day|week|month keeps the last snapshot of each period;
+    ?dimension=region|business_unit|infrastructure_type splits into one
+    series per value (the `top` largest); those same names as parameters
+    filter, e.g. ?dimension=infrastructure_type&region=EMEA. Regions are the
+    normalized buckets. `since`/`until` are inclusive ISO dates.
+    """
+    try:
+        interval = request.args.get('interval', 'day')
+        if interval not in INTERVALS:
+            return jsonify({'error': f"interval must be one of {', '.join(INTERVALS)}"}), 400
+        dimension = request.args.get('dimension') or None
+        if dimension is not None and dimension not in HISTORY_DIMENSIONS:
+            return jsonify({'error': f"dimension must be one of {', '.join(HISTORY_DIMENSIONS)}"}), 400
+        filters = {dim: request.args[dim] for dim in HISTORY_DIMENSIONS if request.args.get(dim)}
+        if dimension in filters:
+            return jsonify({'error': f"{dimension} cannot be both the dimension and a filter"}), 400
+        try:
+            top = min(max(int(request.args.get('top', 10)), 1), 100)
+            since, until = parse_date_arg('since'), parse_date_arg('until')
+        except ValueError:
+            return jsonify({'error': 'top must be an integer and since/until dates as YYYY-MM-DD'}), 400
+
+        conn = get_db_connection()
+        return jsonify(trend_series(conn, interval, dimension, filters, since, until, top))
+    except Exception as e:
+        logger.error(f"Trends error: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/host_search')
+@cache.cached
 def api_host_search():
     try:
         search_term = request.args.get('q', '')
         if not search_term:
             return jsonify({'error': 'Search term required'}), 400
-            
+
+        mode = request.args.get('mode', 'auto')
+        if mode not in SEARCH_MODES:
+            return jsonify({'error': f"mode must be one of {', '.join(SEARCH_MODES)}"}), 400
+        try:
+            limit = min(max(int(request.args.get('limit', 100)), 1), 500)
+            offset = max(int(request.args.get('offset', 0)), 0)
+        except ValueError:
+            return jsonify({'error': 'limit and offset must be integers'}), 400
+
         conn = get_db_connection()
-        
-        result = conn.execute("""
-            SELECT 
-                COALESCE(host, 'unknown') as host,
-                COALESCE(region, 'unknown') as region,
-                COALESCE(country, 'unknown') as country,
-                COALESCE(infrastructure_type, 'unknown') as infrastructure_type,
-                COALESCE(present_in_cmdb, 'unknown') as present_in_cmdb,
-                COALESCE(tanium_coverage, 'unknown') as tanium_coverage
-            FROM universal_cmdb 
-            WHERE LOWER(COALESCE(host, '')) LIKE LOWER(?) 
-            OR LOWER(COALESCE(source_tables, '')) LIKE LOWER(?)
-            ORDER BY host 
-            LIMIT 100
-        """, [f'%{search_term}%', f'%{search_term}%']).fetchall()
-        
-        hosts = []
-        for row in result:
-            hosts.append({
-                'host': row[0],
-                'region': row[1],
-                'country': row[2],
-                'infrastructure_type': row[3],
-                'present_in_cmdb': row[4],
-                'tanium_coverage': row[5]
-            })
-        
-        conn.close()
-        
+        index = db.generation_cached('host_search_index', HostSearchIndex.load)
+
+        if index is not None:
+            hosts, total_found = index.search(conn, search_term, mode, limit, offset)
+        else:
+            result = conn.execute("""
+                SELECT 
+                    COALESCE(host, 'unknown') as host,
+                    COALESCE(region, 'unknown') as region,
+                    COALESCE(country, 'unknown') as country,
+                    COALESCE(infrastructure_type, 'unknown') as infrastructure_type,
+                    COALESCE(present_in_cmdb, 'unknown') as present_in_cmdb,
+                    COALESCE(tanium_coverage, 'unknown') as tanium_coverage,
+                    COUNT(*) OVER () as total_found
+                FROM universal_cmdb 
+                WHERE contains(LOWER(COALESCE(host, '')), LOWER(?))
+                OR contains(LOWER(COALESCE(source_tables, '')), LOWER(?))
+                ORDER BY host 
+                LIMIT ? OFFSET ?
+            """, [search_term, search_term, limit, offset]).fetchall()
+
+            hosts = []
+            for row in result:
+                hosts.append({
+                    'host': row[0],
+                    'region': row[1],
+                    'country': row[2],
+                    'infrastructure_type': row[3],
+                    'present_in_cmdb': row[4],
+                    'tanium_coverage': row[5]
+                })
+            total_found = result[0][6] if result else 0
+
         return jsonify({
             'hosts': hosts,
-            'total_found': len(hosts),
-            'search_term': search_term
+            'total_found': total_found,
+            'search_term': search_term,
+            'mode': mode,
+            'limit': limit,
+            'offset': offset
         })
     except Exception as e:
         logger.error(f"Host search error: {e}")
         return jsonify({'error': str(e)}), 500
     
 @app.route('/api/logging_compliance/breakdown')
+@cache.cached
 def logging_compliance_breakdown():
     try:
-        conn = get_db_connection()
+        cube = coverage_cube()
         
-        result = conn.execute("""
-            SELECT 
-                COUNT(DISTINCT host) as total_assets,
-                SUM(CASE WHEN LOWER(logging_in_splunk) LIKE '%yes%' OR LOWER(logging_in_splunk) LIKE '%splunk%' THEN 1 ELSE 0 END) as splunk_yes,
-                SUM(CASE WHEN LOWER(logging_in_gso) LIKE '%yes%' OR LOWER(logging_in_gso) LIKE '%gso%' THEN 1 ELSE 0 END) as gso_yes,
-                SUM(CASE WHEN (LOWER(logging_in_splunk) LIKE '%yes%' OR LOWER(logging_in_splunk) LIKE '%splunk%') 
-                         AND (LOWER(logging_in_gso) LIKE '%yes%' OR LOWER(logging_in_gso) LIKE '%gso%') THEN 1 ELSE 0 END) as both_yes,
-                SUM(CASE WHEN (LOWER(logging_in_splunk) NOT LIKE '%yes%' AND LOWER(logging_in_splunk) NOT LIKE '%splunk%')
-                         AND (LOWER(logging_in_gso) NOT LIKE '%yes%' AND LOWER(logging_in_gso) NOT LIKE '%gso%') THEN 1 ELSE 0 END) as neither
-            FROM universal_cmdb
-        """).fetchone()
+        totals = cube.total()
+        result = (totals['hosts'], totals['splunk'], totals['gso'], totals['splunk_and_gso'], totals['no_logging'])
         
         total, splunk_yes, gso_yes, both_yes, neither = result
         
@@ -1157,24 +979,15 @@ def logging_compliance_breakdown():
             'no_logging': neither
         }
         
-        compliance_by_region = conn.execute("""
-            SELECT 
-                COALESCE(region, 'Unknown') as region,
-                COUNT(DISTINCT host) as total,
-                SUM(CASE WHEN LOWER(logging_in_splunk) LIKE '%yes%' OR LOWER(logging_in_splunk) LIKE '%splunk%' THEN 1 ELSE 0 END) as splunk,
-                SUM(CASE WHEN LOWER(logging_in_gso) LIKE '%yes%' OR LOWER(logging_in_gso) LIKE '%gso%' THEN 1 ELSE 0 END) as gso
-            FROM universal_cmdb
-            GROUP BY region
-            ORDER BY total DESC
-        """).fetchall()
+        compliance_by_region = [(r['region_group'], r['hosts'], r['splunk'], r['gso'])
+                                for r in cube.rows('region_group')]
         
         regional_aggregates = defaultdict(lambda: {'total': 0, 'splunk': 0, 'gso': 0})
         
         for region, reg_total, reg_splunk, reg_gso in compliance_by_region:
-            normalized = normalize_region(region)
-            regional_aggregates[normalized]['total'] += reg_total
-            regional_aggregates[normalized]['splunk'] += reg_splunk
-            regional_aggregates[normalized]['gso'] += reg_gso
+            regional_aggregates[region]['total'] += reg_total
+            regional_aggregates[region]['splunk'] += reg_splunk
+            regional_aggregates[region]['gso'] += reg_gso
         
         regional_compliance = []
         for region, data in regional_aggregates.items():
@@ -1189,8 +1002,6 @@ def logging_compliance_breakdown():
         
         regional_compliance.sort(key=lambda x: x['total_assets'], reverse=True)
         
-        conn.close()
-        
         overall_compliance = round(((splunk_yes + gso_yes - both_yes) / total * 100) if total > 0 else 0, 2)
         
         return jsonify({
@@ -1213,62 +1024,50 @@ def logging_compliance_breakdown():
 
 # FIXED: Only one domain_visibility_breakdown function now
 @app.route('/api/domain_visibility/breakdown')
+@cache.cached
 def domain_visibility_breakdown():
     try:
         conn = get_db_connection()
-        
-        result = conn.execute("""
+        source = coverage_source(conn)
+        
+        # Per host, count the '|'-separated domain tokens naming 1dc, and those naming
+        # fead but not 1dc (a token is classified 1dc first, as before). Everything is
+        # folded into counters in one streaming pass; no host list is materialized.
+        result = conn.execute(f"""
+            WITH domain_hits AS (
+                SELECT 
+                    cmdb, tanium, splunk,
+                    COALESCE(len(regexp_extract_all(LOWER(domain), '[^|]*1dc[^|]*')), 0) as hits_1dc,
+                    COALESCE(len(regexp_extract_all(LOWER(domain), '[^|]*fead[^|]*')), 0)
+                        - COALESCE(len(regexp_extract_all(LOWER(domain), '[^|]*(?:1dc[^|]*fead|fead[^|]*1dc)[^|]*')), 0) as hits_fead
+                FROM {source}
+            )
             SELECT 
-                COALESCE(host, 'unknown') as host,
-                COALESCE(domain, '') as domain,
-                LOWER(present_in_cmdb) LIKE '%yes%' as in_cmdb,
-                LOWER(tanium_coverage) LIKE '%tanium%' as has_tanium,
-                LOWER(logging_in_splunk) LIKE '%yes%' OR LOWER(logging_in_splunk) LIKE '%splunk%' as has_splunk
-            FROM universal_cmdb
-        """).fetchall()
-        
-        domain_stats = {'1dc': 0, 'fead': 0, 'both': 0, 'other': 0}
-        domain_visibility = defaultdict(lambda: {'total': 0, 'cmdb': 0, 'tanium': 0, 'splunk': 0})
-        host_domain_map = {}
-        
-        for host, domain_str, in_cmdb, has_tanium, has_splunk in result:
-            domains = parse_pipe_separated(domain_str)
-            has_1dc = False
-            has_fead = False
-            
-            for domain in domains:
-                domain_lower = domain.lower()
-                if '1dc' in domain_lower:
-                    has_1dc = True
-                    domain_visibility['1dc']['total'] += 1
-                    if in_cmdb:
-                        domain_visibility['1dc']['cmdb'] += 1
-                    if has_tanium:
-                        domain_visibility['1dc']['tanium'] += 1
-                    if has_splunk:
-                        domain_visibility['1dc']['splunk'] += 1
-                elif 'fead' in domain_lower:
-                    has_fead = True
-                    domain_visibility['fead']['total'] += 1
-                    if in_cmdb:
-                        domain_visibility['fead']['cmdb'] += 1
-                    if has_tanium:
-                        domain_visibility['fead']['tanium'] += 1
-                    if has_splunk:
-                        domain_visibility['fead']['splunk'] += 1
-            
-            if has_1dc and has_fead:
-                domain_stats['both'] += 1
-            elif has_1dc:
-                domain_stats['1dc'] += 1
-            elif has_fead:
-                domain_stats['fead'] += 1
-            else:
-                domain_stats['other'] += 1
-            
-            host_domain_map[host] = {'1dc': has_1dc, 'fead': has_fead}
+                COUNT(*) as total_hosts,
+                COUNT_IF(hits_1dc > 0 AND hits_fead = 0) as only_1dc,
+                COUNT_IF(hits_fead > 0 AND hits_1dc = 0) as only_fead,
+                COUNT_IF(hits_1dc > 0 AND hits_fead > 0) as both_domains,
+                COUNT_IF(hits_1dc = 0 AND hits_fead = 0) as other,
+                COALESCE(SUM(hits_1dc), 0) as total_1dc,
+                COALESCE(SUM(hits_1dc) FILTER (WHERE cmdb), 0) as cmdb_1dc,
+                COALESCE(SUM(hits_1dc) FILTER (WHERE tanium), 0) as tanium_1dc,
+                COALESCE(SUM(hits_1dc) FILTER (WHERE splunk), 0) as splunk_1dc,
+                COALESCE(SUM(hits_fead), 0) as total_fead,
+                COALESCE(SUM(hits_fead) FILTER (WHERE cmdb), 0) as cmdb_fead,
+                COALESCE(SUM(hits_fead) FILTER (WHERE tanium), 0) as tanium_fead,
+                COALESCE(SUM(hits_fead) FILTER (WHERE splunk), 0) as splunk_fead
+            FROM domain_hits
+        """).fetchone()
         
-        total_hosts = len(host_domain_map)
+        (total_hosts, only_1dc, only_fead, both_domains, other,
+         total_1dc, cmdb_1dc, tanium_1dc, splunk_1dc,
+         total_fead, cmdb_fead, tanium_fead, splunk_fead) = result
+        
+        domain_stats = {'1dc': only_1dc, 'fead': only_fead, 'both': both_domains, 'other': other}
+        domain_visibility = {
+            '1dc': {'total': total_1dc, 'cmdb': cmdb_1dc, 'tanium': tanium_1dc, 'splunk': splunk_1dc},
+            'fead': {'total': total_fead, 'cmdb': cmdb_fead, 'tanium': tanium_fead, 'splunk': splunk_fead}
+        }
         
         domain_distribution = {
             '1dc_only': domain_stats['1dc'],
@@ -1287,8 +1086,6 @@ def domain_visibility_breakdown():
                     'splunk_coverage': round((stats['splunk'] / stats['total'] * 100), 2)
                 }
         
-        conn.close()
-        
         return jsonify({
             'total_hosts': total_hosts,
             'domain_distribution': domain_distribution,
@@ -1307,13 +1104,96 @@ def domain_visibility_breakdown():
         logger.error(f"Domain visibility breakdown error: {e}")
         return jsonify({'error': str(e)}), 500
 
+BATCH_MAX_REPORTS = 25
+BATCH_EXCLUDED = {'/api/batch', '/api/_debug/profile'}
+
+def parse_batch_reports():
+    """[(key, path, params)] from ?report=name[?args] (GET) or {"reports": [...]} (POST)"""
+    if request.method == 'POST':
+        body = request.get_json(silent=True) or {}
+        items = body.get('reports', [])
+        if not isinstance(items, list):
+            raise ValueError('reports must be a list')
+        reports = []
+        for item in items:
+            if isinstance(item, str):
+                item = {'name': item}
+            if not isinstance(item, dict) or not item.get('name'):
+                raise ValueError('each report needs a name')
+            params = item.get('params') or {}
+            if not isinstance(params, dict):
+                raise ValueError('params must be an object')
+            name = item['name'].strip('/')
+            reports.append((item.get('id') or name, name, {k: str(v) for k, v in params.items()}))
+    else:
+        reports = []
+        for spec in request.args.getlist('report'):
+            name, _, query = spec.partition('?')
+            params = dict(parse_qsl(query, keep_blank_values=True))
+            reports.append((spec, name.strip('/'), params))
+    if not reports:
+        raise ValueError('at least one report is required')
+    if len(reports) > BATCH_MAX_REPORTS:
+        raise ValueError(f"at most {BATCH_MAX_REPORTS} reports per batch")
+    return reports
+
+def run_report(path, params):
+    """(status, payload) of one GET /api/<path> view, run in a nested request context.
+
+    The view goes through its own response cache, and the coverage cube and
+    other per-generation intermediates are shared with every other report.
+    """
+    path = path if path.startswith('/api/') else f"/api/{path}"
+    if path in BATCH_EXCLUDED:
+        return 400, {'error': f"{path} cannot be batched"}
+    try:
+        endpoint, view_args = app.url_map.bind('').match(path, method='GET')
+    except HTTPException as e:
+        return e.code, {'error': f"unknown report {path}"}
+    with app.test_request_context(path, query_string=urlencode(params)):
+        response = app.make_response(app.view_functions[endpoint](**view_args))
+        return response.status_code, response.get_json(silent=True)
+
+def batch_payload(reports):
+    results = db.run_concurrently([
+        lambda cursor, path=path, params=params: run_report(path, params)
+        for _, path, params in reports
+    ])
+    payload = {}
+    for (key, _, _), (status, data) in zip(reports, results):
+        payload[key] = {'status': status, 'data': data}
+    return {
+        'reports': payload,
+        'errors': sum(1 for entry in payload.values() if entry['status'] != 200),
+        'data_version': data_version()
+    }
+
+@cache.cached
+def cached_batch(reports):
+    return jsonify(batch_payload(reports))
+
+@app.route('/api/batch', methods=['GET', 'POST'])
+def api_batch():
+    """Several reports in one round trip: GET ?report=a&report=b?arg=1, or POST {"reports": [...]}"""
+    try:
+        reports = parse_batch_reports()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        if request.method == 'GET':
+            # GET batches are keyed by their query string like any other polled route
+            return cached_batch(reports)
+        return jsonify(batch_payload(reports))
+    except Exception as e:
+        logger.error(f"Batch error: {e}")
+        return jsonify({'error': str(e)}), 500
+
 if __name__ == '__main__':
     try:
         conn = get_db_connection()
         result = conn.execute("SELECT COUNT(*) FROM universal_cmdb").fetchone()
-        conn.close()
-        print(f"Database connected! Found {result[0]} records.")
-        print("Starting Flask server on http://localhost:5000")
+        print(f"Database connected ({db.source})! Found {result[0]} records.")
+        print("Starting Flask development server on http://localhost:5000 (production: python src/wsgi.py)")
     except Exception as e:
         print(f"Database connection failed: {e}")
     
@@ -0,0 +1,196 @@
+import base64
+import json
+import os
+import re
+from datetime import datetime, timezone
+from types import SimpleNamespace
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.ipc
+# Same rules as the scalar functions in normalization, applied to whole columns
+from normalization import UNDEFINED, INVALID_MARKERS, REGION_ALIASES, COUNTRY_ALIASES
+
+SPLUNK_LOG_TABLE = 'prj-fisv-p-gcss-sas-dl9dd0f1df.SAS_BI.V_SPL_ENDPOINT_LOG'
+
+def _is_text(arr):
+    return pa.types.is_string(arr.type) or pa.types.is_large_string(arr.type)
+
+def _fill_false(mask):
+    return pc.fill_null(mask, False)
+
+def valid_values(arr):
+    """(stripped strings, validity mask) mirroring is_valid_value followed by str(value).strip()"""
+    if _is_text(arr):
+        stripped = pc.utf8_trim_whitespace(arr)
+        mask = pc.and_(pc.not_equal(stripped, ''), pc.not_equal(stripped, UNDEFINED))
+        mask = pc.and_(mask, pc.invert(pc.is_in(pc.utf8_lower(stripped), value_set=pa.array(INVALID_MARKERS))))
+        return stripped, _fill_false(mask)
+
+    if pa.types.is_null(arr.type):
+        return pa.nulls(len(arr), pa.string()), pa.array([False] * len(arr))
+
+    # Non-strings are valid when truthy, like the scalar check
+    if pa.types.is_boolean(arr.type):
+        mask = arr
+    elif pa.types.is_integer(arr.type) or pa.types.is_floating(arr.type):
+        mask = pc.not_equal(arr, 0)
+    else:
+        mask = pc.is_valid(arr)
+    return pc.utf8_trim_whitespace(pc.cast(arr, pa.string())), _fill_false(mask)
+
+def normalize_hostnames(arr):
+    """(normalized host keys, validity mask) for a column of raw hostnames"""
+    if not _is_text(arr):
+        # normalize_hostname() rejects anything that is not a string
+        return pa.nulls(len(arr), pa.string()), pa.array([False] * len(arr))
+    stripped, mask = valid_values(arr)
+    hosts = pc.utf8_lower(stripped)
+    hosts = pc.replace_substring_regex(hosts, r'(?s)\..*', '')
+    hosts = pc.replace_substring_regex(hosts, r'[^a-z0-9]', '')
+    mask = _fill_false(pc.and_(mask, pc.greater(pc.utf8_length(hosts), 1)))
+    return hosts, mask
+
+def _map_aliases(values, aliases):
+    keys = pa.array(list(aliases))
+    index = pc.index_in(values, value_set=keys)
+    mapped = pc.take(pa.array(list(aliases.values())), index)
+    return pc.coalesce(mapped, values)
+
+def normalize_attribute(arr, attr_type, table_name):
+    """(normalized values, validity mask) for one attribute column"""
+    values, mask = valid_values(arr)
+    values = pc.utf8_lower(values)
+    if attr_type == 'region':
+        values = _map_aliases(values, REGION_ALIASES)
+    elif attr_type == 'country':
+        values = _map_aliases(values, COUNTRY_ALIASES)
+    elif attr_type == 'logging_in_splunk' and table_name == SPLUNK_LOG_TABLE:
+        values = pa.array(['yes'] * len(arr), pa.string())
+    return values, mask
+
+def normalize_batch(batch, table_name, attribute_types, columns, special_column=None):
+    """Turn one fetched record batch into staging rows: host, table_name, *columns.
+
+    Column 0 of the batch is the hostname column, the rest line up with
+    attribute_types. When a table maps several columns to one attribute the
+    last valid value wins, as it did when the row dict was built in order.
+    Rows without a usable hostname are dropped.
+    """
+    n = batch.num_rows
+    hosts, host_mask = normalize_hostnames(batch.column(0))
+
+    merged = {}
+    if special_column:
+        merged[special_column] = pa.array(['yes'] * n, pa.string())
+
+    for i, attr_type in enumerate(attribute_types, 1):
+        if i >= batch.num_columns or attr_type not in columns:
+            continue
+        values, mask = normalize_attribute(batch.column(i), attr_type, table_name)
+        previous = merged.get(attr_type, pa.nulls(n, pa.string()))
+        merged[attr_type] = pc.if_else(mask, values, previous)
+
+    arrays = [hosts, pa.array([table_name] * n, pa.string())]
+    arrays += [merged.get(col, pa.nulls(n, pa.string())) for col in columns]
+    table = pa.Table.from_arrays(arrays, names=['host', 'table_name'] + list(columns))
+    return table.filter(host_mask)
+
+def string_max(arr):
+    """Largest value of a column compared as text, like the incremental WHERE does"""
+    return pc.max(pc.cast(arr, pa.string())).as_py()
+
+def with_sequence(table, start):
+    """Prepend the staging seq column (arrival order) starting at `start`"""
+    return table.add_column(0, 'seq', pa.array(range(start, start + table.num_rows), pa.int64()))
+
+class ArrowReplayJob:
+    """Stand-in for a QueryJob whose result is read back from a local Arrow IPC file"""
+
+    def __init__(self, path, columns, since=None, job_id=None, start_index=0):
+        self.path = path
+        self.columns = columns
+        self.since = since
+        self.job_id = job_id
+        self.start_index = start_index
+
+    def result(self, start_index=None, **kwargs):
+        if start_index:
+            return ArrowReplayJob(self.path, self.columns, self.since, self.job_id, start_index)
+        return self
+
+    def _read(self):
+        with pa.memory_map(self.path) as source:
+            try:
+                reader = pa.ipc.open_file(source)
+                batches = [reader.get_batch(i) for i in range(reader.num_record_batches)]
+            except pa.ArrowInvalid:
+                source.seek(0)
+                batches = list(pa.ipc.open_stream(source))
+        skip = self.start_index
+        for batch in batches:
+            if self.since:
+                column, value = self.since
+                batch = batch.filter(_fill_false(pc.greater(pc.cast(batch.column(column), pa.string()), value)))
+            if skip:
+                dropped = min(skip, batch.num_rows)
+                batch = batch.slice(dropped)
+                skip -= dropped
+                if not batch.num_rows:
+                    continue
+            yield batch.select(self.columns) if self.columns else batch
+
+    def to_arrow_iterable(self, bqstorage_client=None, max_queue_size=None):
+        return self._read()
+
+    def __iter__(self):
+        for batch in self._read():
+            columns = [column.to_pylist() for column in batch.columns]
+            yield from zip(*columns)
+
+class ArrowReplayClient:
+    """Offline BigQuery client: `query()` replays <directory>/<table>.arrow.
+
+    Only the backticked SELECT list, the FROM table and an incremental
+    watermark predicate of the generated query are honoured; the other rows
+    the WHERE clause would drop are rejected by normalization anyway. Handy
+    for tests and for re-running an ingest from captured data.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def query(self, sql):
+        select, _, rest = sql.partition('FROM')
+        columns = re.findall(r'`([^`]+)`', select)
+        table = re.search(r'`([^`]+)`', rest).group(1)
+        path = os.path.join(self.directory, f"{table}.arrow")
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No replay file for {table}: {path}")
+        since = re.search(r"CAST\(`([^`]+)` AS STRING\) > '((?:[^'\\]|\\.)*)'", rest)
+        if since:
+            since = (since.group(1), re.sub(r"\\(.)", r"\1", since.group(2)))
+        # The job id encodes the query so get_job() works across processes, like a real job id
+        job_id = base64.urlsafe_b64encode(json.dumps([table, columns, since]).encode()).decode()
+        return ArrowReplayJob(path, columns, since, job_id)
+
+    def get_job(self, job_id):
+        table, columns, since = json.loads(base64.urlsafe_b64decode(job_id.encode()))
+        return ArrowReplayJob(os.path.join(self.directory, f"{table}.arrow"), columns,
+                              tuple(since) if since else None, job_id)
+
+    def get_table(self, table_name):
+        """Table metadata as bigquery.Table exposes it: the file's mtime and row count"""
+        path = os.path.join(self.directory, f"{table_name}.arrow")
+        with pa.memory_map(path) as source:
+            num_rows = pa.ipc.open_file(source).read_all().num_rows
+        modified = datetime.fromtimestamp(os.stat(path).st_mtime, tz=timezone.utc)
+        return SimpleNamespace(table_type='TABLE', modified=modified, num_rows=num_rows)
+
+def write_replay_file(directory, table_name, table):
+    """Capture a pyarrow Table as <directory>/<table_name>.arrow for ArrowReplayClient"""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{table_name}.arrow")
+    with pa.OSFile(path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    return path
@@ -0,0 +1,13 @@
+"""ASGI entry point, for uvicorn/hypercorn deployments.
+
+    uvicorn --app-dir src asgi:application --workers 4
+
+DuckDB's Python API is synchronous, so routes stay WSGI views and run in the
+adapter's thread pool; an async view would still occupy a thread per query.
+Concurrency inside a request comes from DatabaseManager.run_concurrently.
+Requires asgiref (pip install asgiref).
+"""
+from asgiref.wsgi import WsgiToAsgi
+from app import app
+
+application = WsgiToAsgi(app)
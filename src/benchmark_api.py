@@ -0,0 +1,384 @@
+"""Load benchmark for the dashboard API.
+
+Generates (or reuses) a dataset with universal_cmdb_generator, serves app.py
+in-process through the Flask test client or a threaded WSGI server, and drives
+every GET /api/* route with concurrent clients. Per route it reports p50/p95/p99
+latency, throughput and the peak RSS seen while the route ran, and writes the
+whole run to JSON so runs on different commits or dataset sizes can be compared.
+
+    python src/benchmark_api.py --rows 1000000 --clients 8 --requests 400 --output bench-1m.json
+    python src/benchmark_api.py --rows 10000000 --baseline bench-1m.json
+
+Dashboards poll with an unchanged query string, so by default repeated requests
+are served by the response cache after the first one; --uncached gives every
+request a distinct query string to measure the route itself.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.client import HTTPConnection
+from urllib.parse import urlencode
+import duckdb
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Routes that need query arguments to do real work
+ROUTE_PARAMS = {
+    '/api/host_search': {'q': 'srv-nyc', 'limit': '100'},
+    '/api/batch': {'report': ['logging_compliance/breakdown', 'security_control/coverage',
+                              'cmdb_presence', 'database_status']},
+}
+SKIP_ROUTES = {'/api/_debug/profile'}
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+def current_rss():
+    """Resident set size in bytes, or None where /proc is not available"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+def max_rss():
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+class RssSampler:
+    """Background thread tracking the peak RSS since the last reset()"""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            rss = current_rss()
+            if rss and rss > self.peak:
+                self.peak = rss
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def reset(self):
+        self.peak = current_rss() or 0
+
+    def read(self):
+        rss = current_rss()
+        if rss is None:
+            return max_rss()
+        return max(self.peak, rss)
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+def table_rows(db_path):
+    try:
+        conn = duckdb.connect(db_path, read_only=True)
+    except Exception:
+        return None
+    try:
+        return conn.execute("SELECT COUNT(*) FROM universal_cmdb").fetchone()[0]
+    except Exception:
+        return None
+    finally:
+        conn.close()
+
+def ensure_dataset(args):
+    """Generate the benchmark database unless one with the requested row count exists"""
+    db_path = os.path.abspath(args.db or f"bench_cmdb_{args.rows}.db")
+    if not args.regenerate and table_rows(db_path) == args.rows:
+        print(f"Reusing {db_path} ({args.rows:,} rows)")
+        return db_path, 0.0
+
+    command = [sys.executable, os.path.join(HERE, 'universal_cmdb_generator.py'),
+               '--rows', str(args.rows), '--db', db_path, '--seed', str(args.seed)]
+    if args.generator == 'columnar':
+        command.append('--columnar')
+    print(f"Generating {args.rows:,} rows into {db_path}")
+    started = time.perf_counter()
+    subprocess.run(command, check=True, cwd=HERE,
+                   stdout=None if args.verbose else subprocess.DEVNULL)
+    return db_path, time.perf_counter() - started
+
+def load_app(db_path):
+    """Import app.py pointed at `db_path`"""
+    os.environ['CMDB_DB_PATH'] = db_path
+    if HERE not in sys.path:
+        sys.path.insert(0, HERE)
+    import logging
+    import app as app_module
+    app_module.db.db_path = db_path
+    # Per-request INFO logging would be measured along with the routes
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    return app_module
+
+def discover_routes(flask_app, only=None):
+    routes = []
+    for rule in flask_app.url_map.iter_rules():
+        path = rule.rule
+        if not path.startswith('/api/') or rule.arguments or 'GET' not in rule.methods:
+            continue
+        if path in SKIP_ROUTES or (only and path not in only):
+            continue
+        routes.append(path)
+    return sorted(routes)
+
+def query_string(path, uncached, n):
+    params = dict(ROUTE_PARAMS.get(path, {}))
+    if uncached:
+        params['_bench'] = str(n)
+    return urlencode(params, doseq=True)
+
+class TestClientTarget:
+    """Requests through the Flask test client; one client per worker thread"""
+    name = 'test-client'
+
+    def __init__(self, flask_app):
+        self.app = flask_app
+        self._local = threading.local()
+
+    def get(self, url):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.get(url)
+        response.get_data()
+        return response.status_code
+
+    def close(self):
+        pass
+
+class WsgiTarget:
+    """Requests over HTTP to a threaded werkzeug server on a background thread"""
+    name = 'wsgi'
+
+    def __init__(self, flask_app):
+        from werkzeug.serving import make_server
+        self.server = make_server('127.0.0.1', 0, flask_app, threaded=True)
+        self.port = self.server.server_port
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        self._local = threading.local()
+
+    def get(self, url):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = HTTPConnection('127.0.0.1', self.port, timeout=300)
+        try:
+            conn.request('GET', url)
+            response = conn.getresponse()
+            response.read()
+        except (OSError, ConnectionError):
+            conn.close()
+            self._local.conn = None
+            raise
+        return response.status
+
+    def close(self):
+        self.server.shutdown()
+
+def percentile(sorted_values, pct):
+    """Linear interpolation between closest ranks"""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * pct / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+def run_route(target, path, args, sampler):
+    counter = itertools.count()
+    counter_lock = threading.Lock()
+
+    def next_url():
+        with counter_lock:
+            n = next(counter)
+        query = query_string(path, args.uncached, n)
+        return f"{path}?{query}" if query else path
+
+    for _ in range(args.warmup):
+        target.get(next_url())
+
+    per_client = [args.requests // args.clients + (i < args.requests % args.clients)
+                  for i in range(args.clients)]
+
+    def client(count):
+        latencies, statuses, errors = [], {}, 0
+        for _ in range(count):
+            url = next_url()
+            started = time.perf_counter()
+            try:
+                status = target.get(url)
+            except Exception:
+                status = 'exception'
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+            if status != 200:
+                errors += 1
+        return latencies, statuses, errors
+
+    sampler.reset()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as executor:
+        results = list(executor.map(client, per_client))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(value for result in results for value in result[0])
+    statuses = {}
+    for _, counts, _ in results:
+        for status, count in counts.items():
+            statuses[str(status)] = statuses.get(str(status), 0) + count
+
+    def ms(value):
+        return round(value * 1000, 3) if value is not None else None
+
+    return {
+        'requests': len(latencies),
+        'errors': sum(result[2] for result in results),
+        'status_codes': statuses,
+        'p50_ms': ms(percentile(latencies, 50)),
+        'p95_ms': ms(percentile(latencies, 95)),
+        'p99_ms': ms(percentile(latencies, 99)),
+        'mean_ms': ms(statistics.fmean(latencies)) if latencies else None,
+        'max_ms': ms(latencies[-1]) if latencies else None,
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed > 0 else None,
+        'peak_rss_mb': round(sampler.read() / 2 ** 20, 1),
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(report, baseline_path, threshold):
+    """Print p95 changes against an earlier report; returns the number of regressions"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    base_meta = baseline.get('meta', {})
+    print(f"\nAgainst {baseline_path} (commit {base_meta.get('commit')}, {base_meta.get('rows', 0):,} rows)")
+    for setting in ('rows', 'server', 'clients', 'uncached'):
+        if base_meta.get(setting) != report['meta'][setting]:
+            print(f"  note: {setting} differs ({base_meta.get(setting)} -> {report['meta'][setting]})")
+    regressions = 0
+    for path, result in report['routes'].items():
+        before = baseline.get('routes', {}).get(path)
+        if not before or not before.get('p95_ms') or result['p95_ms'] is None:
+            continue
+        ratio = result['p95_ms'] / before['p95_ms']
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        print(f"  {path:<45} p95 {before['p95_ms']:9.2f} -> {result['p95_ms']:9.2f} ms  x{ratio:5.2f}{flag}")
+    return regressions
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000, help="dataset size in hosts")
+    parser.add_argument('--db', help="database file (default: bench_cmdb_<rows>.db)")
+    parser.add_argument('--regenerate', action='store_true', help="rebuild the database even if it exists")
+    parser.add_argument('--generator', choices=['columnar', 'classic'], default='columnar')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--server', choices=['test-client', 'wsgi'], default='test-client',
+                        help="in-process Flask test client or a threaded WSGI server over HTTP")
+    parser.add_argument('--clients', type=int, default=8, help="concurrent clients per route")
+    parser.add_argument('--requests', type=int, default=200, help="timed requests per route")
+    parser.add_argument('--warmup', type=int, default=2, help="untimed requests per route before timing")
+    parser.add_argument('--uncached', action='store_true',
+                        help="make every request miss the response cache")
+    parser.add_argument('--routes', help="comma-separated subset of routes")
+    parser.add_argument('--output', help="write the JSON report here (default: stdout only)")
+    parser.add_argument('--baseline', help="earlier JSON report to compare p95 latency against")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="p95 increase counted as a regression with --baseline (0.2 = 20%%)")
+    parser.add_argument('--verbose', action='store_true', help="show generator output")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    args.clients = max(1, args.clients)
+    db_path, generate_seconds = ensure_dataset(args)
+
+    sampler = RssSampler().start()
+    rss_before_app = current_rss()
+    app_module = load_app(db_path)
+    routes = discover_routes(app_module.app, set(args.routes.split(',')) if args.routes else None)
+    target = WsgiTarget(app_module.app) if args.server == 'wsgi' else TestClientTarget(app_module.app)
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'rows': args.rows,
+            'db_path': db_path,
+            'db_size_mb': round(os.path.getsize(db_path) / 2 ** 20, 1),
+            'generate_seconds': round(generate_seconds, 1),
+            'server': target.name,
+            'clients': args.clients,
+            'requests_per_route': args.requests,
+            'warmup': args.warmup,
+            'uncached': args.uncached,
+            'python': platform.python_version(),
+            'duckdb': duckdb.__version__,
+            'cpu_count': os.cpu_count(),
+            'rss_before_app_mb': round((rss_before_app or 0) / 2 ** 20, 1),
+        },
+        'routes': {},
+    }
+
+    print(f"{'route':<45} {'p50':>9} {'p95':>9} {'p99':>9} {'req/s':>9} {'rss MB':>8} errors")
+    started = time.perf_counter()
+    try:
+        for path in routes:
+            result = run_route(target, path, args, sampler)
+            report['routes'][path] = result
+            print(f"{path:<45} {result['p50_ms']:9.2f} {result['p95_ms']:9.2f} {result['p99_ms']:9.2f} "
+                  f"{result['throughput_rps']:9.1f} {result['peak_rss_mb']:8.1f} {result['errors']}")
+    finally:
+        target.close()
+        sampler.stop()
+
+    report['summary'] = {
+        'routes': len(report['routes']),
+        'requests': sum(r['requests'] for r in report['routes'].values()),
+        'errors': sum(r['errors'] for r in report['routes'].values()),
+        'elapsed_seconds': round(time.perf_counter() - started, 2),
+        'peak_rss_mb': round(max_rss() / 2 ** 20, 1),
+    }
+
+    payload = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(payload + '\n')
+        print(f"\nWrote {args.output}")
+    else:
+        print(payload)
+
+    summary = report['summary']
+    print(f"{summary['requests']:,} requests over {summary['routes']} routes in {summary['elapsed_seconds']}s, "
+          f"{summary['errors']} errors, peak RSS {summary['peak_rss_mb']} MB")
+
+    regressions = compare(report, args.baseline, args.threshold) if args.baseline else 0
+    return 1 if summary['errors'] or regressions else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
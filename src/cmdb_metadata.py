@@ -0,0 +1,32 @@
+import duckdb
+import uuid
+from datetime import datetime
+
+METADATA_TABLE = 'cmdb_metadata'
+
+def ensure_metadata_table(conn):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {METADATA_TABLE} (
+            key VARCHAR PRIMARY KEY,
+            value VARCHAR,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+def set_metadata(conn, key, value):
+    ensure_metadata_table(conn)
+    conn.execute(f"INSERT OR REPLACE INTO {METADATA_TABLE} VALUES (?, ?, CURRENT_TIMESTAMP)", [key, str(value)])
+
+def get_metadata(conn, key, default=None):
+    """Read a metadata value; works on read-only databases that predate the table"""
+    try:
+        row = conn.execute(f"SELECT value FROM {METADATA_TABLE} WHERE key = ?", [key]).fetchone()
+    except duckdb.CatalogException:
+        return default
+    return row[0] if row else default
+
+def bump_generation(conn):
+    """Mark the data as changed; API caches and ETags key off this value"""
+    generation = f"{datetime.utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+    set_metadata(conn, 'generation', generation)
+    return generation
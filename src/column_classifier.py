@@ -0,0 +1,194 @@
+import hashlib
+import json
+import os
+import re
+from functools import lru_cache
+from ingest_watermarks import pick_watermark_column
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+CACHE_VERSION = 2
+HASH_CHUNK = 1 << 20
+
+def _trie_regex(node):
+    """Regex for the words in a char trie; greedy, so it prefers the longest word at a position"""
+    branches = [re.escape(char) + _trie_regex(child) for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ''
+    body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+    if '' in node:
+        return f"(?:{body})?" if len(branches) == 1 and len(body) > 1 else f"{body}?"
+    return body
+
+class ColumnClassifier:
+    """identify_column_type() compiled once from the pattern tables.
+
+    Patterns are ranked by target priority (hostname patterns, then the
+    advanced targets in table order). A pattern that contains an equal or
+    better ranked pattern can never decide the result and is dropped; what
+    remains goes into one trie-shaped regex that matches the longest pattern
+    starting at a position, which after pruning is also the best ranked one
+    there. The lowest rank over the matches in the column name (and, for
+    advanced targets, the type label) is the answer the nested substring
+    loops used to reach. Column names repeat heavily across tables, so
+    results are memoized as well.
+    """
+
+    def __init__(self, column_mapping, hostname_patterns, advanced_patterns):
+        self.column_mapping = dict(column_mapping)
+        targets = [('host', list(hostname_patterns))] + list(advanced_patterns.items())
+        self._targets = [target for target, _ in targets]
+        # Hostname patterns are only matched against the column name
+        self._name_scan = self._compile(enumerate(targets))
+        self._type_scan = self._compile(list(enumerate(targets))[1:])
+        self.fingerprint = hashlib.sha256(json.dumps(
+            [self.column_mapping, targets], sort_keys=True).encode()).hexdigest()
+        self._classify = lru_cache(maxsize=1 << 16)(self._classify_uncached)
+
+    @staticmethod
+    def _compile(ranked_targets):
+        """(regex search, pattern -> rank) over the patterns that can decide a result"""
+        ranks = {}
+        for rank, (_, patterns) in ranked_targets:
+            for pattern in patterns:
+                ranks.setdefault(pattern, rank)
+        ranks = {p: r for p, r in ranks.items()
+                 if not any(q != p and q in p and ranks[q] <= r for q in ranks)}
+        trie = {}
+        for pattern in ranks:
+            node = trie
+            for char in pattern:
+                node = node.setdefault(char, {})
+            node[''] = True
+        return re.compile(_trie_regex(trie)).search, ranks
+
+    def _classify_uncached(self, column_name, column_type):
+        column_lower = column_name.lower()
+        type_lower = str(column_type).lower() if column_type else ""
+
+        if isinstance(column_type, str) and type_lower in self.column_mapping:
+            return self.column_mapping[type_lower]
+
+        best = self._best_rank(self._name_scan, column_lower, len(self._targets))
+        if type_lower and best > 1:
+            best = self._best_rank(self._type_scan, type_lower, best)
+        return self._targets[best] if best < len(self._targets) else None
+
+    @staticmethod
+    def _best_rank(scan, text, best):
+        # Restarting one past each hit keeps overlapping patterns visible while
+        # letting the regex engine skip straight to the next candidate position
+        search, ranks = scan
+        match = search(text)
+        while match and best:
+            best = min(best, ranks[match.group()])
+            match = search(text, match.start() + 1)
+        return best
+
+    def classify(self, column_name, column_type):
+        try:
+            return self._classify(column_name, column_type)
+        except TypeError:
+            # Unhashable type labels (dicts/lists) skip the memo
+            return self._classify_uncached(column_name, column_type)
+
+class ColumnDiscovery:
+    """Classified columns of one metadata file: (table, column, mapped type) triples
+    plus the watermark column of each table, so the raw metadata need not stay in memory"""
+
+    def __init__(self, discovered, watermark_columns, table_count):
+        self.discovered = discovered
+        self.watermark_columns = watermark_columns
+        self.table_count = table_count
+
+    def to_json(self):
+        tables = {}
+        for table_name, column_name, mapped_type in self.discovered:
+            tables.setdefault(table_name, []).append([column_name, mapped_type])
+        return {'tables': tables, 'watermark_columns': self.watermark_columns, 'table_count': self.table_count}
+
+    @classmethod
+    def from_json(cls, data):
+        discovered = [(table_name, column_name, mapped_type)
+                      for table_name, columns in data['tables'].items()
+                      for column_name, mapped_type in columns]
+        return cls(discovered, data['watermark_columns'], data['table_count'])
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def iter_metadata_tables(path):
+    """Yield (table_name, {column: type}) from the metadata file's "columns" object.
+
+    With ijson installed tables are parsed one at a time, so memory stays
+    bounded by the largest table rather than the whole file.
+    """
+    if ijson is not None:
+        with open(path, 'rb') as f:
+            yield from ijson.kvitems(f, 'columns', use_float=True)
+        return
+    with open(path, 'r') as f:
+        metadata = json.load(f)
+    yield from metadata.get('columns', {}).items()
+
+def classify_tables(tables, classifier):
+    discovered = []
+    watermark_columns = {}
+    table_count = 0
+    for table_name, columns in tables:
+        table_count += 1
+        found = False
+        for column_name, column_type in columns.items():
+            mapped_type = classifier.classify(column_name, column_type)
+            if mapped_type:
+                discovered.append((table_name, column_name, mapped_type))
+                found = True
+        if found:
+            watermark_columns[table_name] = pick_watermark_column(columns)
+    return ColumnDiscovery(discovered, watermark_columns, table_count)
+
+def default_cache_path(metadata_path):
+    return f"{os.path.splitext(metadata_path)[0]}.classified.json"
+
+def discover_metadata_columns(metadata_path, classifier, cache_path=None):
+    """(ColumnDiscovery, cache_hit) for a metadata file.
+
+    The result is cached next to the file (or at `cache_path`) under the
+    file's SHA-256 and the classifier's pattern fingerprint, so an unchanged
+    file is not re-parsed and edited pattern tables invalidate the cache.
+    Pass cache_path=False to disable caching.
+    """
+    if cache_path is None:
+        cache_path = default_cache_path(metadata_path)
+    key = f"v{CACHE_VERSION}:{file_sha256(metadata_path)}:{classifier.fingerprint}"
+
+    if cache_path and os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'r') as f:
+                cached = json.load(f)
+            if cached.get('key') == key:
+                return ColumnDiscovery.from_json(cached), True
+        except (OSError, ValueError, KeyError):
+            pass
+
+    discovery = classify_tables(iter_metadata_tables(metadata_path), classifier)
+
+    if cache_path:
+        tmp_path = f"{cache_path}.tmp"
+        try:
+            # json.dumps uses the C encoder; json.dump to a file streams through the Python one
+            payload = json.dumps({'key': key, **discovery.to_json()})
+            with open(tmp_path, 'w') as f:
+                f.write(payload)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            # A read-only metadata directory just means no cache
+            pass
+    return discovery, False
@@ -0,0 +1,235 @@
+"""Vectorized mock universal_cmdb rows for load testing at 10M-100M hosts.
+
+Rows are produced in fixed-size shards, each with its own child of one
+SeedSequence, so the output depends only on (seed, rows, shard_rows) and not
+on how many worker processes ran them. Categorical and multi-valued columns
+are drawn as integer codes with NumPy and handed over as Arrow dictionary
+arrays over small value pools, so no per-row Python strings are built;
+hostnames embed the global row index, which makes them unique without a
+`used_hosts` set. Distributions follow universal_cmdb_generator's classic
+per-row mode, with optional Zipf skew and a configurable number of values
+for multi-valued columns.
+"""
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+
+try:
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    np = None
+
+from universal_cmdb_generator import (
+    REGIONS, COUNTRIES, INFRASTRUCTURE_TYPES, BUSINESS_UNITS, SYSTEMS, CIO_NAMES
+)
+
+COLUMNS = [
+    'host', 'region', 'country', 'infrastructure_type', 'source_tables', 'domain',
+    'data_center', 'cloud_region', 'present_in_cmdb', 'tanium_coverage', 'logging_in_splunk',
+    'logging_in_gso', 'presence_in_crowdstrike', 'dlp_agent_coverage', 'ssc_coverage',
+    'business_unit', 'system', 'system_classification', 'cio', 'class'
+]
+
+HOST_PREFIXES = ['srv', 'vm', 'host', 'node', 'app', 'db', 'web', 'api', 'cache', 'proxy']
+HOST_LOCATIONS = ['nyc', 'lon', 'fra', 'tok', 'syd', 'chi', 'dal', 'sfo', 'ams', 'sin']
+URL_SUBDOMAINS = ['app', 'api', 'web', 'portal', 'service', 'admin', 'data', 'secure']
+URL_DOMAINS = ['company.com', 'internal.net', 'corp.local', 'cloud.io']
+CLOUD_REGIONS = ['us-east-1', 'us-west-2', 'eu-west-1', 'ap-southeast-1']
+DATA_CENTERS = [f"DC-{city}-{n}" for city in ['NYC', 'LON', 'TOK', 'SYD'] for n in range(1, 4)]
+DOMAINS = ['1dc.company.com', 'fead.company.com', '1dc|fead', 'other.company.com']
+DOMAIN_WEIGHTS = [0.3, 0.3, 0.2, 0.2]
+SOURCE_TABLES = [f"source_{j}" for j in range(8)]
+
+# Share of rows carrying the value, as in the classic generator
+FLAG_RATES = {
+    'present_in_cmdb': ('yes', 'no', 0.65),
+    'tanium_coverage': ('tanium-deployed', 'not-deployed', 0.55),
+    'logging_in_splunk': ('yes', 'no', 0.5),
+    'logging_in_gso': ('yes', 'no', 0.4),
+    'presence_in_crowdstrike': ('yes', 'no', 0.6),
+    'dlp_agent_coverage': ('dlp-installed', 'no', 0.45),
+    'ssc_coverage': ('covered', '', 0.5),
+}
+URL_HOST_RATE = 0.3
+CLOUD_REGION_RATE = 0.4
+CIO_RATE = 0.75
+
+DEFAULT_SHARD_ROWS = 1_000_000
+# Number of values in business_unit / cloud_region / source_tables: {count: probability}
+DEFAULT_MULTI_VALUE = {1: 0.5, 2: 0.5}
+
+def require_dependencies():
+    if np is None:
+        raise RuntimeError("The columnar generator needs numpy and pyarrow (pip install numpy pyarrow)")
+
+def parse_multi_value(spec):
+    """'1:0.5,2:0.3,3:0.2' -> {1: 0.5, 2: 0.3, 3: 0.2}, normalized to sum to 1"""
+    if isinstance(spec, dict):
+        weights = {int(k): float(v) for k, v in spec.items()}
+    else:
+        weights = {}
+        for part in spec.split(','):
+            count, _, weight = part.partition(':')
+            weights[int(count)] = float(weight or 1)
+    if not weights or min(weights) < 1 or sum(weights.values()) <= 0:
+        raise ValueError(f"Invalid multi-value distribution: {spec!r}")
+    total = sum(weights.values())
+    return {count: weight / total for count, weight in sorted(weights.items())}
+
+def zipf_weights(n, skew):
+    """Probability of each pool entry; skew 0 is uniform, larger favours the first entries"""
+    weights = 1.0 / np.arange(1, n + 1) ** skew
+    return weights / weights.sum()
+
+class Pool:
+    """A value pool plus the probability of drawing each entry"""
+
+    def __init__(self, values, weights):
+        self.values = pa.array(values, pa.string())
+        self.weights = np.asarray(weights, dtype=np.float64)
+
+    def draw(self, rng, n):
+        return rng.choice(len(self.weights), size=n, p=self.weights).astype(np.int32)
+
+def categorical_pool(values, skew):
+    return Pool(values, zipf_weights(len(values), skew))
+
+def multi_value_pool(values, skew, multi_value, separator='|', with_empty=0.0):
+    """Every combination of up to max(multi_value) items, weighted by the count
+    distribution times the product of the items' skewed weights"""
+    item_weights = zipf_weights(len(values), skew)
+    entries, weights = [], []
+    if with_empty:
+        entries.append('')
+        weights.append(with_empty)
+    for count, count_weight in multi_value.items():
+        combos = list(combinations(range(len(values)), min(count, len(values))))
+        combo_weights = np.array([np.prod(item_weights[list(c)]) for c in combos])
+        combo_weights = combo_weights / combo_weights.sum() * count_weight * (1 - with_empty)
+        entries += [separator.join(values[i] for i in combo) for combo in combos]
+        weights += combo_weights.tolist()
+    return Pool(entries, weights)
+
+def flag_pool(yes, no, rate):
+    return Pool([yes, no], [rate, 1 - rate])
+
+def build_pools(skew=0.0, multi_value=None):
+    multi_value = parse_multi_value(multi_value or DEFAULT_MULTI_VALUE)
+    # Source tables are always a source_0..source_{k-1} prefix, as before
+    sources = Pool(['|'.join(SOURCE_TABLES[:k]) for k in multi_value], list(multi_value.values()))
+    systems = categorical_pool(SYSTEMS, skew)
+    return {
+        'region': categorical_pool(REGIONS, skew),
+        'country': categorical_pool(COUNTRIES, skew),
+        'infrastructure_type': categorical_pool(INFRASTRUCTURE_TYPES, skew),
+        'source_tables': sources,
+        'domain': Pool(DOMAINS, DOMAIN_WEIGHTS),
+        'data_center': categorical_pool(DATA_CENTERS, skew),
+        'cloud_region': multi_value_pool(CLOUD_REGIONS, skew, multi_value, with_empty=1 - CLOUD_REGION_RATE),
+        'business_unit': multi_value_pool(BUSINESS_UNITS, skew, multi_value),
+        'system': systems,
+        'cio': Pool([''] + CIO_NAMES, [1 - CIO_RATE] + (zipf_weights(len(CIO_NAMES), skew) * CIO_RATE).tolist()),
+        'class': categorical_pool([f"Class {n}" for n in range(1, 11)], skew),
+        **{column: flag_pool(*spec) for column, spec in FLAG_RATES.items()},
+    }
+
+def _hostnames(rng, start, n, width):
+    """prefix-loc-NNNNNNN or https://subNNNNNNN.domain; the row number makes each unique"""
+    numbers = pc.utf8_lpad(pc.cast(pa.array(np.arange(start, start + n, dtype=np.int64)), pa.string()),
+                           width, padding='0')
+
+    def pick(values, offset=''):
+        return pc.take(pa.array([offset + v for v in values]), pa.array(rng.integers(0, len(values), n)))
+
+    plain = pc.binary_join_element_wise(pick(HOST_PREFIXES), pick(HOST_LOCATIONS), numbers, '-')
+    url = pc.binary_join_element_wise(pick(URL_SUBDOMAINS, 'https://'), numbers, pick(URL_DOMAINS, '.'), '')
+    return pc.if_else(pa.array(rng.random(n) < URL_HOST_RATE), url, plain)
+
+def generate_shard(spec):
+    """Build one shard as an Arrow table; `spec` is (shard, start row, rows, seed, pools config, width)"""
+    shard, start, n, seed, skew, multi_value, width = spec
+    rng = np.random.default_rng(seed)
+    pools = build_pools(skew, multi_value)
+
+    arrays = {'host': _hostnames(rng, start, n, width)}
+    for column in COLUMNS[1:]:
+        if column == 'system_classification':
+            continue
+        pool = pools[column]
+        arrays[column] = pa.DictionaryArray.from_arrays(pa.array(pool.draw(rng, n)), pool.values)
+
+    # "<OS family>|Production", derived from the drawn system
+    system = arrays['system']
+    families = pa.array([f"{value.split()[0]}|Production" for value in system.dictionary.to_pylist()])
+    arrays['system_classification'] = pa.DictionaryArray.from_arrays(system.indices, families)
+    return pa.table([arrays[column] for column in COLUMNS], names=COLUMNS)
+
+def shard_specs(rows, seed=42, shard_rows=DEFAULT_SHARD_ROWS, skew=0.0, multi_value=None):
+    n_shards = max(1, -(-rows // shard_rows))
+    seeds = np.random.SeedSequence(seed).spawn(n_shards)
+    width = max(6, len(str(rows)))
+    multi_value = parse_multi_value(multi_value or DEFAULT_MULTI_VALUE)
+    return [(i, i * shard_rows, min(shard_rows, rows - i * shard_rows), seeds[i], skew, multi_value, width)
+            for i in range(n_shards)]
+
+def _write_parquet_shard(spec, directory):
+    table = generate_shard(spec)
+    path = os.path.join(directory, f"part-{spec[0]:05d}.parquet")
+    pq.write_table(table, path, compression='zstd')
+    return path, table.num_rows
+
+def _parquet_task(args):
+    return _write_parquet_shard(*args)
+
+def _run_ordered(fn, tasks, workers):
+    """Yield fn(task) in task order with at most 2*workers shards in flight"""
+    if workers <= 1:
+        for task in tasks:
+            yield fn(task)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for task in tasks:
+            pending.append(executor.submit(fn, task))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def write_parquet(directory, rows, workers=None, **options):
+    """Write part-NNNNN.parquet shards into `directory`; returns the paths"""
+    require_dependencies()
+    os.makedirs(directory, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    specs = shard_specs(rows, **options)
+    started = time.time()
+    paths = []
+    for path, n in _run_ordered(_parquet_task, [(spec, directory) for spec in specs], workers):
+        paths.append(path)
+        print(f"Wrote {path} ({n:,} rows)")
+    print(f"Generated {rows:,} rows into {len(paths)} Parquet files in {time.time() - started:.1f}s")
+    return paths
+
+def append_to_duckdb(conn, rows, workers=None, table='universal_cmdb', **options):
+    """Generate shards in worker processes and append them to `table` as they arrive"""
+    require_dependencies()
+    workers = workers or os.cpu_count() or 1
+    specs = shard_specs(rows, **options)
+    started = time.time()
+    inserted = 0
+    for shard in _run_ordered(generate_shard, specs, workers):
+        conn.register('generated_shard', shard)
+        try:
+            conn.execute(f"INSERT INTO {table} ({', '.join(COLUMNS)}) SELECT * FROM generated_shard")
+        finally:
+            conn.unregister('generated_shard')
+        inserted += shard.num_rows
+        elapsed = time.time() - started
+        print(f"Progress: {inserted:,}/{rows:,} rows ({inserted / rows * 100:.1f}%), "
+              f"{inserted / max(elapsed, 1e-9):,.0f} rows/s")
+    return inserted
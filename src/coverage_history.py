@@ -0,0 +1,154 @@
+"""Per-ingest coverage snapshots and the trend series read from them.
+
+Every build appends one snapshot to coverage_history: host and control
+counts for each combination ("grain") of region bucket, business unit and
+infrastructure type, from the grand total down to the full
+region x business unit x infrastructure type cross. Each grain is counted
+over hosts exploded only on its own multi-valued dimensions, so every row is
+an exact distinct-host count. Sum rows within a grain's filters, never
+across grains. Trends then read only snapshot rows and never rescan hosts.
+"""
+import logging
+import time
+from datetime import datetime
+from itertools import combinations
+import duckdb
+from coverage_snapshot import COVERAGE_TABLE
+from dimension_bridges import values_column
+
+logger = logging.getLogger(__name__)
+
+HISTORY_TABLE = 'coverage_history'
+
+HISTORY_DIMENSIONS = ['region', 'business_unit', 'infrastructure_type']
+MULTI_VALUED = {'business_unit', 'infrastructure_type'}
+CONTROLS = ['cmdb', 'tanium', 'splunk', 'gso', 'crowdstrike', 'dlp', 'ssc']
+
+INTERVALS = ('day', 'week', 'month')
+TOTAL_GRAIN = 'total'
+
+def grain_name(dims):
+    """'region+business_unit' for a set of dimensions, in HISTORY_DIMENSIONS order"""
+    ordered = [dim for dim in HISTORY_DIMENSIONS if dim in dims]
+    return '+'.join(ordered) or TOTAL_GRAIN
+
+def ensure_history_table(conn):
+    counts = ', '.join(f"{name} BIGINT" for name in ['hosts'] + CONTROLS)
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {HISTORY_TABLE} (
+            captured_at TIMESTAMP NOT NULL,
+            generation VARCHAR,
+            grain VARCHAR NOT NULL,
+            {', '.join(f"{dim} VARCHAR" for dim in HISTORY_DIMENSIONS)},
+            {counts}
+        )
+    """)
+
+def _grain_sql(dims, source):
+    relation = f"""
+        SELECT host, COALESCE(CAST(region_group AS VARCHAR), 'Unknown') AS region,
+               {', '.join(CONTROLS)}, {', '.join(values_column(dim) for dim in MULTI_VALUED)}
+        FROM {source}
+    """
+    # One UNNEST per level: two in the same SELECT would zip, not cross
+    for dim in sorted(MULTI_VALUED & set(dims)):
+        values = values_column(dim)
+        relation = f"""
+            SELECT * EXCLUDE ({values}),
+                   UNNEST(CASE WHEN len({values}) = 0 THEN ['Unknown'] ELSE {values} END) AS {dim}
+            FROM ({relation})
+        """
+    columns = ', '.join(dim if dim in dims else f"NULL AS {dim}" for dim in HISTORY_DIMENSIONS)
+    counts = ', '.join(['COUNT(*) AS hosts'] + [f"COUNT_IF({control}) AS {control}" for control in CONTROLS])
+    group_by = f"GROUP BY {', '.join(dims)}" if dims else ""
+    return f"SELECT '{grain_name(dims)}' AS grain, {columns}, {counts} FROM ({relation}) {group_by}"
+
+def record_coverage_history(conn, generation=None, captured_at=None, source=COVERAGE_TABLE):
+    """Append this build's snapshot; returns the rows added (0 if `generation` is already recorded)"""
+    started = time.time()
+    ensure_history_table(conn)
+    if generation is not None and conn.execute(
+            f"SELECT COUNT(*) FROM {HISTORY_TABLE} WHERE generation = ?", [generation]).fetchone()[0]:
+        return 0
+
+    grains = [dims for size in range(len(HISTORY_DIMENSIONS) + 1)
+              for dims in combinations(HISTORY_DIMENSIONS, size)]
+    select = ' UNION ALL '.join(_grain_sql(list(dims), source) for dims in grains)
+    columns = ['grain'] + HISTORY_DIMENSIONS + ['hosts'] + CONTROLS
+    rows = conn.execute(f"""
+        INSERT INTO {HISTORY_TABLE} (captured_at, generation, {', '.join(columns)})
+        SELECT CAST(? AS TIMESTAMP), ?, {', '.join(columns)} FROM ({select})
+    """, [captured_at or datetime.utcnow(), generation]).fetchone()[0]
+    logger.info(f"Recorded coverage history snapshot: {rows:,} rows in {time.time() - started:.2f}s")
+    return rows
+
+def _point(period, captured_at, counts):
+    hosts = counts[0]
+    point = {'period': period.date().isoformat(), 'captured_at': captured_at.isoformat(), 'hosts': hosts}
+    for control, count in zip(CONTROLS, counts[1:]):
+        point[control] = count
+        point[f"{control}_pct"] = round(count / hosts * 100, 2) if hosts else 0
+    return point
+
+def trend_series(conn, interval='day', dimension=None, filters=None, since=None, until=None, top=10):
+    """Coverage time series, one point per `interval` from its last snapshot.
+
+    Without `dimension` there is a single series (the total, or the hosts
+    matching `filters`); with it, one series per value of that dimension,
+    the `top` largest by hosts in the latest period.
+    """
+    if interval not in INTERVALS:
+        raise ValueError(f"interval must be one of {', '.join(INTERVALS)}")
+    if dimension is not None and dimension not in HISTORY_DIMENSIONS:
+        raise ValueError(f"dimension must be one of {', '.join(HISTORY_DIMENSIONS)}")
+    filters = filters or {}
+    grain = grain_name(set(filters) | ({dimension} if dimension else set()))
+    conditions, params = [], []
+    if since:
+        conditions.append("captured_at >= CAST(? AS TIMESTAMP)")
+        params.append(since)
+    if until:
+        conditions.append("captured_at < CAST(? AS TIMESTAMP) + INTERVAL 1 DAY")
+        params.append(until)
+    window = f"AND {' AND '.join(conditions)}" if conditions else ""
+    matches = ''.join(f" AND h.{dim} = ?" for dim in filters)
+
+    picked = f"""
+        SELECT date_trunc('{interval}', captured_at) AS period, MAX(captured_at) AS captured_at,
+               COUNT(*) AS snapshots
+        FROM {HISTORY_TABLE}
+        WHERE grain = '{TOTAL_GRAIN}' {window}
+        GROUP BY 1
+    """
+    try:
+        periods = conn.execute(f"{picked} ORDER BY period", params).fetchall()
+        records = conn.execute(f"""
+            WITH picked AS ({picked})
+            SELECT p.period, p.captured_at, {f'h.{dimension}' if dimension else 'NULL'},
+                   SUM(h.hosts), {', '.join(f'SUM(h.{control})' for control in CONTROLS)}
+            FROM picked p
+            JOIN {HISTORY_TABLE} h ON h.captured_at = p.captured_at AND h.grain = ? {matches}
+            GROUP BY ALL
+            ORDER BY p.period
+        """, params + [grain] + list(filters.values())).fetchall()
+    except duckdb.CatalogException:
+        periods, records = [], []
+
+    series = {}
+    for period, captured_at, value, *counts in records:
+        series.setdefault(value, []).append(_point(period, captured_at, counts))
+
+    latest = periods[-1][0].date().isoformat() if periods else None
+    def latest_hosts(points):
+        return points[-1]['hosts'] if points[-1]['period'] == latest else 0
+    ranked = sorted(series.items(), key=lambda item: latest_hosts(item[1]), reverse=True)
+
+    return {
+        'interval': interval,
+        'dimension': dimension,
+        'filters': filters,
+        'snapshots': sum(row[2] for row in periods),
+        'periods': [row[0].date().isoformat() for row in periods],
+        'series': [{'value': value, 'points': points} for value, points in ranked[:top]],
+        'series_total': len(ranked)
+    }
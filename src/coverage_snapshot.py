@@ -0,0 +1,148 @@
+import logging
+from dimension_bridges import list_columns, list_sql, values_column
+
+logger = logging.getLogger(__name__)
+
+COVERAGE_TABLE = 'host_coverage'
+STAGING_TABLE = 'host_coverage_staging'
+
+# flag -> (candidate source columns, substrings that mean "covered")
+FLAG_RULES = {
+    'cmdb': (['present_in_cmdb'], ['yes']),
+    'tanium': (['tanium_coverage'], ['tanium']),
+    'splunk': (['logging_in_splunk'], ['yes', 'splunk']),
+    'gso': (['logging_in_gso'], ['yes', 'gso']),
+    'crowdstrike': (['presence_in_crowdstrike', 'present_in_crowdstrike'], ['yes', 'crowdstrike']),
+    'dlp': (['dlp_agent_coverage'], ['dlp', 'agent'])
+}
+
+DIMENSION_COLUMNS = [
+    'region', 'country', 'infrastructure_type', 'business_unit', 'cio', 'class',
+    'system', 'system_classification', 'domain', 'data_center', 'cloud_region',
+    'source_tables'
+]
+
+# Stored as ENUMs rebuilt from the data on every build: a few bytes per row,
+# and filters and group-bys compare dictionary codes instead of strings
+ENUM_COLUMNS = DIMENSION_COLUMNS + ['region_group', 'data_center_site']
+
+# Same buckets as app.normalize_region, evaluated once per host at build time
+def region_group_sql(column='region'):
+    return f"""
+    CASE
+        WHEN {column} IS NULL OR {column} = '' THEN 'Unknown'
+        WHEN regexp_matches(LOWER({column}), 'us|usa|united states|canada|north america|mexico') THEN 'North America'
+        WHEN regexp_matches(LOWER({column}), 'europe|emea|uk|germany|france|spain|italy') THEN 'EMEA'
+        WHEN regexp_matches(LOWER({column}), 'asia|apac|pacific|japan|china|india|australia') THEN 'APAC'
+        WHEN regexp_matches(LOWER({column}), 'latin|latam|south america|brazil|argentina') THEN 'LATAM'
+        ELSE {column}
+    END
+"""
+
+REGION_GROUP_SQL = region_group_sql()
+
+def table_columns(conn, table='universal_cmdb'):
+    return {row[0].lower() for row in conn.execute(f"DESCRIBE {table}").fetchall()}
+
+def _flag_expr(columns, candidates, needles):
+    present = [col for col in candidates if col in columns]
+    if not present:
+        return 'FALSE'
+    checks = ' OR '.join(f"LOWER({col}) LIKE '%{needle}%'" for col in present for needle in needles)
+    return f"COALESCE({checks}, FALSE)"
+
+def coverage_select_sql(columns, source='universal_cmdb'):
+    """SELECT producing one host_coverage row per universal_cmdb row.
+
+    Columns missing from the source schema (the generator, the ingest and older
+    .db files all differ slightly) become NULL dimensions or FALSE flags.
+    """
+    dims = [f"{col} AS {col}" if col in columns else f"CAST(NULL AS VARCHAR) AS {col}"
+            for col in DIMENSION_COLUMNS]
+
+    flags = [f"{_flag_expr(columns, candidates, needles)} AS {flag}"
+             for flag, (candidates, needles) in FLAG_RULES.items()]
+    if 'ssc_coverage' in columns:
+        flags.append("COALESCE(ssc_coverage IS NOT NULL AND ssc_coverage != '', FALSE) AS ssc")
+    else:
+        flags.append("FALSE AS ssc")
+
+    values = [f"{list_sql(col, separator) if col in columns else 'CAST([] AS VARCHAR[])'} AS {values_column(col)}"
+              for col, separator in list_columns().items()]
+
+    region_group = REGION_GROUP_SQL if 'region' in columns else "'Unknown'"
+    if 'data_center' in columns:
+        data_center_site = """
+            CASE
+                WHEN data_center IS NULL OR data_center = '' THEN 'Unknown'
+                ELSE SUBSTRING(data_center, 1, POSITION(' ' IN data_center || ' ') - 1)
+            END"""
+    else:
+        data_center_site = "'Unknown'"
+
+    return f"""
+        SELECT
+            host,
+            {', '.join(dims)},
+            {region_group} AS region_group,
+            {data_center_site} AS data_center_site,
+            COALESCE(host LIKE '%.%' OR host LIKE 'http%', FALSE) AS url_fqdn,
+            {', '.join(flags)},
+            {', '.join(values)}
+        FROM {source}
+    """
+
+def enum_type(column):
+    return f"{COVERAGE_TABLE}_{column}"
+
+def build_host_coverage(conn):
+    """(Re)materialize host_coverage from universal_cmdb; returns the row count.
+
+    Flags are BOOLEAN, dimensions ENUMs over the values present, and
+    multi-valued columns also come parsed as LIST(VARCHAR) `<column>_values`.
+    The ENUM types are recreated each time, so the table is rebuilt from a
+    staging copy inside one transaction.
+    """
+    columns = table_columns(conn)
+    conn.execute(f"CREATE OR REPLACE TEMP TABLE {STAGING_TABLE} AS {coverage_select_sql(columns)}")
+    staged = [row[0] for row in conn.execute(f"DESCRIBE {STAGING_TABLE}").fetchall()]
+
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        conn.execute(f"DROP TABLE IF EXISTS {COVERAGE_TABLE}")
+        typed = {}
+        for column in ENUM_COLUMNS:
+            conn.execute(f"DROP TYPE IF EXISTS {enum_type(column)}")
+            present = conn.execute(
+                f"SELECT COUNT(*) FROM (SELECT 1 FROM {STAGING_TABLE} WHERE {column} IS NOT NULL LIMIT 1)").fetchone()[0]
+            if present:
+                conn.execute(f"""
+                    CREATE TYPE {enum_type(column)} AS ENUM (
+                        SELECT DISTINCT {column} FROM {STAGING_TABLE} WHERE {column} IS NOT NULL ORDER BY 1
+                    )
+                """)
+                typed[column] = f"CAST({column} AS {enum_type(column)}) AS {column}"
+        select = ', '.join(typed.get(column, column) for column in staged)
+        conn.execute(f"CREATE TABLE {COVERAGE_TABLE} AS SELECT {select} FROM {STAGING_TABLE}")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE}")
+
+    count = conn.execute(f"SELECT COUNT(*) FROM {COVERAGE_TABLE}").fetchone()[0]
+    logger.info(f"Built {COVERAGE_TABLE} with {count:,} rows")
+    return count
+
+def coverage_relation(conn):
+    """Name of the relation API queries should read.
+
+    Databases created before host_coverage existed are opened read-only by the
+    API, so fall back to computing the same columns inline.
+    """
+    tables = {row[0].lower() for row in conn.execute("SHOW TABLES").fetchall()}
+    if COVERAGE_TABLE in tables:
+        return COVERAGE_TABLE
+    logger.warning(f"{COVERAGE_TABLE} missing, computing coverage flags per query")
+    return f"({coverage_select_sql(table_columns(conn))}) AS {COVERAGE_TABLE}"
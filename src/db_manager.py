@@ -0,0 +1,290 @@
+import contextvars
+import duckdb
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from parquet_snapshot import MANIFEST, load_snapshot
+
+logger = logging.getLogger(__name__)
+
+DB_FILENAME = 'universal_cmdb.db'
+
+def resolve_db_path(candidates=None):
+    """Find the first universal_cmdb.db that actually contains the universal_cmdb table"""
+    env_path = os.getenv('CMDB_DB_PATH')
+    if candidates is None:
+        candidates = [env_path] if env_path else []
+        candidates += [
+            DB_FILENAME,
+            os.path.join('..', DB_FILENAME),
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', DB_FILENAME)
+        ]
+
+    for db_path in candidates:
+        if not db_path or not os.path.exists(db_path):
+            continue
+        try:
+            conn = duckdb.connect(db_path, read_only=True)
+            try:
+                tables = conn.execute("SHOW TABLES").fetchall()
+            finally:
+                conn.close()
+            if any(table[0].lower() == 'universal_cmdb' for table in tables):
+                return os.path.abspath(db_path)
+        except Exception as e:
+            logger.warning(f"Skipping database candidate {db_path}: {e}")
+
+    raise FileNotFoundError(f"Database file '{DB_FILENAME}' not found")
+
+class DatabaseManager:
+    """Process-wide read-only DuckDB instance handing out one cursor per thread.
+
+    The database path is resolved once. Every `check_interval` seconds one caller
+    re-stats the file and pings its cursor; if the file was replaced (new inode,
+    size or mtime; a symlink published by db_versions counts) or the ping fails,
+    the shared connection is reopened and stale per-thread cursors are
+    discarded on their next use.
+
+    Requests pin() the version that is current when they start and read only
+    from it, including from run_concurrently() tasks. A replaced connection
+    stays open until its last pinned request unpins, then it is closed, so a
+    swap never fails or mixes versions mid-request. `wrap_cursor`,
+    if given, is applied to every cursor handed out (e.g. for profiling).
+    `query_workers` threads serve run_concurrently(); 0 runs tasks inline.
+
+    The read-only connection holds DuckDB's file lock for as long as the
+    process runs, so nothing can open the same file for writing meanwhile:
+    stop the API before an `--in-place` ingest. Published versions (see
+    db_versions) are written as separate files and need no restart.
+
+    With `snapshot_dir` the tables come from a Parquet snapshot instead
+    (see parquet_snapshot), exposed in an in-memory database as views or,
+    with `materialize_snapshot`, copied in; its manifest stands in for the
+    database file when checking for changes.
+    """
+
+    def __init__(self, db_path=None, check_interval=2.0, wrap_cursor=None, query_workers=None,
+                 snapshot_dir=None, materialize_snapshot=False):
+        self.db_path = db_path
+        self.snapshot_dir = snapshot_dir
+        self.materialize_snapshot = materialize_snapshot
+        self.check_interval = check_interval
+        self.wrap_cursor = wrap_cursor
+        if query_workers is None:
+            # The calling thread runs tasks too; on a single core overlap only adds contention
+            query_workers = int(os.getenv('CMDB_QUERY_WORKERS', min(4, (os.cpu_count() or 1) - 1)))
+        self.query_workers = query_workers
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._in_pool = threading.local()
+        self.generation = 0
+        self._conn = None
+        self._signature = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._memos = {}
+        self._memo_lock = threading.RLock()
+        self._checked_at = 0.0
+        self._pins = defaultdict(int)
+        self._retired = {}
+        self._pinned = contextvars.ContextVar('database_pin', default=None)
+
+    @property
+    def source(self):
+        return self.snapshot_dir or self.db_path
+
+    def _file_signature(self):
+        path = os.path.join(self.snapshot_dir, MANIFEST) if self.snapshot_dir else self.db_path
+        try:
+            # Follows a published symlink, so a swap shows up as a new inode
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def _open(self):
+        if self.db_path is None and self.snapshot_dir is None:
+            self.db_path = resolve_db_path()
+
+        self._retire(self._conn, self.generation)
+
+        if self.snapshot_dir:
+            self._signature = self._file_signature()
+            self._conn = duckdb.connect()
+            load_snapshot(self._conn, self.snapshot_dir, self.materialize_snapshot)
+            target = self.snapshot_dir
+        else:
+            # Resolve the symlink once so the signature and connection agree
+            target = os.path.realpath(self.db_path)
+            self._signature = self._file_signature()
+            self._conn = duckdb.connect(target, read_only=True)
+        self._checked_at = time.monotonic()
+        self.generation += 1
+        self._memos[self.generation] = {}
+        logger.info(f"Opened {target} (generation {self.generation})")
+
+    def _retire(self, conn, generation):
+        """Close a replaced connection now, or when its last pinned request finishes"""
+        if conn is None:
+            return
+        if self._pins.get(generation):
+            self._retired[generation] = conn
+            logger.info(f"Draining generation {generation} ({self._pins[generation]} requests in flight)")
+            return
+        self._memos.pop(generation, None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def reopen(self, expected_generation=None):
+        with self._lock:
+            # Another thread may already have reopened while we waited for the lock
+            if expected_generation is None or expected_generation == self.generation:
+                self._open()
+
+    def _thread_cursor(self, pin=None):
+        local = self._local
+        wanted = pin[0] if pin else self.generation
+        if getattr(local, 'generation', None) != wanted:
+            old = getattr(local, 'cursor', None)
+            if old is not None:
+                try:
+                    old.close()
+                except Exception:
+                    pass
+            with self._lock:
+                if pin:
+                    local.cursor = pin[1].cursor()
+                else:
+                    if self._conn is None:
+                        self._open()
+                    local.cursor = self._conn.cursor()
+                    wanted = self.generation
+                local.generation = wanted
+        return local.cursor
+
+    def _is_stale(self, cursor):
+        if self._file_signature() != self._signature:
+            logger.info(f"{self.source} changed on disk, reopening")
+            return True
+        try:
+            cursor.execute("SELECT 1").fetchone()
+        except Exception as e:
+            logger.warning(f"Database health check failed: {e}")
+            return True
+        return False
+
+    def cursor(self):
+        """Return this thread's cursor, reopening the database if it went stale"""
+        pin = self._pinned.get()
+        if pin is not None:
+            cursor = self._thread_cursor(pin)
+            return self.wrap_cursor(cursor) if self.wrap_cursor else cursor
+
+        cursor = self._thread_cursor()
+
+        # Request threads are short-lived, so the check interval is process-wide
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            if self._is_stale(cursor):
+                self.reopen(self._local.generation)
+                cursor = self._thread_cursor()
+
+        return self.wrap_cursor(cursor) if self.wrap_cursor else cursor
+
+    def pin(self):
+        """Read the current version in this context until unpin(token); returns the token"""
+        self.cursor()
+        with self._lock:
+            if self._conn is None:
+                self._open()
+            self._pins[self.generation] += 1
+            return self._pinned.set((self.generation, self._conn))
+
+    def unpin(self, token):
+        generation = self._pinned.get()[0]
+        self._pinned.reset(token)
+        with self._lock:
+            self._pins[generation] -= 1
+            if self._pins[generation] > 0:
+                return
+            del self._pins[generation]
+            conn = self._retired.pop(generation, None)
+            if conn is not None:
+                self._retire(conn, generation)
+                logger.info(f"Closed drained generation {generation}")
+
+    def generation_cached(self, name, factory):
+        """Value computed by `factory(cursor)` once per opened database generation"""
+        cursor = self.cursor()
+        memo = self._memos.setdefault(self._local.generation, {})
+        if name not in memo:
+            # Serialize first computations so N cold requests do the work once
+            with self._memo_lock:
+                if name not in memo:
+                    memo[name] = factory(cursor)
+        return memo[name]
+
+    def _executor(self):
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self.query_workers,
+                                                    thread_name_prefix='duckdb-query')
+        return self._pool
+
+    def _run_pooled(self, task):
+        self._in_pool.active = True
+        try:
+            return task(self.cursor())
+        finally:
+            self._in_pool.active = False
+
+    def run_concurrently(self, tasks):
+        """Results of `task(cursor)` for each task, running them on separate cursors at once.
+
+        DuckDB releases the GIL while a query runs, so independent queries
+        overlap and the wait is roughly the slowest one rather than the sum.
+        The first task runs on the calling thread; any other task the pool has
+        not started by the time its result is needed runs there too, so a busy
+        pool (or a nested call) degrades to sequential execution instead of
+        deadlocking. Tasks after the first must not depend on generation_cached
+        values the caller may be computing. Each task sees a copy of the
+        caller's context, so request-scoped state such as profiling follows it.
+        """
+        tasks = list(tasks)
+        if len(tasks) < 2 or self.query_workers < 1 or getattr(self._in_pool, 'active', False):
+            return [task(self.cursor()) for task in tasks]
+
+        pool = self._executor()
+        futures = [pool.submit(contextvars.copy_context().run, self._run_pooled, task) for task in tasks[1:]]
+        try:
+            results = [tasks[0](self.cursor())]
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+        for task, future in zip(tasks[1:], futures):
+            results.append(task(self.cursor()) if future.cancel() else future.result())
+        return results
+
+    def file_signature(self):
+        return '-'.join(str(part) for part in self._signature) if self._signature else None
+
+    def is_healthy(self):
+        try:
+            return self.cursor().execute("SELECT 1").fetchone()[0] == 1
+        except Exception:
+            return False
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._retire(self._conn, self.generation)
+                self._conn = None
+                self.generation += 1
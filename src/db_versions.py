@@ -0,0 +1,180 @@
+"""Blue/green publishing for universal_cmdb.db.
+
+The database path readers open is a symlink into a versions directory:
+
+    universal_cmdb.db -> universal_cmdb.db.versions/20261017T040500-1a2b3c4d.db
+    universal_cmdb.db.versions/
+        20261016T040500-9f8e7d6c.db     previous versions, kept for rollback
+        next.db                         the build in progress
+        next.db.rejected-20261017T...   a build that failed verification
+
+Writers build into next.db (a copy of the published version, so incremental
+ingests and resumed runs continue from it) and publish it by renaming it to
+a version file and atomically replacing the symlink. A build that fails
+verification is moved aside, so the next run starts again from the
+published version instead of merging on top of it. Readers never see a
+half-written file or hit the writer's lock; the API notices the new target
+on its next freshness check. An existing plain universal_cmdb.db is adopted
+as the first version on the first publish.
+
+    python src/db_versions.py list
+    python src/db_versions.py rollback
+"""
+import argparse
+import logging
+import os
+import shutil
+import uuid
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+VERSIONS_SUFFIX = '.versions'
+WORKING_NAME = 'next.db'
+
+def _version_name():
+    return f"{datetime.utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+
+class DatabaseVersions:
+    """Versioned files behind the `pointer` path; `keep` published versions are retained"""
+
+    def __init__(self, pointer='universal_cmdb.db', keep=3):
+        self.pointer = os.path.abspath(pointer)
+        self.versions_dir = self.pointer + VERSIONS_SUFFIX
+        self.keep = keep
+
+    @property
+    def working_path(self):
+        return os.path.join(self.versions_dir, WORKING_NAME)
+
+    def current(self):
+        """The file readers currently open, or None before anything was published"""
+        return os.path.realpath(self.pointer) if os.path.exists(self.pointer) else None
+
+    def versions(self):
+        """Published version files, oldest first"""
+        if not os.path.isdir(self.versions_dir):
+            return []
+        names = sorted(name for name in os.listdir(self.versions_dir)
+                       if name.endswith('.db') and name != WORKING_NAME)
+        return [os.path.join(self.versions_dir, name) for name in names]
+
+    def prepare(self, fresh=False):
+        """Path to build the next version in.
+
+        An unpublished build left by an interrupted run is reused so its ingest
+        journal can resume; otherwise the published version is copied, or with
+        `fresh` the build starts from an empty file.
+        """
+        os.makedirs(self.versions_dir, exist_ok=True)
+        working = self.working_path
+        if fresh:
+            for path in (working, f"{working}.wal"):
+                if os.path.exists(path):
+                    os.remove(path)
+        elif os.path.exists(working):
+            logger.info(f"Resuming unpublished build {working}")
+        elif self.current():
+            current = self.current()
+            logger.info(f"Copying {current} to {working}")
+            shutil.copyfile(current, f"{working}.tmp")
+            if os.path.exists(f"{current}.wal"):
+                shutil.copyfile(f"{current}.wal", f"{working}.wal")
+            os.replace(f"{working}.tmp", working)
+        return working
+
+    def reject(self):
+        """Move the working build aside so it is neither published nor resumed; returns its new path"""
+        working = self.working_path
+        if not os.path.exists(working):
+            return None
+        rejected = f"{working}.rejected-{datetime.utcnow():%Y%m%dT%H%M%S}"
+        if os.path.exists(f"{working}.wal"):
+            os.rename(f"{working}.wal", f"{rejected}.wal")
+        os.rename(working, rejected)
+        logger.warning(f"Rejected build moved to {rejected}")
+        return rejected
+
+    def _point_to(self, target):
+        link = f"{self.pointer}.tmp-{os.getpid()}"
+        if os.path.lexists(link):
+            os.remove(link)
+        os.symlink(os.path.relpath(target, os.path.dirname(self.pointer)), link)
+        os.replace(link, self.pointer)
+
+    def _adopt_plain_file(self):
+        """Keep a pre-versioning universal_cmdb.db as the first version (hard link, no copy)"""
+        if os.path.isfile(self.pointer) and not os.path.islink(self.pointer):
+            # Named by its modification time so it sorts before the build being published
+            built = datetime.utcfromtimestamp(os.path.getmtime(self.pointer))
+            adopted = os.path.join(self.versions_dir, f"{built:%Y%m%dT%H%M%S}-adopted.db")
+            try:
+                os.link(self.pointer, adopted)
+            except OSError as e:
+                logger.warning(f"Could not keep {self.pointer} as a version: {e}")
+
+    def publish(self, version=None):
+        """Make the working build the live database; every connection to it must be closed"""
+        working = self.working_path
+        if not os.path.exists(working):
+            raise FileNotFoundError(f"Nothing to publish: {working} does not exist")
+        if os.path.exists(f"{working}.wal"):
+            raise RuntimeError(f"{working} has an un-checkpointed WAL; close its connection before publishing")
+
+        self._adopt_plain_file()
+        target = os.path.join(self.versions_dir, f"{version or _version_name()}.db")
+        if os.path.exists(target):
+            raise FileExistsError(f"Version {target} already exists")
+        os.rename(working, target)
+        self._point_to(target)
+        logger.info(f"Published {target}")
+        self.prune()
+        return target
+
+    def rollback(self):
+        """Point back at the version published before the current one"""
+        versions, current = self.versions(), self.current()
+        older = [path for path in versions if path < current] if current in versions else []
+        if not older:
+            raise RuntimeError("No earlier version to roll back to")
+        self._point_to(older[-1])
+        logger.info(f"Rolled back to {older[-1]}")
+        return older[-1]
+
+    def prune(self):
+        """Delete all but the newest `keep` versions, never the live one.
+
+        Readers that still have a deleted version open keep reading it until
+        they reconnect; the space is freed when they do.
+        """
+        current = self.current()
+        removed = []
+        for path in self.versions()[:-self.keep or None]:
+            if path != current:
+                os.remove(path)
+                removed.append(path)
+        return removed
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or roll back published CMDB database versions")
+    parser.add_argument('command', choices=['list', 'rollback'])
+    parser.add_argument('--db', default='universal_cmdb.db', help="the published pointer path")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    versions = DatabaseVersions(args.db)
+    if args.command == 'rollback':
+        versions.rollback()
+    current = versions.current()
+    for path in versions.versions():
+        marker = '*' if path == current else ' '
+        print(f"{marker} {os.path.basename(path)}  {os.path.getsize(path) / 2 ** 20:.1f} MB")
+    if os.path.exists(versions.working_path):
+        print(f"  {WORKING_NAME}  (unpublished build)")
+    if os.path.isdir(versions.versions_dir):
+        for name in sorted(os.listdir(versions.versions_dir)):
+            if name.startswith(f"{WORKING_NAME}.rejected-") and not name.endswith('.wal'):
+                print(f"  {name}  (failed verification)")
+
+if __name__ == '__main__':
+    main()
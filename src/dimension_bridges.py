@@ -0,0 +1,109 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# bridge table -> (host_coverage column, separator regex)
+BRIDGES = {
+    'host_business_unit': ('business_unit', '[,|]'),
+    'host_cio': ('cio', '[|]'),
+    'host_cloud_region': ('cloud_region', '[|]'),
+    'host_domain': ('domain', '[|]'),
+    'host_infrastructure_type': ('infrastructure_type', '[|]'),
+    'host_source_table': ('source_tables', '[,]'),
+    'host_system': ('system', '[|]'),
+    'host_system_classification': ('system_classification', '[|]')
+}
+
+# "Class 3 - Production" -> "Class 3"; a host may carry several classes
+CLASS_BRIDGE = 'host_class'
+
+# Same null-ish markers parse_pipe_separated() used to skip
+NULL_MARKERS = "('null', 'none', 'unknown', '')"
+
+def values_column(column):
+    """host_coverage LIST(VARCHAR) column holding a multi-valued column's parsed values"""
+    return f"{column}_values"
+
+def list_sql(column, separator=None):
+    """Distinct trimmed values of a multi-valued text column as LIST(VARCHAR); [] when empty"""
+    if column == 'class':
+        return (f"COALESCE(list_distinct(list_transform("
+                f"regexp_extract_all(LOWER(class), 'class\\s*(\\d+)', 1), n -> 'Class ' || n)), [])")
+    return (f"CASE WHEN {column} IS NULL OR LOWER({column}) IN {NULL_MARKERS} THEN [] "
+            f"ELSE list_distinct(list_filter(list_transform(regexp_split_to_array({column}, '{separator}'), "
+            f"v -> TRIM(v)), v -> v != '')) END")
+
+def list_columns():
+    """multi-valued column -> split regex (None for class), one per bridge"""
+    return {column: separator for column, separator in BRIDGES.values()} | {'class': None}
+
+def relation_columns(conn, relation):
+    return {column[0].lower() for column in conn.execute(f"SELECT * FROM {relation} LIMIT 0").description}
+
+def bridge_select_sql(bridge, source='host_coverage', from_lists=False):
+    """One (host, value) row per distinct trimmed value of a multi-valued column.
+
+    With `from_lists` the values are unnested from host_coverage's parsed
+    LIST(VARCHAR) column instead of being split out of the text again.
+    """
+    column = bridge_column(bridge)
+    if from_lists:
+        return f"""
+            SELECT DISTINCT host, value
+            FROM (SELECT host, UNNEST({values_column(column)}) AS value FROM {source})
+        """
+
+    if bridge == CLASS_BRIDGE:
+        return f"""
+            SELECT DISTINCT host, 'Class ' || class_number AS value
+            FROM (
+                SELECT host, UNNEST(regexp_extract_all(LOWER(class), 'class\\s*(\\d+)', 1)) AS class_number
+                FROM {source}
+                WHERE class IS NOT NULL
+            )
+        """
+
+    separator = BRIDGES[bridge][1]
+    return f"""
+        SELECT DISTINCT host, TRIM(value) AS value
+        FROM (
+            SELECT host, UNNEST(regexp_split_to_array({column}, '{separator}')) AS value
+            FROM {source}
+            WHERE {column} IS NOT NULL AND LOWER({column}) NOT IN {NULL_MARKERS}
+        )
+        WHERE TRIM(value) != ''
+    """
+
+def has_value_lists(conn, source):
+    columns = relation_columns(conn, source)
+    return all(values_column(column) in columns for column in list_columns())
+
+def bridge_names():
+    return list(BRIDGES) + [CLASS_BRIDGE]
+
+def bridge_column(bridge):
+    return 'class' if bridge == CLASS_BRIDGE else BRIDGES[bridge][0]
+
+def build_dimension_bridges(conn, source='host_coverage'):
+    """(Re)build every host_<dimension> bridge table from host_coverage"""
+    from_lists = has_value_lists(conn, source)
+    for bridge in bridge_names():
+        conn.execute(f"CREATE OR REPLACE TABLE {bridge} AS {bridge_select_sql(bridge, source, from_lists)}")
+        count = conn.execute(f"SELECT COUNT(*) FROM {bridge}").fetchone()[0]
+        logger.info(f"Built {bridge} with {count:,} rows")
+
+def bridge_relations(conn, source='host_coverage'):
+    """bridge name -> relation to query, computed inline when the table is missing"""
+    tables = {row[0].lower() for row in conn.execute("SHOW TABLES").fetchall()}
+    relations = {}
+    from_lists = None
+    for bridge in bridge_names():
+        if bridge in tables:
+            relations[bridge] = bridge
+        else:
+            if from_lists is None:
+                from_lists = has_value_lists(conn, source)
+            relations[bridge] = f"({bridge_select_sql(bridge, source, from_lists)}) AS {bridge}"
+    if any(bridge not in tables for bridge in bridge_names()):
+        logger.warning("Dimension bridge tables missing, exploding values per query")
+    return relations
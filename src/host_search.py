@@ -0,0 +1,156 @@
+import logging
+import time
+from coverage_snapshot import table_columns
+
+logger = logging.getLogger(__name__)
+
+INDEX_TABLE = 'host_search_index'
+TRIGRAM_TABLE = 'host_trigrams'
+TRIGRAM_COUNTS_TABLE = 'host_trigram_counts'
+
+SEARCH_MODES = ('auto', 'prefix', 'substring')
+
+# Columns returned for every hit, COALESCE'd to 'unknown' like the old LIKE query
+DETAIL_COLUMNS = ['region', 'country', 'infrastructure_type', 'present_in_cmdb', 'tanium_coverage']
+
+def normalize_hostname(value):
+    return (value or '').strip().lower()
+
+def trigrams(value):
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+def build_host_search_index(conn, source='universal_cmdb'):
+    """(Re)build the hostname search tables.
+
+    host_search_index holds one row per host sorted by its lowercased name, so
+    prefix lookups are range scans that DuckDB's zonemaps prune to a few row
+    groups; it also keeps the lowercased source_tables, which substring search
+    matches too. host_trigrams posts every 3-gram of every name as (trigram,
+    host_id), sorted by trigram, and host_trigram_counts keeps the posting
+    sizes so a query can start from its rarest trigram.
+    """
+    started = time.time()
+    columns = table_columns(conn, source)
+    details = ', '.join(
+        f"COALESCE(CAST({col} AS VARCHAR), 'unknown') AS {col}" if col in columns else f"'unknown' AS {col}"
+        for col in DETAIL_COLUMNS
+    )
+    sources = "LOWER(COALESCE(CAST(source_tables AS VARCHAR), ''))" if 'source_tables' in columns else "''"
+
+    conn.execute(f"""
+        CREATE OR REPLACE TABLE {INDEX_TABLE} AS
+        SELECT
+            CAST(ROW_NUMBER() OVER (ORDER BY host_lower, host) - 1 AS INTEGER) AS host_id,
+            host, host_lower, source_lower, {', '.join(DETAIL_COLUMNS)}
+        FROM (
+            SELECT host, LOWER(TRIM(host)) AS host_lower, {sources} AS source_lower, {details}
+            FROM {source}
+            WHERE host IS NOT NULL AND TRIM(host) != ''
+        )
+        ORDER BY host_id
+    """)
+    conn.execute(f"""
+        CREATE OR REPLACE TABLE {TRIGRAM_TABLE} AS
+        SELECT DISTINCT substr(host_lower, pos, 3) AS trigram, host_id
+        FROM (
+            SELECT host_id, host_lower, UNNEST(generate_series(1, length(host_lower) - 2)) AS pos
+            FROM {INDEX_TABLE}
+        )
+        ORDER BY trigram, host_id
+    """)
+    conn.execute(f"""
+        CREATE OR REPLACE TABLE {TRIGRAM_COUNTS_TABLE} AS
+        SELECT trigram, COUNT(*) AS postings FROM {TRIGRAM_TABLE} GROUP BY trigram ORDER BY trigram
+    """)
+
+    hosts = conn.execute(f"SELECT COUNT(*) FROM {INDEX_TABLE}").fetchone()[0]
+    postings = conn.execute(f"SELECT COUNT(*) FROM {TRIGRAM_TABLE}").fetchone()[0]
+    logger.info(f"Built host search index: {hosts:,} hosts, {postings:,} trigram postings "
+                f"in {time.time() - started:.2f}s")
+
+class HostSearchIndex:
+    """Ranked, paginated hostname search over the tables built at ingest.
+
+    Modes:
+      prefix     names starting with the term, alphabetical
+      substring  names or source_tables containing the term, like the LIKE
+                 scan it replaces; candidates come from the posting list of the
+                 term's rarest trigram and are verified with contains(). Terms
+                 under 3 characters, or found in a source_tables value, scan
+                 the index with contains() instead
+      auto       same as substring (kept for existing callers)
+
+    Substring hits rank exact matches first, then by match position (so prefix
+    hits lead, and source_tables-only hits trail), then shorter names, then
+    alphabetically. Ranking and paging run in DuckDB, so only the requested
+    page leaves it.
+    """
+
+    def __init__(self, trigram_counts, sources):
+        self.trigram_counts = trigram_counts
+        # Distinct lowercased source_tables values; few, since they name source tables
+        self.sources = sources
+
+    @classmethod
+    def load(cls, conn):
+        """The index for this database, or None when it predates the search tables"""
+        tables = {row[0].lower() for row in conn.execute("SHOW TABLES").fetchall()}
+        if not {INDEX_TABLE, TRIGRAM_TABLE, TRIGRAM_COUNTS_TABLE} <= tables:
+            logger.warning("Host search index missing, falling back to LIKE scans")
+            return None
+        if 'source_lower' not in table_columns(conn, INDEX_TABLE):
+            logger.warning("Host search index predates source_tables matching, falling back to LIKE scans")
+            return None
+        counts = dict(conn.execute(f"SELECT trigram, postings FROM {TRIGRAM_COUNTS_TABLE}").fetchall())
+        sources = [row[0] for row in conn.execute(f"SELECT DISTINCT source_lower FROM {INDEX_TABLE}").fetchall()]
+        return cls(counts, sources)
+
+    def _page(self, conn, source, params, limit, offset, order='host_id', order_params=()):
+        """(hosts, total) for one page of the index rows in `source`"""
+        rows = conn.execute(f"""
+            SELECT host, {', '.join(DETAIL_COLUMNS)}, COUNT(*) OVER () AS total
+            FROM {source}
+            ORDER BY {order}
+            LIMIT ? OFFSET ?
+        """, params + list(order_params) + [limit, offset]).fetchall()
+        if rows or offset == 0:
+            hosts = [dict(zip(['host'] + DETAIL_COLUMNS, row[:-1])) for row in rows]
+            return hosts, rows[0][-1] if rows else 0
+        # Past the last page; the window total went with the rows
+        return [], conn.execute(f"SELECT COUNT(*) FROM {source}", params).fetchone()[0]
+
+    def _prefix(self, conn, term, limit, offset):
+        # Range predicate lets DuckDB skip row groups by min/max before starts_with() runs
+        upper = term[:-1] + chr(ord(term[-1]) + 1)
+        source = f"{INDEX_TABLE} WHERE host_lower >= ? AND host_lower < ? AND starts_with(host_lower, ?)"
+        return self._page(conn, source, [term, upper, term], limit, offset)
+
+    def _substring(self, conn, term, limit, offset):
+        order = 'host_lower <> ?, strpos(host_lower, ?) = 0, strpos(host_lower, ?), length(host_lower), host_id'
+        order_params = [term] * 3
+        if any(term in value for value in self.sources):
+            # source_tables are not in the trigram postings; scan names and sources together
+            source = f"{INDEX_TABLE} WHERE contains(host_lower, ?) OR contains(source_lower, ?)"
+            return self._page(conn, source, [term, term], limit, offset, order, order_params)
+        if len(term) < 3:
+            # Too short to have a trigram; contains() over the sorted names
+            source = f"{INDEX_TABLE} WHERE contains(host_lower, ?)"
+            return self._page(conn, source, [term], limit, offset, order, order_params)
+        grams = trigrams(term)
+        if any(gram not in self.trigram_counts for gram in grams):
+            return [], 0
+        rarest = min(grams, key=lambda gram: self.trigram_counts[gram])
+        source = f"""(
+            SELECT i.* FROM {TRIGRAM_TABLE} p JOIN {INDEX_TABLE} i USING (host_id)
+            WHERE p.trigram = ? AND contains(i.host_lower, ?)
+        )"""
+        return self._page(conn, source, [rarest, term], limit, offset, order, order_params)
+
+    def search(self, conn, term, mode='auto', limit=100, offset=0):
+        """(hosts, total_found) for one page of matches"""
+        term = normalize_hostname(term)
+        if not term:
+            return [], 0
+        if mode == 'prefix':
+            return self._prefix(conn, term, limit, offset)
+        return self._substring(conn, term, limit, offset)
@@ -0,0 +1,148 @@
+from datetime import datetime, timedelta
+
+RUNS_TABLE = 'ingest_runs'
+RUN_TABLES_TABLE = 'ingest_run_tables'
+
+# BigQuery keeps anonymous query results for about a day; past that a
+# partial table could not be resumed from its job anyway
+RESUME_WINDOW = timedelta(hours=24)
+
+class TableProgress:
+    __slots__ = ('status', 'job_id', 'batch_offset', 'rows_merged', 'watermark')
+
+    def __init__(self, status, job_id, batch_offset, rows_merged, watermark):
+        self.status = status
+        self.job_id = job_id
+        self.batch_offset = batch_offset or 0
+        self.rows_merged = rows_merged or 0
+        self.watermark = watermark
+
+class RunJournal:
+    """Per-run, per-table ingest progress kept in DuckDB next to the data.
+
+    A table is 'running' once its query is issued, 'failed' if its fetch
+    errors out, and 'done' when the merge that commits its last rows
+    commits (a fully staged table is only tracked in memory until then);
+    batch_offset is the number of source rows whose effects are already
+    merged, written in that same transaction. A run that never reaches
+    finish() is resumed by the next begin(): 'done' tables are skipped and
+    the rest continue from their offset.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.run_id = None
+        self.resumed = False
+        self.tables = {}
+
+    def ensure_tables(self):
+        self.conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {RUNS_TABLE} (
+                run_id INTEGER PRIMARY KEY,
+                status VARCHAR,
+                started_at TIMESTAMP,
+                finished_at TIMESTAMP
+            )
+        """)
+        self.conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {RUN_TABLES_TABLE} (
+                run_id INTEGER,
+                table_name VARCHAR,
+                status VARCHAR,
+                job_id VARCHAR,
+                batch_offset BIGINT,
+                rows_merged BIGINT,
+                watermark VARCHAR,
+                error VARCHAR,
+                updated_at TIMESTAMP,
+                PRIMARY KEY (run_id, table_name)
+            )
+        """)
+
+    def begin(self, resume=True):
+        """Start a run, or pick up the last one if it was interrupted recently"""
+        self.ensure_tables()
+        last = self.conn.execute(f"""
+            SELECT run_id, started_at FROM {RUNS_TABLE}
+            WHERE status = 'running' ORDER BY run_id DESC LIMIT 1
+        """).fetchone()
+
+        if last and resume and datetime.now() - last[1] <= RESUME_WINDOW:
+            self.run_id, self.resumed = last[0], True
+            rows = self.conn.execute(f"""
+                SELECT table_name, status, job_id, batch_offset, rows_merged, watermark
+                FROM {RUN_TABLES_TABLE} WHERE run_id = ?
+            """, [self.run_id]).fetchall()
+            self.tables = {row[0]: TableProgress(*row[1:]) for row in rows}
+            return self.run_id
+
+        if last:
+            self.conn.execute(f"UPDATE {RUNS_TABLE} SET status = 'abandoned' WHERE status = 'running'")
+        self.run_id = self.conn.execute(f"SELECT COALESCE(MAX(run_id), 0) + 1 FROM {RUNS_TABLE}").fetchone()[0]
+        self.conn.execute(f"INSERT INTO {RUNS_TABLE} VALUES (?, 'running', now(), NULL)", [self.run_id])
+        self.resumed = False
+        self.tables = {}
+        return self.run_id
+
+    @property
+    def active(self):
+        return self.run_id is not None
+
+    def progress(self, table_name):
+        return self.tables.get(table_name)
+
+    def start_table(self, table_name, job_id, batch_offset=0):
+        previous = self.tables.get(table_name)
+        rows_merged = previous.rows_merged if previous else 0
+        watermark = previous.watermark if previous and batch_offset else None
+        self.tables[table_name] = TableProgress('running', job_id, batch_offset, rows_merged, watermark)
+        self.conn.execute(f"""
+            INSERT OR REPLACE INTO {RUN_TABLES_TABLE}
+            VALUES (?, ?, 'running', ?, ?, ?, ?, NULL, now())
+        """, [self.run_id, table_name, job_id, batch_offset, rows_merged, watermark])
+
+    def commit_progress(self, offsets, finished):
+        """Record merged progress; call inside the merge transaction.
+
+        `offsets` maps table -> (source rows consumed, rows staged since the
+        last commit, running watermark); `finished` are tables whose fetch
+        completed and whose rows are all part of this commit.
+        """
+        for table_name, (batch_offset, rows, watermark) in offsets.items():
+            entry = self.tables.get(table_name)
+            if entry is None:
+                continue
+            entry.batch_offset = batch_offset
+            entry.rows_merged += rows
+            entry.watermark = watermark
+            self.conn.execute(f"""
+                UPDATE {RUN_TABLES_TABLE}
+                SET batch_offset = ?, rows_merged = ?, watermark = ?, updated_at = now()
+                WHERE run_id = ? AND table_name = ?
+            """, [batch_offset, entry.rows_merged, watermark, self.run_id, table_name])
+        for table_name in finished:
+            if table_name in self.tables:
+                self.tables[table_name].status = 'done'
+                self.conn.execute(f"""
+                    UPDATE {RUN_TABLES_TABLE} SET status = 'done', updated_at = now()
+                    WHERE run_id = ? AND table_name = ?
+                """, [self.run_id, table_name])
+
+    def fail_table(self, table_name, error):
+        if table_name in self.tables:
+            self.tables[table_name].status = 'failed'
+        self.conn.execute(f"""
+            UPDATE {RUN_TABLES_TABLE} SET status = 'failed', error = ?, updated_at = now()
+            WHERE run_id = ? AND table_name = ?
+        """, [str(error)[:500], self.run_id, table_name])
+
+    def finish(self):
+        self.conn.execute(f"UPDATE {RUNS_TABLE} SET status = 'completed', finished_at = now() WHERE run_id = ?",
+                          [self.run_id])
+        self.run_id = None
+
+    def summary(self):
+        counts = {}
+        for entry in self.tables.values():
+            counts[entry.status] = counts.get(entry.status, 0) + 1
+        return counts
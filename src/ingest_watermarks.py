@@ -0,0 +1,40 @@
+WATERMARK_TABLE = 'ingest_watermarks'
+
+# Source columns that move forward whenever a row is written; the first one a
+# table has becomes its row-level watermark
+WATERMARK_COLUMNS = [
+    'last_updated', 'updated_at', 'last_modified', 'modified_at', 'modified_date',
+    'load_timestamp', 'ingestion_time', 'ingested_at', '_updated_at'
+]
+
+# Watermark "column" for tables tracked by their BigQuery modified time + row count
+TABLE_SIGNATURE = '@table'
+
+def ensure_watermark_table(conn):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {WATERMARK_TABLE} (
+            table_name VARCHAR PRIMARY KEY,
+            watermark_column VARCHAR,
+            watermark VARCHAR,
+            rows_fetched BIGINT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+def load_watermarks(conn):
+    """table -> (watermark_column, watermark) from the last successful runs"""
+    ensure_watermark_table(conn)
+    rows = conn.execute(f"SELECT table_name, watermark_column, watermark FROM {WATERMARK_TABLE}").fetchall()
+    return {table: (column, value) for table, column, value in rows}
+
+def save_watermark(conn, table_name, column, value, rows_fetched):
+    conn.execute(
+        f"INSERT OR REPLACE INTO {WATERMARK_TABLE} VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)",
+        [table_name, column, value, rows_fetched])
+
+def pick_watermark_column(column_names):
+    by_lower = {name.lower(): name for name in column_names}
+    for candidate in WATERMARK_COLUMNS:
+        if candidate in by_lower:
+            return by_lower[candidate]
+    return None
@@ -0,0 +1,95 @@
+"""Convert an existing universal_cmdb.db to the typed serving layout.
+
+Rebuilds host_coverage with BOOLEAN flags, ENUM dimensions and LIST(VARCHAR)
+value columns, then the bridges and search index from it, and finally copies
+the database into a fresh file so the space freed by the old tables is
+returned. universal_cmdb itself is left as it was.
+
+    python src/migrate_typed_schema.py universal_cmdb.db
+    python src/migrate_typed_schema.py universal_cmdb.db --output typed.db
+
+When universal_cmdb.db is a published symlink (see db_versions) the
+converted copy is published as a new version and the API picks it up
+without a restart. A plain file is replaced in place, so stop the API (or
+point it at the output file) first: it holds the database open read-only.
+"""
+import argparse
+import os
+import time
+import duckdb
+from coverage_snapshot import build_host_coverage
+from dimension_bridges import build_dimension_bridges
+from host_search import build_host_search_index
+from cmdb_metadata import bump_generation
+from db_versions import DatabaseVersions
+
+def file_size_mb(path):
+    wal = f"{path}.wal"
+    size = os.path.getsize(path) + (os.path.getsize(wal) if os.path.exists(wal) else 0)
+    return size / (1024 * 1024)
+
+def rebuild_serving_tables(path):
+    conn = duckdb.connect(path)
+    try:
+        rows = build_host_coverage(conn)
+        build_dimension_bridges(conn)
+        build_host_search_index(conn)
+        bump_generation(conn)
+        conn.execute("CHECKPOINT")
+    finally:
+        conn.close()
+    return rows
+
+def compact(source, target):
+    """Copy every table into a new file; DuckDB does not shrink files in place"""
+    if os.path.exists(target):
+        os.remove(target)
+    conn = duckdb.connect()
+    try:
+        conn.execute(f"ATTACH '{source}' AS src (READ_ONLY)")
+        conn.execute(f"ATTACH '{target}' AS dst")
+        conn.execute("COPY FROM DATABASE src TO dst")
+    finally:
+        conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a CMDB database to the typed host_coverage layout")
+    parser.add_argument('database', help="path to universal_cmdb.db")
+    parser.add_argument('--output', help="write the converted database here instead of replacing the input")
+    parser.add_argument('--no-compact', action='store_true', help="rebuild in place without copying to a fresh file")
+    args = parser.parse_args()
+
+    versions = None
+    source = os.path.realpath(args.database)
+    if os.path.islink(args.database) and not args.output:
+        versions = DatabaseVersions(args.database)
+        if os.path.exists(versions.working_path):
+            parser.error(f"{versions.working_path} is an unpublished build; publish or remove it first")
+
+    before = file_size_mb(source)
+    start = time.perf_counter()
+
+    if args.no_compact:
+        target = versions.prepare() if versions else args.output or source
+        if args.output:
+            compact(source, target)
+        rows = rebuild_serving_tables(target)
+    else:
+        target = versions.working_path if versions else args.output or f"{source}.typed"
+        # Rebuild in a scratch copy so the input stays usable if anything fails
+        scratch = f"{target}.tmp"
+        compact(source, scratch)
+        rows = rebuild_serving_tables(scratch)
+        compact(scratch, target)
+        os.remove(scratch)
+        if not args.output and not versions:
+            os.replace(target, source)
+            target = source
+    if versions:
+        target = versions.publish()
+
+    print(f"Converted {rows:,} hosts in {time.perf_counter() - start:.1f}s")
+    print(f"{args.database}: {before:.1f} MB -> {target}: {file_size_mb(target):.1f} MB")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+"""Parquet snapshots of a CMDB database.
+
+A snapshot is a directory with one sub-directory of ZSTD-compressed Parquet
+files per table and a manifest.json describing them:
+
+    snapshot/
+        manifest.json
+        universal_cmdb/region_partition=EMEA/infrastructure_partition=Server/data_0.parquet
+        host_coverage/region_partition=EMEA/...
+        host_search_index/data_0.parquet
+        ...
+
+The two per-host tables are hive-partitioned by the host's primary region
+bucket and infrastructure type and sorted by host inside each partition;
+the other tables keep the order they were built in (the search tables rely
+on it). Every row group carries min/max statistics, so readers skip whole
+partitions on the partition keys and row groups on the sort key. Partition
+keys live only in directory names: reading with hive_partitioning=false
+returns exactly the original columns, =true adds the keys for pruning.
+
+The snapshot is written next to its destination and renamed into place
+with the manifest already in it, so a directory that has a manifest is
+complete.
+
+    python src/parquet_snapshot.py export universal_cmdb.db snapshots/latest
+    python src/parquet_snapshot.py import snapshots/latest restored.db
+
+The API can serve a snapshot directly: CMDB_SNAPSHOT_DIR=snapshots/latest.
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import time
+from datetime import datetime, timezone
+from urllib.parse import unquote
+import duckdb
+from cmdb_metadata import get_metadata
+from coverage_snapshot import COVERAGE_TABLE, region_group_sql, table_columns
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = 'manifest.json'
+FORMAT_VERSION = 1
+COMPRESSION = 'ZSTD'
+ROW_GROUP_SIZE = 122880
+
+PARTITIONED_TABLES = ['universal_cmdb', COVERAGE_TABLE]
+PARTITION_COLUMNS = ['region_partition', 'infrastructure_partition']
+
+def _primary_value(column):
+    return f"TRIM(split_part(CAST({column} AS VARCHAR), '|', 1))"
+
+def partition_select_sql(columns):
+    """Partition key expressions; multi-valued fields partition on their first value"""
+    region = region_group_sql(_primary_value('region')) if 'region' in columns else "'Unknown'"
+    if 'infrastructure_type' in columns:
+        infrastructure = f"COALESCE(NULLIF({_primary_value('infrastructure_type')}, ''), 'Unknown')"
+    else:
+        infrastructure = "'Unknown'"
+    return f"{region} AS region_partition, {infrastructure} AS infrastructure_partition"
+
+def snapshot_tables(conn):
+    return [row[0] for row in conn.execute("""
+        SELECT table_name FROM duckdb_tables()
+        WHERE database_name = current_database() AND schema_name = 'main' AND NOT temporary
+        ORDER BY table_name
+    """).fetchall()]
+
+def _sql_string(value):
+    return "'" + value.replace("'", "''") + "'"
+
+def parquet_source_sql(paths):
+    """read_parquet over exactly these files, without the hive partition columns"""
+    files = ', '.join(_sql_string(path) for path in paths)
+    return f"read_parquet([{files}], hive_partitioning = false)"
+
+def _partition_values(relative_path):
+    parts = [segment.split('=', 1) for segment in relative_path.split('/')[:-1] if '=' in segment]
+    return {key: unquote(value) for key, value in parts}
+
+def _export_table(conn, table, target, row_group_size):
+    os.makedirs(target)
+    options = f"FORMAT PARQUET, COMPRESSION {COMPRESSION}, ROW_GROUP_SIZE {row_group_size}"
+    columns = table_columns(conn, table)
+
+    if table in PARTITIONED_TABLES:
+        order = "ORDER BY host" if 'host' in columns else ""
+        conn.execute(f"""
+            COPY (SELECT *, {partition_select_sql(columns)} FROM {table} {order})
+            TO {_sql_string(target)} ({options}, PARTITION_BY ({', '.join(PARTITION_COLUMNS)}))
+        """)
+        partition_by = PARTITION_COLUMNS
+    else:
+        conn.execute(f"COPY {table} TO {_sql_string(os.path.join(target, 'data_0.parquet'))} ({options})")
+        partition_by = []
+
+    written = sorted(os.path.join(root, name) for root, _, names in os.walk(target)
+                     for name in names if name.endswith('.parquet'))
+    files = []
+    if written:
+        paths = ', '.join(_sql_string(path) for path in written)
+        for path, rows, row_groups, size in conn.execute(f"""
+            SELECT file_name, num_rows, num_row_groups, file_size_bytes
+            FROM parquet_file_metadata([{paths}])
+            ORDER BY file_name
+        """).fetchall():
+            relative = os.path.relpath(path, os.path.dirname(target)).replace(os.sep, '/')
+            files.append({'path': relative, 'rows': rows, 'row_groups': row_groups, 'bytes': size,
+                          'partition': _partition_values(relative)})
+
+    paths = [os.path.join(os.path.dirname(target), entry['path']) for entry in files]
+    schema = conn.execute(f"DESCRIBE SELECT * FROM {parquet_source_sql(paths)}").fetchall() if paths else []
+    return {
+        'rows': sum(entry['rows'] for entry in files),
+        'partition_by': partition_by,
+        'sorted_by': ['host'] if partition_by and 'host' in columns else [],
+        'columns': [{'name': row[0], 'type': row[1]} for row in schema],
+        'files': files,
+    }
+
+def export_snapshot(conn, directory, row_group_size=ROW_GROUP_SIZE, overwrite=False):
+    """Write every table of `conn` as a Parquet snapshot in `directory`; returns the manifest"""
+    directory = os.path.abspath(directory)
+    if os.path.exists(directory) and not overwrite:
+        raise FileExistsError(f"Snapshot directory {directory} already exists")
+
+    started = time.time()
+    partial = f"{directory}.partial"
+    shutil.rmtree(partial, ignore_errors=True)
+    os.makedirs(partial)
+
+    manifest = {
+        'format_version': FORMAT_VERSION,
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'duckdb_version': duckdb.__version__,
+        'generation': get_metadata(conn, 'generation'),
+        'compression': COMPRESSION,
+        'row_group_size': row_group_size,
+        'tables': {},
+    }
+    try:
+        for table in snapshot_tables(conn):
+            manifest['tables'][table] = _export_table(conn, table, os.path.join(partial, table), row_group_size)
+        with open(os.path.join(partial, MANIFEST), 'w') as f:
+            json.dump(manifest, f, indent=2)
+    except Exception:
+        shutil.rmtree(partial, ignore_errors=True)
+        raise
+
+    if os.path.exists(directory):
+        retired = f"{directory}.old"
+        shutil.rmtree(retired, ignore_errors=True)
+        os.rename(directory, retired)
+        os.rename(partial, directory)
+        shutil.rmtree(retired, ignore_errors=True)
+    else:
+        os.rename(partial, directory)
+
+    size = sum(entry['bytes'] for table in manifest['tables'].values() for entry in table['files'])
+    logger.info(f"Exported {len(manifest['tables'])} tables to {directory} "
+                f"({size / 2 ** 20:.1f} MB) in {time.time() - started:.2f}s")
+    return manifest
+
+def read_manifest(directory):
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No {MANIFEST} in {directory}; not a (complete) snapshot")
+    with open(path) as f:
+        manifest = json.load(f)
+    if manifest.get('format_version') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format {manifest.get('format_version')} in {directory}")
+    return manifest
+
+def load_snapshot(conn, directory, materialize=False):
+    """Expose a snapshot's tables in `conn`; returns the manifest.
+
+    By default each table is a view over read_parquet, so startup costs only
+    the manifest read and queries scan the files (pruned by their
+    statistics). With `materialize` the tables are copied into `conn` once,
+    which takes memory but makes repeated scans as fast as a .db file.
+    """
+    directory = os.path.abspath(directory)
+    manifest = read_manifest(directory)
+    started = time.time()
+    kind = 'TABLE' if materialize else 'VIEW'
+    for table, entry in manifest['tables'].items():
+        paths = [os.path.join(directory, file['path']) for file in entry['files']]
+        if not paths:
+            continue
+        conn.execute(f"CREATE OR REPLACE {kind} {table} AS SELECT * FROM {parquet_source_sql(paths)}")
+    logger.info(f"Loaded snapshot {directory} ({len(manifest['tables'])} tables as {kind.lower()}s) "
+                f"in {time.time() - started:.2f}s")
+    return manifest
+
+def import_snapshot(directory, db_path):
+    """Materialize a snapshot into a new DuckDB file"""
+    if os.path.exists(db_path):
+        raise FileExistsError(f"{db_path} already exists")
+    conn = duckdb.connect(db_path)
+    try:
+        manifest = load_snapshot(conn, directory, materialize=True)
+        conn.execute("CHECKPOINT")
+    finally:
+        conn.close()
+    return manifest
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a CMDB database to a Parquet snapshot, or import one")
+    commands = parser.add_subparsers(dest='command', required=True)
+    export = commands.add_parser('export', help="write a snapshot directory from a .db file")
+    export.add_argument('database')
+    export.add_argument('directory')
+    export.add_argument('--row-group-size', type=int, default=ROW_GROUP_SIZE)
+    export.add_argument('--overwrite', action='store_true', help="replace an existing snapshot directory")
+    restore = commands.add_parser('import', help="materialize a snapshot directory into a new .db file")
+    restore.add_argument('directory')
+    restore.add_argument('database')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    if args.command == 'export':
+        conn = duckdb.connect(args.database, read_only=True)
+        try:
+            manifest = export_snapshot(conn, args.directory, args.row_group_size, args.overwrite)
+        finally:
+            conn.close()
+        for table, entry in manifest['tables'].items():
+            print(f"  {table}: {entry['rows']:,} rows in {len(entry['files'])} files")
+    else:
+        import_snapshot(args.directory, args.database)
+        print(f"Imported {args.directory} into {args.database}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,391 @@
+import threading
+import time
+from collections import deque
+from flask import g, has_request_context, request
+
+# Upper bounds in seconds; dashboard routes range from cached (sub-ms) to cold cube builds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+SQL_PREVIEW = 200
+
+def _sql_preview(sql, limit=SQL_PREVIEW):
+    text = ' '.join(str(sql).split())
+    return text if len(text) <= limit else text[:limit - 3] + '...'
+
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_label_value(value)}"' for name, value in zip(names, values)) + '}'
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def inc(self, labels=(), amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+
+    def observe(self, labels, value):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * len(self.buckets), 0, 0.0]
+        counts = series[0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        series[1] += 1
+        series[2] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        names = self.labelnames + ('le',)
+        for labels, (counts, count, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_labels(names, labels + (repr(bound),))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(names, labels + ('+Inf',))} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+class QueryRecord:
+    __slots__ = ('sql', 'parameters', 'offset', 'execute_seconds', 'fetch_seconds', 'rows', 'plan', 'closed')
+
+    def __init__(self, sql, parameters, offset):
+        self.sql = sql
+        self.parameters = parameters
+        self.offset = offset
+        self.execute_seconds = 0.0
+        self.fetch_seconds = 0.0
+        self.rows = 0
+        self.plan = None
+        self.closed = False
+
+    @property
+    def seconds(self):
+        return self.execute_seconds + self.fetch_seconds
+
+    def to_dict(self):
+        entry = {
+            'sql': _sql_preview(self.sql),
+            'start_ms': round(self.offset * 1000, 3),
+            'execute_ms': round(self.execute_seconds * 1000, 3),
+            'fetch_ms': round(self.fetch_seconds * 1000, 3),
+            'total_ms': round(self.seconds * 1000, 3),
+            'rows': self.rows
+        }
+        if self.plan is not None:
+            entry['plan'] = self.plan
+        return entry
+
+class RequestProfile:
+    """Queries issued while serving one request"""
+
+    def __init__(self, route, method):
+        self.route = route
+        self.method = method
+        self.started = time.perf_counter()
+        self.wall_started = time.time()
+        self.queries = []
+        self.seconds = None
+        self.status = None
+        self.explain_seconds = 0.0
+
+    def add(self, sql, parameters):
+        record = QueryRecord(sql, parameters, time.perf_counter() - self.started)
+        # list.append is atomic, so queries from run_concurrently() threads can land here too
+        self.queries.append(record)
+        return record
+
+    @property
+    def db_seconds(self):
+        """Wall time with at least one query in flight; concurrent queries overlap"""
+        total, covered_until = 0.0, 0.0
+        for start, end in sorted((q.offset, q.offset + q.seconds) for q in self.queries):
+            if end > covered_until:
+                total += end - max(start, covered_until)
+                covered_until = end
+        return total
+
+    @property
+    def python_seconds(self):
+        # Whatever is neither DuckDB nor our own EXPLAIN ANALYZE re-runs is Python
+        return max((self.seconds or 0.0) - self.db_seconds - self.explain_seconds, 0.0)
+
+    def to_dict(self, with_queries=True):
+        entry = {
+            'route': self.route,
+            'method': self.method,
+            'status': self.status,
+            'timestamp': self.wall_started,
+            'total_ms': round((self.seconds or 0.0) * 1000, 3),
+            'db_ms': round(self.db_seconds * 1000, 3),
+            'python_ms': round(self.python_seconds * 1000, 3),
+            'explain_ms': round(self.explain_seconds * 1000, 3),
+            'query_count': len(self.queries),
+            'rows': sum(q.rows for q in self.queries)
+        }
+        if with_queries:
+            entry['queries'] = [q.to_dict() for q in self.queries]
+        return entry
+
+class ProfiledCursor:
+    """DuckDB cursor proxy that times execute() and the fetches that read its result"""
+
+    __slots__ = ('_cursor', '_profiler', '_profile', '_record')
+
+    def __init__(self, cursor, profiler, profile):
+        self._cursor = cursor
+        self._profiler = profiler
+        self._profile = profile
+        self._record = None
+
+    def execute(self, query, parameters=None):
+        record = self._profile.add(query, parameters)
+        started = time.perf_counter()
+        try:
+            self._cursor.execute(query, parameters)
+        finally:
+            record.execute_seconds = time.perf_counter() - started
+        self._record = record
+        return self
+
+    def _fetch(self, method, *args):
+        record = self._record
+        started = time.perf_counter()
+        result = getattr(self._cursor, method)(*args)
+        if record is None:
+            return result
+        record.fetch_seconds += time.perf_counter() - started
+        if method == 'fetchone':
+            record.rows += result is not None
+        elif method in ('fetchall', 'fetchmany'):
+            record.rows += len(result)
+        elif hasattr(result, 'num_rows'):
+            record.rows += result.num_rows
+        elif hasattr(result, '__len__'):
+            record.rows += len(result)
+        # Every route reads a result with a single fetch, so the first one closes the record
+        if not record.closed:
+            record.closed = True
+            self._profiler.query_finished(self._profile, record, self._cursor)
+        return result
+
+    def fetchone(self):
+        return self._fetch('fetchone')
+
+    def fetchmany(self, size=1):
+        return self._fetch('fetchmany', size)
+
+    def fetchall(self):
+        return self._fetch('fetchall')
+
+    def df(self):
+        return self._fetch('df')
+
+    def fetchdf(self):
+        return self._fetch('fetchdf')
+
+    def arrow(self):
+        return self._fetch('arrow')
+
+    def fetch_arrow_table(self):
+        return self._fetch('fetch_arrow_table')
+
+    def fetchnumpy(self):
+        return self._fetch('fetchnumpy')
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class QueryProfiler:
+    """Per-request DuckDB query timing for the Flask app.
+
+    Cursors handed out during a request are wrapped so each execute() and the
+    fetch that reads its result are timed and their rows counted. When the
+    request finishes the totals go out as a Server-Timing header, into a ring
+    buffer served by the debug endpoint, and into Prometheus counters and
+    histograms. Queries slower than `slow_query_ms` are kept separately and,
+    with `explain_slow`, re-run once under EXPLAIN ANALYZE to capture the plan.
+    """
+
+    def __init__(self, enabled=True, slow_query_ms=250.0, explain_slow=False, history=200,
+                 explain_interval=60.0, ignore_paths=('/metrics', '/api/_debug/profile')):
+        self.enabled = enabled
+        self.slow_query_seconds = slow_query_ms / 1000.0
+        self.explain_slow = explain_slow
+        self.explain_interval = explain_interval
+        self.ignore_paths = set(ignore_paths)
+        self.recent = deque(maxlen=history)
+        self.slow_queries = deque(maxlen=history)
+        self._explained = {}
+        self._lock = threading.Lock()
+
+        route = ('route',)
+        self.requests_total = Counter(
+            'cmdb_http_requests_total', 'HTTP requests served.', ('route', 'method', 'status'))
+        self.request_seconds = Histogram(
+            'cmdb_http_request_duration_seconds', 'Wall time per HTTP request.', route)
+        self.python_seconds = Histogram(
+            'cmdb_http_request_python_seconds', 'Request time not spent in DuckDB.', route)
+        self.query_seconds = Histogram(
+            'cmdb_db_query_duration_seconds', 'DuckDB execute plus fetch time per query.', route)
+        self.query_rows = Counter('cmdb_db_query_rows_total', 'Rows fetched from DuckDB.', route)
+        self.slow_total = Counter('cmdb_db_slow_queries_total', 'Queries over the slow-query threshold.', route)
+        self._metrics = [self.requests_total, self.request_seconds, self.python_seconds,
+                         self.query_seconds, self.query_rows, self.slow_total]
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    def current(self):
+        return g.get('query_profile') if has_request_context() else None
+
+    def wrap(self, cursor):
+        """The cursor itself outside a profiled request, otherwise a timing proxy"""
+        profile = self.current()
+        if profile is None:
+            return cursor
+        return ProfiledCursor(cursor, self, profile)
+
+    def _before_request(self):
+        if not self.enabled or request.path in self.ignore_paths:
+            return
+        rule = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        g.query_profile = RequestProfile(rule, request.method)
+
+    def _after_request(self, response):
+        profile = g.pop('query_profile', None)
+        if profile is None:
+            return response
+        profile.seconds = time.perf_counter() - profile.started
+        profile.status = response.status_code
+        for record in profile.queries:
+            # Executed but never fetched (DDL, or a result that was discarded)
+            if not record.closed:
+                record.closed = True
+                self.query_finished(profile, record, None)
+        response.headers['Server-Timing'] = self.server_timing(profile)
+        self._record_request(profile)
+        return response
+
+    def server_timing(self, profile, top=5):
+        entries = [
+            f'db;dur={profile.db_seconds * 1000:.2f};desc="{len(profile.queries)} queries"',
+            f'py;dur={profile.python_seconds * 1000:.2f}',
+            f'total;dur={(profile.seconds or 0.0) * 1000:.2f}'
+        ]
+        if profile.explain_seconds:
+            entries.append(f'explain;dur={profile.explain_seconds * 1000:.2f}')
+        slowest = sorted(profile.queries, key=lambda q: q.seconds, reverse=True)[:top]
+        for i, query in enumerate(slowest):
+            desc = _sql_preview(query.sql, 60).replace('"', "'").replace('\\', '/')
+            entries.append(f'q{i};dur={query.seconds * 1000:.2f};desc="{desc}"')
+        return ', '.join(entries)
+
+    def query_finished(self, profile, record, cursor):
+        if record.seconds < self.slow_query_seconds:
+            return
+        if cursor is not None and self.explain_slow and self._should_explain(record.sql):
+            # A sibling cursor, so the caller's result set is left untouched
+            explain = cursor.cursor()
+            started = time.perf_counter()
+            try:
+                plan = explain.execute(f"EXPLAIN ANALYZE {record.sql}", record.parameters).fetchall()
+                record.plan = '\n'.join(row[1] for row in plan)
+            except Exception as e:
+                record.plan = f"EXPLAIN ANALYZE failed: {e}"
+            finally:
+                explain.close()
+                profile.explain_seconds += time.perf_counter() - started
+        with self._lock:
+            self.slow_total.inc((profile.route,))
+            self.slow_queries.append(dict(record.to_dict(), route=profile.route, timestamp=time.time()))
+
+    def _should_explain(self, sql):
+        # The plan comes from re-running the query, so capture it at most once per interval
+        now = time.monotonic()
+        with self._lock:
+            if now - self._explained.get(sql, float('-inf')) < self.explain_interval:
+                return False
+            self._explained[sql] = now
+            if len(self._explained) > 4 * self.recent.maxlen:
+                self._explained = {k: v for k, v in self._explained.items() if now - v < self.explain_interval}
+            return True
+
+    def _record_request(self, profile):
+        route = (profile.route,)
+        with self._lock:
+            self.recent.append(profile)
+            self.requests_total.inc((profile.route, profile.method, str(profile.status)))
+            self.request_seconds.observe(route, profile.seconds)
+            self.python_seconds.observe(route, profile.python_seconds)
+            for query in profile.queries:
+                self.query_seconds.observe(route, query.seconds)
+            rows = sum(q.rows for q in profile.queries)
+            if rows:
+                self.query_rows.inc(route, rows)
+
+    def snapshot(self, route=None, limit=50):
+        """Recent profiles, slow queries and per-route averages for the debug endpoint"""
+        with self._lock:
+            recent = [p for p in self.recent if route is None or p.route == route]
+            slow = [q for q in self.slow_queries if route is None or q['route'] == route]
+
+        routes = {}
+        for profile in recent:
+            stats = routes.setdefault(profile.route, {'requests': 0, 'total_ms': 0.0, 'db_ms': 0.0,
+                                                       'python_ms': 0.0, 'queries': 0, 'max_ms': 0.0})
+            total_ms = (profile.seconds or 0.0) * 1000
+            stats['requests'] += 1
+            stats['total_ms'] += total_ms
+            stats['db_ms'] += profile.db_seconds * 1000
+            stats['python_ms'] += profile.python_seconds * 1000
+            stats['queries'] += len(profile.queries)
+            stats['max_ms'] = max(stats['max_ms'], total_ms)
+        summary = {
+            name: {
+                'requests': s['requests'],
+                'avg_total_ms': round(s['total_ms'] / s['requests'], 3),
+                'avg_db_ms': round(s['db_ms'] / s['requests'], 3),
+                'avg_python_ms': round(s['python_ms'] / s['requests'], 3),
+                'avg_queries': round(s['queries'] / s['requests'], 2),
+                'max_ms': round(s['max_ms'], 3)
+            }
+            for name, s in sorted(routes.items())
+        }
+        return {
+            'enabled': self.enabled,
+            'slow_query_ms': self.slow_query_seconds * 1000,
+            'explain_slow': self.explain_slow,
+            'routes': summary,
+            'recent': [p.to_dict() for p in reversed(recent[-limit:])],
+            'slow_queries': list(reversed(slow[-limit:]))
+        }
+
+    def render_metrics(self):
+        with self._lock:
+            lines = [line for metric in self._metrics for line in metric.render()]
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,86 @@
+import functools
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from flask import current_app, request
+
+class ResponseCache:
+    """In-process cache of successful JSON responses, keyed by path + query args.
+
+    Entries are tagged with the data version returned by `version_fn`; a new
+    version (i.e. a new ingest) makes every entry stale. Concurrent misses on
+    the same key wait for one computation instead of all hitting DuckDB, and
+    each response carries a content ETag so unchanged payloads revalidate as 304.
+    """
+
+    def __init__(self, version_fn, max_entries=512):
+        self.version_fn = version_fn
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def _put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    @contextmanager
+    def _computing(self, key):
+        # One lock per key being computed, never shared between keys: a view may
+        # compute other cached views (/api/batch) while holding its own
+        with self._lock:
+            entry = self._inflight.get(key)
+            if entry is None:
+                entry = self._inflight[key] = [threading.Lock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._inflight[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def cached(self, view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            version = self.version_fn()
+            key = (request.path, tuple(sorted(request.args.items(multi=True))))
+
+            entry = self._get(key, version)
+            if entry is None:
+                with self._computing(key):
+                    entry = self._get(key, version)
+                    if entry is None:
+                        response = current_app.make_response(view(*args, **kwargs))
+                        if response.status_code != 200:
+                            return response
+                        body = response.get_data()
+                        etag = hashlib.sha1(body).hexdigest()
+                        entry = (version, body, response.mimetype, etag)
+                        self._put(key, entry)
+
+            _, body, mimetype, etag = entry
+            response = current_app.response_class(body, mimetype=mimetype)
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response.make_conditional(request)
+
+        return wrapper
@@ -1,23 +1,62 @@
-import json
 import duckdb
 import os
-import re
 from google.cloud import bigquery
 from google.oauth2 import service_account
 from typing import Dict, List, Set, Tuple, Optional
 import logging
 from collections import defaultdict
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
 import threading
 import platform
 import subprocess
+import argparse
+from coverage_snapshot import build_host_coverage
+from dimension_bridges import build_dimension_bridges
+from host_search import build_host_search_index
+from coverage_history import record_coverage_history
+from table_scheduler import TableScheduler, AdaptiveConcurrency, is_quota_error
+from ingest_watermarks import TABLE_SIGNATURE, load_watermarks, save_watermark
+import normalization
+from column_classifier import ColumnClassifier, discover_metadata_columns
+from ingest_journal import RunJournal
+from parquet_snapshot import export_snapshot
+from db_versions import DatabaseVersions
+
+try:
+    import arrow_ingest
+except ImportError:  # pyarrow not installed: row-by-row ingest only
+    arrow_ingest = None
+from cmdb_metadata import bump_generation
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s | %(message)s', datefmt='%H:%M:%S')
 logger = logging.getLogger(__name__)
 
+ATTRIBUTE_COLUMNS = [
+    'fqdn', 'domain', 'infrastructure_type', 'region', 'country',
+    'data_center', 'cloud_region', 'ip_address', 'class', 'system_classification',
+    'business_unit', 'apm', 'cio', 'edr_coverage', 'tanium_coverage',
+    'dlp_agent_coverage', 'logging_in_splunk', 'logging_in_gso',
+    'present_in_crowdstrike', 'present_in_cmdb'
+]
+
+# A 'yes' from any source table overrides whatever the others said
+YES_WINS_COLUMNS = ['present_in_crowdstrike', 'present_in_cmdb', 'logging_in_splunk']
+
+# Source tables whose mere presence of a host sets a flag
+SPECIAL_TABLES = {
+    'prj-fisv-p-gcss-sas-dl9dd0f1df.SAS_BI.V_DIM_ENDPOINTAGENT': 'present_in_crowdstrike',
+    'prj-fisv-p-gcss-sas-dl9dd0f1df.SAS_BI.V_DIM_ENDPOINT': 'present_in_cmdb',
+    'prj-fisv-p-gcss-sas-dl9dd0f1df.SAS_BI.V_SPL_ENDPOINT_LOG': 'logging_in_splunk'
+}
+
+# Unit separator; never part of a hostname or attribute value we keep
+FIELD_SEPARATOR = '\x1f'
+
 class OptimizedCMDBProcessor:
-    def __init__(self, json_file_path: str, duckdb_path: str = "universal_cmdb.db"):
+    def __init__(self, json_file_path: str, duckdb_path: str = "universal_cmdb.db",
+                 merge_threshold: int = 1_000_000, streaming: bool = True, bq_client=None,
+                 full_refresh: bool = False, max_fetch_workers: int = 8, resume: bool = True,
+                 export_format: str = 'parquet', publish: bool = True):
         print("\n" + "=" * 80)
         print("OPTIMIZED CMDB PROCESSOR - ENHANCED VERSION")
         print("=" * 80 + "\n")
@@ -25,6 +64,24 @@ class OptimizedCMDBProcessor:
         self.json_file_path = json_file_path
         self.duckdb_path = duckdb_path
         self.db_lock = threading.Lock()
+        self.merge_threshold = merge_threshold
+        self.streaming = streaming and arrow_ingest is not None
+        if streaming and arrow_ingest is None:
+            print("pyarrow not available, falling back to row-by-row ingest")
+        self._staged_total = 0
+        self._staged_pending = 0
+        self.full_refresh = full_refresh
+        self.resume = resume
+        self.max_fetch_workers = max_fetch_workers
+        self.export_format = export_format
+        self._pending_watermarks = {}
+        self._watermark_seen = {}
+        self._failed_tables = set()
+        self._table_info = {}
+        # Journal progress staged alongside the rows it describes, committed by the merge
+        self._journal_progress = {}
+        self._journal_finished = set()
+        self._emit = None
         
         self.column_mapping = {
             'fqdn': 'fqdn', 'domain': 'domain', 'host': 'host',
@@ -69,23 +126,54 @@ class OptimizedCMDBProcessor:
             'fqdn': ['fqdn', 'full_name', 'qualified_name']
         }
         
+        self.classifier = ColumnClassifier(self.column_mapping, self.hostname_patterns, self.advanced_patterns)
+        
         self.stats = defaultdict(int)
-        self.existing_hosts = {}
         
-        self._init_bigquery()
-        self.duck_conn = duckdb.connect(duckdb_path)
+        self.bqstorage_client = None
+        if bq_client is not None:
+            self.bq_client = bq_client
+        else:
+            self._init_bigquery()
+        # Build into a private copy and publish it when done, so the API keeps
+        # reading the previous version without lock conflicts or partial merges
+        self.versions = DatabaseVersions(duckdb_path) if publish else None
+        self.build_path = self.versions.prepare() if publish else duckdb_path
+        self.duck_conn = duckdb.connect(self.build_path)
         self._create_table()
-        self._load_existing_hosts()
-        
-        print(f"Loaded {len(self.existing_hosts)} existing hosts\n")
+        self.watermarks = load_watermarks(self.duck_conn)
+        self.journal = RunJournal(self.duck_conn)
+        self._stage_sql = self._stage_batch_sql()
+        self._merged_sql, self._upsert_sql = self._merge_sql()
+        
+        # Known hosts stay in DuckDB; the merge joins against universal_cmdb
+        # directly, so startup cost no longer grows with the table
+        existing = self.duck_conn.execute("SELECT COUNT(*) FROM universal_cmdb").fetchone()[0]
+        print(f"Found {existing:,} existing hosts\n")
     
     def _init_bigquery(self):
+        replay_dir = os.getenv('CMDB_REPLAY_DIR')
+        if replay_dir:
+            if arrow_ingest is None:
+                raise RuntimeError("CMDB_REPLAY_DIR needs pyarrow")
+            print(f"Replaying BigQuery results from {replay_dir}")
+            self.bq_client = arrow_ingest.ArrowReplayClient(replay_dir)
+            return
+
         service_account_file = os.getenv('GCP_SERVICE_ACCOUNT_FILE', 'gcp/gcp_prod_key.json')
+        credentials = None
         if os.path.exists(service_account_file):
             credentials = service_account.Credentials.from_service_account_file(service_account_file)
             self.bq_client = bigquery.Client(project="chronicle-fisv", credentials=credentials)
         else:
             self.bq_client = bigquery.Client(project="chronicle-fisv")
+
+        if self.streaming:
+            try:
+                from google.cloud import bigquery_storage
+                self.bqstorage_client = bigquery_storage.BigQueryReadClient(credentials=credentials)
+            except ImportError:
+                print("google-cloud-bigquery-storage not installed, streaming via the REST API")
     
     def _create_table(self):
         create_sql = """
@@ -121,147 +209,58 @@ class OptimizedCMDBProcessor:
         """
         self.duck_conn.execute(create_sql)
         
-        try:
-            self.duck_conn.execute("CREATE INDEX IF NOT EXISTS idx_host ON universal_cmdb(host)")
-        except:
-            pass
-    
-    def _load_existing_hosts(self):
-        try:
-            query = """
-            SELECT host, source_tables, fqdn, domain,
-                   infrastructure_type, region, country, data_center, cloud_region,
-                   ip_address, class, system_classification, business_unit, apm,
-                   cio, edr_coverage, tanium_coverage, dlp_agent_coverage,
-                   logging_in_splunk, logging_in_gso, present_in_crowdstrike,
-                   present_in_cmdb, source_count
-            FROM universal_cmdb
-            """
-            for row in self.duck_conn.execute(query).fetchall():
-                self.existing_hosts[row[0]] = {
-                    'source_tables': row[1],
-                    'fqdn': row[2],
-                    'domain': row[3],
-                    'infrastructure_type': row[4],
-                    'region': row[5],
-                    'country': row[6],
-                    'data_center': row[7],
-                    'cloud_region': row[8],
-                    'ip_address': row[9],
-                    'class': row[10],
-                    'system_classification': row[11],
-                    'business_unit': row[12],
-                    'apm': row[13],
-                    'cio': row[14],
-                    'edr_coverage': row[15],
-                    'tanium_coverage': row[16],
-                    'dlp_agent_coverage': row[17],
-                    'logging_in_splunk': row[18],
-                    'logging_in_gso': row[19],
-                    'present_in_crowdstrike': row[20],
-                    'present_in_cmdb': row[21],
-                    'source_count': row[22]
-                }
-        except:
-            pass
+        # host is already the primary key; a second ART index on it only makes
+        # every upsert maintain two indexes
+        self.duck_conn.execute("DROP INDEX IF EXISTS idx_host")
+        
+        # Batches accumulate here and are merged into universal_cmdb with one
+        # statement per merge_threshold rows instead of one per record
+        self.duck_conn.execute(f"""
+        CREATE TEMP TABLE IF NOT EXISTS cmdb_staging (
+            seq BIGINT,
+            host VARCHAR,
+            table_name VARCHAR,
+            {', '.join(f'{col} VARCHAR' for col in ATTRIBUTE_COLUMNS)}
+        )
+        """)
     
     def normalize_hostname(self, hostname: str) -> str:
         """Normalize hostname for use as primary key"""
-        if not hostname or not isinstance(hostname, str) or hostname.strip() == '*Undefined':
-            return ""
-        normalized = hostname.lower().strip()
-        if '.' in normalized:
-            normalized = normalized.split('.')[0]
-        normalized = normalized.replace('-', '')
-        normalized = re.sub(r'[^a-z0-9]', '', normalized)
-        return normalized if len(normalized) > 1 else ""
+        return normalization.normalize_hostname(hostname)
     
     def normalize_fqdn(self, fqdn: str) -> str:
         """Normalize FQDN by converting to lowercase"""
-        if not fqdn or not isinstance(fqdn, str) or fqdn.strip() == '*Undefined':
-            return ""
-        return fqdn.lower().strip()
+        return normalization.normalize_fqdn(fqdn)
     
     def normalize_region(self, region: str) -> str:
         """Normalize region values"""
-        if not region or not isinstance(region, str):
-            return region
-        
-        region = region.strip().lower()  # Apply lowercase here
-        # Convert NA to North America (but lowercase)
-        if region.upper() in ['NA', 'N.A.', 'N/A']:
-            return 'north america'
-        elif region == 'north america':
-            return 'north america'
-        return region
+        return normalization.normalize_region(region)
     
     def normalize_country(self, country: str) -> str:
         """Normalize country values"""
-        if not country or not isinstance(country, str):
-            return country
-        
-        country = country.strip().lower()  # Apply lowercase here
-        # Convert USA to United States (but lowercase)
-        if country.upper() in ['USA', 'U.S.A.', 'US', 'U.S.']:
-            return 'united states'
-        elif country == 'united states':
-            return 'united states'
-        return country
+        return normalization.normalize_country(country)
     
     def normalize_value(self, value: str) -> str:
         """Normalize any string value by converting to lowercase"""
-        if not value or not isinstance(value, str):
-            return value
-        return value.strip().lower()
+        return normalization.normalize_value(value)
     
     def is_valid_value(self, value) -> bool:
-        if not value:
-            return False
-        if isinstance(value, str):
-            stripped = value.strip()
-            return stripped != '' and stripped != '*Undefined' and stripped.lower() not in ['null', 'none', 'undefined']
-        return True
+        return normalization.is_valid_value(value)
     
     def identify_column_type(self, column_name: str, column_type) -> Optional[str]:
-        column_lower = column_name.lower()
-        type_lower = str(column_type).lower() if column_type else ""
-        
-        if isinstance(column_type, str) and type_lower in self.column_mapping:
-            return self.column_mapping[type_lower]
-        
-        for pattern in self.hostname_patterns:
-            if pattern in column_lower:
-                return 'host'
-        
-        for target_type, patterns in self.advanced_patterns.items():
-            for pattern in patterns:
-                if pattern in column_lower or pattern in type_lower:
-                    return target_type
-        
-        return None
+        return self.classifier.classify(column_name, column_type)
     
-    def load_metadata(self) -> Dict:
-        print("Loading metadata...")
-        with open(self.json_file_path, 'r') as f:
-            metadata = json.load(f)
-        if 'columns' in metadata:
-            print(f"Found {len(metadata['columns'])} tables\n")
-        return metadata
-    
-    def discover_columns(self, metadata: Dict) -> List[Tuple[str, str, str]]:
+    def discover_from_file(self):
+        """Stream-classify the metadata file, reusing the on-disk result when the file is unchanged"""
         print("Discovering columns...")
-        discovered = []
-        
-        for table_name, columns in metadata.get('columns', {}).items():
-            for column_name, column_type in columns.items():
-                mapped_type = self.identify_column_type(column_name, column_type)
-                if mapped_type:
-                    discovered.append((table_name, column_name, mapped_type))
-        
-        print(f"Discovered {len(discovered)} relevant columns\n")
-        return discovered
+        discovery, cached = discover_metadata_columns(self.json_file_path, self.classifier)
+        source = "cached classification" if cached else "metadata"
+        print(f"Found {discovery.table_count} tables, discovered {len(discovery.discovered)} "
+              f"relevant columns ({source})\n")
+        return discovery
     
-    def process_table(self, table_name: str, table_columns: List[Tuple[str, str, str]]) -> int:
+    def process_table(self, table_name: str, table_columns: List[Tuple[str, str, str]],
+                      watermark_column: Optional[str] = None) -> int:
         hostname_cols = [(col, ctype) for _, col, ctype in table_columns if ctype == 'host']
         attribute_cols = [(col, ctype) for _, col, ctype in table_columns if ctype != 'host']
         
@@ -272,15 +271,43 @@ class OptimizedCMDBProcessor:
         all_columns = [primary_hostname_col] + [col for col, _ in attribute_cols]
         attribute_types = [ctype for _, ctype in attribute_cols]
         
+        progress = self.journal.progress(table_name) if self.journal.resumed else None
+        if progress and progress.status == 'done':
+            print(f"  {table_name} already merged by the interrupted run, skipping")
+            self.stats['tables_resumed'] += 1
+            return 0
+        
         print(f"Processing {table_name}: {len(all_columns)} columns")
         
+        previous = None if self.full_refresh else self.watermarks.get(table_name)
+        select_list = ', '.join(f'`{col}`' for col in all_columns)
+        incremental = ''
+        signature = None
+        
+        if watermark_column:
+            # Fetch only rows written since the last merged run; the watermark is
+            # carried along as the last column so the new high-water mark is known
+            watermark_expr = f"CAST(`{watermark_column}` AS STRING)"
+            select_list += f", {watermark_expr} AS cmdb_watermark"
+            if previous and previous[0] == watermark_column and previous[1]:
+                escaped = previous[1].replace('\\', '\\\\').replace("'", "\\'")
+                incremental = f"AND {watermark_expr} > '{escaped}'"
+                print(f"  Incremental fetch of {table_name} past {watermark_column} = {previous[1]}")
+        else:
+            signature = self._table_signature(table_name)
+            if signature and previous == (TABLE_SIGNATURE, signature):
+                print(f"  {table_name} unchanged since last run, skipping")
+                self.stats['tables_skipped'] += 1
+                return 0
+        
         # Optimize query with LIMIT for very large tables
         query = f"""
-        SELECT {', '.join(f'`{col}`' for col in all_columns)}
+        SELECT {select_list}
         FROM `{table_name}`
         WHERE `{primary_hostname_col}` IS NOT NULL 
         AND `{primary_hostname_col}` != ''
         AND `{primary_hostname_col}` != '*Undefined'
+        {incremental}
         """
         
         max_retries = 3
@@ -288,50 +315,156 @@ class OptimizedCMDBProcessor:
         
         while retry_count < max_retries:
             try:
-                query_job = self.bq_client.query(query)
-                return self.process_results(query_job, table_name, attribute_types)
+                self._failed_tables.discard(table_name)
+                query_job, start_index, watermark = self._open_query(table_name, query, progress)
+                # Later attempts start over with a fresh job
+                progress = None
+                if self.journal.active:
+                    self._write(self._journal_start, table_name, getattr(query_job, 'job_id', None), start_index)
+                track = watermark_column is not None
+                if self.streaming:
+                    records = self.process_arrow_results(query_job, table_name, attribute_types, track,
+                                                         start_index, watermark)
+                else:
+                    records = self.process_results(query_job, table_name, attribute_types, track,
+                                                   start_index, watermark)
+                
+                if table_name in self._failed_tables:
+                    self._journal_failure(table_name, "result stream failed")
+                else:
+                    self._write(self._journal_fetched, table_name)
+                    if watermark_column:
+                        # Nothing new keeps the previous mark
+                        value = self._watermark_seen.pop(table_name, None)
+                        if value is None and previous and previous[0] == watermark_column:
+                            value = previous[1]
+                        self._stage_watermark(table_name, watermark_column, value, records)
+                    elif signature and not start_index:
+                        # A resumed job may predate the current signature; let the next run re-check
+                        self._stage_watermark(table_name, TABLE_SIGNATURE, signature, records)
+                return records
             except Exception as e:
                 retry_count += 1
                 error_msg = str(e)
                 
-                if "timeout" in error_msg.lower() or "deadline" in error_msg.lower():
+                if is_quota_error(e):
+                    # The scheduler backs off and lowers concurrency
+                    raise
+                elif "timeout" in error_msg.lower() or "deadline" in error_msg.lower():
                     print(f"Timeout processing {table_name}, retry {retry_count}/{max_retries}")
                     time.sleep(2 ** retry_count)  # Exponential backoff
                     continue
                 elif retry_count == max_retries:
                     print(f"Failed to process {table_name} after {max_retries} retries: {error_msg[:100]}")
+                    self._journal_failure(table_name, error_msg)
                     return 0
                 else:
                     print(f"Error processing {table_name}: {error_msg[:100]}")
+                    self._journal_failure(table_name, error_msg)
                     return 0
         
+        self._journal_failure(table_name, "timed out")
         return 0
     
-    def process_results(self, query_job, table_name: str, attribute_types: List[str]) -> int:
-        records_processed = 0
+    def _open_query(self, table_name: str, query: str, progress) -> Tuple[object, int, Optional[str]]:
+        """(query job, first row to read, watermark so far); a partial table of the
+        interrupted run continues its own job's results from the last merged row"""
+        if progress and progress.batch_offset and progress.job_id:
+            try:
+                job = self.bq_client.get_job(progress.job_id)
+                print(f"  Resuming {table_name} at row {progress.batch_offset:,} of job {progress.job_id}")
+                self.stats['tables_resumed'] += 1
+                return job, progress.batch_offset, progress.watermark
+            except Exception as e:
+                print(f"  Cannot resume {table_name} ({str(e)[:80]}), fetching from the start")
+        return self.bq_client.query(query), 0, None
+    
+    def _table_metadata(self, table_name: str):
+        """BigQuery table metadata, fetched once per run; None when unavailable"""
+        if table_name not in self._table_info:
+            try:
+                self._table_info[table_name] = self.bq_client.get_table(table_name)
+            except Exception:
+                self._table_info[table_name] = None
+        return self._table_info[table_name]
+    
+    def _estimate_rows(self, table_name: str) -> int:
+        table = self._table_metadata(table_name)
+        return (getattr(table, 'num_rows', None) or 0) if table is not None else 0
+    
+    def _table_signature(self, table_name: str) -> Optional[str]:
+        """modified time + row count of a BigQuery table; None for views or when unknown"""
+        table = self._table_metadata(table_name)
+        if table is None:
+            return None
+        if getattr(table, 'table_type', 'TABLE') != 'TABLE' or table.modified is None:
+            return None
+        return f"{table.modified.isoformat()}|{table.num_rows}"
+    
+    def _write(self, fn, *args):
+        """Run a DuckDB write here, or on the scheduler's writer thread when one is active"""
+        if self._emit is not None:
+            self._emit((fn, args))
+        else:
+            fn(*args)
+    
+    def _stage_watermark(self, table_name: str, column: str, value: Optional[str], rows: int):
+        # Queued behind the table's batches and written by the merge that commits them
+        self._write(self._remember_watermark, table_name, (column, value, rows))
+    
+    def _remember_watermark(self, table_name: str, watermark: Tuple[str, Optional[str], int]):
+        with self.db_lock:
+            self._pending_watermarks[table_name] = watermark
+    
+    def _journal_start(self, table_name: str, job_id: Optional[str], start_index: int):
+        with self.db_lock:
+            self.journal.start_table(table_name, job_id, start_index)
+    
+    def _journal_fetched(self, table_name: str):
+        # Becomes 'done' with the merge that commits the table's last rows
+        with self.db_lock:
+            self._journal_finished.add(table_name)
+    
+    def _journal_failure(self, table_name: str, error: str):
+        if self.journal.active:
+            self._write(self._journal_fail, table_name, error)
+    
+    def _journal_fail(self, table_name: str, error: str):
+        with self.db_lock:
+            self.journal.fail_table(table_name, error)
+    
+    def _note_progress(self, progress: Optional[Tuple[str, int, Optional[str]]], rows: int):
+        """Remember how far into its source a table's staged rows reach (caller holds db_lock)"""
+        if progress is None:
+            return
+        table_name, offset, watermark = progress
+        staged = self._journal_progress.get(table_name, (0, 0, None))[1]
+        self._journal_progress[table_name] = (offset, staged + rows, watermark)
+    
+    def process_results(self, query_job, table_name: str, attribute_types: List[str],
+                        track_watermark: bool = False, start_index: int = 0,
+                        watermark: Optional[str] = None) -> int:
+        records_processed = start_index
         batch_records = []
         batch_size = 5000  # Increased batch size for better performance
-        duplicates_found = 0
         
-        special_tables = {
-            'prj-fisv-p-gcss-sas-dl9dd0f1df.SAS_BI.V_DIM_ENDPOINTAGENT': 'present_in_crowdstrike',
-            'prj-fisv-p-gcss-sas-dl9dd0f1df.SAS_BI.V_DIM_ENDPOINT': 'present_in_cmdb',
-            'prj-fisv-p-gcss-sas-dl9dd0f1df.SAS_BI.V_SPL_ENDPOINT_LOG': 'logging_in_splunk'
-        }
-        
-        special_column = special_tables.get(table_name)
+        special_column = SPECIAL_TABLES.get(table_name)
         
         try:
-            for row in query_job:
+            rows = query_job.result(start_index=start_index) if start_index else query_job
+            for row in rows:
                 records_processed += 1
                 
+                if track_watermark and row[-1] is not None and (watermark is None or row[-1] > watermark):
+                    watermark = row[-1]
+                
                 if records_processed % 25000 == 0:
                     print(f"  Processed {records_processed:,} rows from {table_name}")
                 
-                if not row[0] or not self.is_valid_value(row[0]):
+                if not row[0] or not normalization.is_valid_value(row[0]):
                     continue
                 
-                normalized_host = self.normalize_hostname(row[0])
+                normalized_host = normalization.normalize_hostname(row[0])
                 if not normalized_host:
                     continue
                 
@@ -344,203 +477,276 @@ class OptimizedCMDBProcessor:
                     record_data[special_column] = 'yes'
                 
                 for i, attr_type in enumerate(attribute_types, 1):
-                    if i < len(row) and self.is_valid_value(row[i]):
+                    if i < len(row) and normalization.is_valid_value(row[i]):
                         value = str(row[i]).strip()
                         
                         # Apply normalizations - now all values get lowercased
                         if attr_type == 'fqdn':
-                            value = self.normalize_fqdn(value)
+                            value = normalization.normalize_fqdn(value)
                         elif attr_type == 'region':
-                            value = self.normalize_region(value)
+                            value = normalization.normalize_region(value)
                         elif attr_type == 'country':
-                            value = self.normalize_country(value)
+                            value = normalization.normalize_country(value)
                         elif attr_type == 'logging_in_splunk' and table_name == 'prj-fisv-p-gcss-sas-dl9dd0f1df.SAS_BI.V_SPL_ENDPOINT_LOG':
                             value = 'yes'
                         else:
                             # Apply lowercase normalization to all other string values
-                            value = self.normalize_value(value)
+                            value = normalization.normalize_value(value)
                         
                         record_data[attr_type] = value
                 
                 batch_records.append(record_data)
                 
                 if len(batch_records) >= batch_size:
-                    dups = self.save_batch(batch_records)
-                    duplicates_found += dups
+                    self._write(self.save_batch, batch_records, (table_name, records_processed, watermark))
                     batch_records = []
             
             # Process remaining records
             if batch_records:
-                dups = self.save_batch(batch_records)
-                duplicates_found += dups
+                self._write(self.save_batch, batch_records, (table_name, records_processed, watermark))
             
-            print(f"  Completed {table_name}: {records_processed:,} rows, {duplicates_found:,} duplicates merged")
+            print(f"  Completed {table_name}: {records_processed:,} rows staged")
             
         except Exception as e:
             print(f"  Error processing results for {table_name}: {str(e)[:100]}")
+            self._failed_tables.add(table_name)
             # Save any remaining records before error
             if batch_records:
                 try:
-                    dups = self.save_batch(batch_records)
-                    duplicates_found += dups
+                    self._write(self.save_batch, batch_records, (table_name, records_processed, watermark))
                 except:
                     pass
+            if is_quota_error(e):
+                raise
         
-        self.stats['total_records_processed'] += records_processed
-        self.stats['duplicate_hosts_found'] += duplicates_found
+        self.stats['total_records_processed'] += records_processed - start_index
+        if track_watermark and watermark is not None:
+            self._watermark_seen[table_name] = str(watermark)
         
-        return records_processed
+        return records_processed - start_index
     
-    def save_batch(self, records: List[Dict]) -> int:
-        duplicates = 0
-        
+    def process_arrow_results(self, query_job, table_name: str, attribute_types: List[str],
+                              track_watermark: bool = False, start_index: int = 0,
+                              watermark: Optional[str] = None) -> int:
+        """Streaming counterpart of process_results: whole Arrow record batches are
+        normalized column-wise and appended to the staging table"""
+        records_processed = start_index
+        staged = 0
+        special_column = SPECIAL_TABLES.get(table_name)
+
+        try:
+            rows = query_job.result(start_index=start_index) if start_index else query_job.result()
+            for batch in rows.to_arrow_iterable(bqstorage_client=self.bqstorage_client):
+                records_processed += batch.num_rows
+                if track_watermark:
+                    batch_max = arrow_ingest.string_max(batch.column(batch.num_columns - 1))
+                    if batch_max is not None and (watermark is None or batch_max > watermark):
+                        watermark = batch_max
+                table = arrow_ingest.normalize_batch(
+                    batch, table_name, attribute_types, ATTRIBUTE_COLUMNS, special_column)
+                if table.num_rows:
+                    self._write(self.save_arrow, table, (table_name, records_processed, watermark))
+                    staged += table.num_rows
+                print(f"  Processed {records_processed:,} rows from {table_name}")
+
+            print(f"  Completed {table_name}: {records_processed:,} rows, {staged:,} staged")
+        except Exception as e:
+            print(f"  Error processing results for {table_name}: {str(e)[:100]}")
+            self._failed_tables.add(table_name)
+            if is_quota_error(e):
+                raise
+
+        self.stats['total_records_processed'] += records_processed - start_index
+        if track_watermark and watermark is not None:
+            self._watermark_seen[table_name] = watermark
+
+        return records_processed - start_index
+
+    def _stage_batch_sql(self) -> str:
+        # One delimited string per column: binding a single VARCHAR is far cheaper
+        # than binding thousands of list elements; '' comes back as NULL
+        splits = ', '.join(f"UNNEST(string_split(?, '{FIELD_SEPARATOR}'))" for _ in range(2 + len(ATTRIBUTE_COLUMNS)))
+        return f"""
+        INSERT INTO cmdb_staging
+        SELECT seq, host, table_name, {', '.join(f"NULLIF({col}, '')" for col in ATTRIBUTE_COLUMNS)}
+        FROM (
+            SELECT UNNEST(range(?, ?)) AS seq, {splits}
+        ) AS staged(seq, host, table_name, {', '.join(ATTRIBUTE_COLUMNS)})
+        """
+
+    def _merge_sql(self) -> Tuple[str, str]:
+        """SELECT computing each staged host's merged row, and the upsert applying it.
+
+        Per host the staged rows are collapsed in arrival (seq) order and chained onto
+        the stored value: empty values are filled, a value is appended with " | "
+        unless the stored text already contains it, source tables are appended
+        with ", " and counted, and a 'yes' from any source wins outright for the
+        presence/logging flags.
+        """
+        def candidates(col):
+            # Stored value (when non-empty) followed by the batch's values in arrival order
+            return (f"CASE WHEN u.{col} IS NULL OR u.{col} = '' THEN COALESCE(b.{col}, []) "
+                    f"ELSE list_prepend(u.{col}, COALESCE(b.{col}, [])) END AS {col}")
+
+        def chain(col, separator):
+            # The one- and two-value cases cover nearly every host and skip the lambda
+            return (f"CASE len({col}) WHEN 0 THEN NULL WHEN 1 THEN {col}[1] "
+                    f"WHEN 2 THEN CASE WHEN contains({col}[1], {col}[2]) THEN {col}[1] "
+                    f"ELSE {col}[1] || '{separator}' || {col}[2] END "
+                    f"ELSE list_reduce({col}, (acc, v) -> CASE WHEN contains(acc, v) THEN acc "
+                    f"ELSE acc || '{separator}' || v END) END")
+
+        def arrival_order(col, value):
+            # list(... ORDER BY seq) sorts per aggregate and is ~10x slower than
+            # collecting (seq, value) pairs and sorting each small list afterwards
+            return (f"list_transform(list_sort(list({{'seq': seq, 'value': {value}}}) FILTER (WHERE {value} IS NOT NULL)), "
+                    f"x -> x.value) AS {col}")
+
+        aggregates = ', '.join(
+            [arrival_order('source_tables', 'table_name')] + [arrival_order(col, col) for col in ATTRIBUTE_COLUMNS])
+
+        merged = [f"{chain('source_tables', ', ')} AS source_tables"]
+        for col in ATTRIBUTE_COLUMNS:
+            expr = chain(col, ' | ')
+            if col in YES_WINS_COLUMNS:
+                expr = f"CASE WHEN list_contains({col}, 'yes') THEN 'yes' ELSE {expr} END"
+            merged.append(f"{expr} AS {col}")
+
+        # Every table appended to source_tables counts as one more source
+        count_tables = "CASE WHEN {0} IS NULL OR {0} = '' THEN 0 ELSE len(string_split({0}, ', ')) END"
+        source_count = (f"COALESCE(old_count, 0) + {count_tables.format('source_tables')} "
+                        f"- {count_tables.format('old_tables')}")
+
+        columns = ['source_tables'] + ATTRIBUTE_COLUMNS
+        changed = ' OR '.join(f"universal_cmdb.{col} IS DISTINCT FROM EXCLUDED.{col}" for col in columns)
+
+        merged_sql = f"""
+        SELECT host, {source_count} AS source_count, {', '.join(columns)}
+        FROM (
+            SELECT host, old_count, old_tables, {', '.join(merged)}
+            FROM (
+                SELECT b.host, u.source_count AS old_count, u.source_tables AS old_tables,
+                       {', '.join(candidates(col) for col in columns)}
+                FROM (
+                    SELECT host, {aggregates}
+                    FROM cmdb_staging
+                    GROUP BY host
+                ) b
+                LEFT JOIN universal_cmdb u USING (host)
+            )
+        )
+        """
+
+        # Materialized first: with the merge inlined, the upsert runs ~40x slower
+        upsert_sql = f"""
+        INSERT INTO universal_cmdb (host, source_count, {', '.join(columns)})
+        SELECT host, source_count, {', '.join(columns)} FROM cmdb_merged
+        ON CONFLICT (host) DO UPDATE SET
+            source_count = EXCLUDED.source_count,
+            {', '.join(f"{col} = EXCLUDED.{col}" for col in columns)},
+            last_updated = now()
+        WHERE {changed}
+        """
+        return merged_sql, upsert_sql
+
+    def save_batch(self, records: List[Dict], progress: Optional[Tuple[str, int, Optional[str]]] = None):
+        """Stage one batch of normalized records, merging once enough have piled up.
+
+        `progress` is (table, source rows consumed, watermark so far) for the run journal.
+        """
+        def pack(values):
+            return FIELD_SEPARATOR.join((value or '').replace(FIELD_SEPARATOR, ' ') for value in values)
+
+        staged = [pack(r['host'] for r in records), pack(r['table_name'] for r in records)]
+        staged += [pack(r.get(col) for r in records) for col in ATTRIBUTE_COLUMNS]
+
         with self.db_lock:
-            # Start transaction for better performance
-            self.duck_conn.execute("BEGIN TRANSACTION")
-            
+            start = self._staged_total
+            self.duck_conn.execute(self._stage_sql, [start, start + len(records)] + staged)
+            self._staged_total += len(records)
+            self._staged_pending += len(records)
+            self._note_progress(progress, len(records))
+
+            if self._staged_pending >= self.merge_threshold:
+                self._merge_staged()
+
+    def save_arrow(self, table, progress: Optional[Tuple[str, int, Optional[str]]] = None):
+        """Stage a normalized Arrow table (host, table_name, *ATTRIBUTE_COLUMNS)"""
+        with self.db_lock:
+            start = self._staged_total
+            table = arrow_ingest.with_sequence(table, start)
+            self.duck_conn.register('arrow_batch', table)
             try:
-                for record in records:
-                    host = record['host']
-                    
-                    if host in self.existing_hosts:
-                        duplicates += 1
-                        self.update_existing_host(host, record)
-                    else:
-                        self.insert_new_host(record)
-                        self.existing_hosts[host] = self.build_host_data(record)
-                
+                self.duck_conn.execute("INSERT INTO cmdb_staging SELECT * FROM arrow_batch")
+            finally:
+                self.duck_conn.unregister('arrow_batch')
+            self._staged_total += table.num_rows
+            self._staged_pending += table.num_rows
+            self._note_progress(progress, table.num_rows)
+
+            if self._staged_pending >= self.merge_threshold:
+                self._merge_staged()
+
+    def merge_staged(self):
+        with self.db_lock:
+            self._merge_staged()
+
+    def _merge_staged(self):
+        if not self._staged_pending:
+            if self._pending_watermarks or self._journal_progress or self._journal_finished:
+                self.duck_conn.execute("BEGIN TRANSACTION")
+                self._write_watermarks()
+                self._write_journal()
                 self.duck_conn.execute("COMMIT")
-            except Exception as e:
-                self.duck_conn.execute("ROLLBACK")
-                print(f"Batch save error: {e}")
-                raise
-        
-        return duplicates
-    
-    def build_host_data(self, record: Dict) -> Dict:
-        return {
-            'source_tables': record['table_name'],
-            'fqdn': record.get('fqdn'),
-            'domain': record.get('domain'),
-            'infrastructure_type': record.get('infrastructure_type'),
-            'region': record.get('region'),
-            'country': record.get('country'),
-            'data_center': record.get('data_center'),
-            'cloud_region': record.get('cloud_region'),
-            'ip_address': record.get('ip_address'),
-            'class': record.get('class'),
-            'system_classification': record.get('system_classification'),
-            'business_unit': record.get('business_unit'),
-            'apm': record.get('apm'),
-            'cio': record.get('cio'),
-            'edr_coverage': record.get('edr_coverage'),
-            'tanium_coverage': record.get('tanium_coverage'),
-            'dlp_agent_coverage': record.get('dlp_agent_coverage'),
-            'logging_in_splunk': record.get('logging_in_splunk'),
-            'logging_in_gso': record.get('logging_in_gso'),
-            'present_in_crowdstrike': record.get('present_in_crowdstrike'),
-            'present_in_cmdb': record.get('present_in_cmdb'),
-            'source_count': 1
-        }
-    
-    def insert_new_host(self, record: Dict):
-        columns = ['host', 'source_tables', 'source_count']
-        values = [record['host'], record['table_name'], 1]
-        
-        attribute_columns = [
-            'fqdn', 'domain', 'infrastructure_type', 'region', 'country',
-            'data_center', 'cloud_region', 'ip_address', 'class', 'system_classification',
-            'business_unit', 'apm', 'cio', 'edr_coverage', 'tanium_coverage',
-            'dlp_agent_coverage', 'logging_in_splunk', 'logging_in_gso',
-            'present_in_crowdstrike', 'present_in_cmdb'
-        ]
-        
-        for col in attribute_columns:
-            if col in record and record[col]:
-                columns.append(col)
-                values.append(record[col])
-        
-        placeholders = ', '.join(['?' for _ in values])
-        insert_sql = f"INSERT INTO universal_cmdb ({', '.join(columns)}) VALUES ({placeholders})"
-        
+            return
+
+        started = time.time()
+        self.duck_conn.execute("BEGIN TRANSACTION")
+
         try:
-            self.duck_conn.execute(insert_sql, values)
-            self.stats['hosts_created'] += 1
+            hosts, new_hosts = self.duck_conn.execute("""
+                SELECT COUNT(*), COUNT(*) FILTER (WHERE u.host IS NULL)
+                FROM (SELECT DISTINCT host FROM cmdb_staging) s
+                LEFT JOIN universal_cmdb u USING (host)
+            """).fetchone()
+            self.duck_conn.execute(f"CREATE OR REPLACE TEMP TABLE cmdb_merged AS {self._merged_sql}")
+            self.duck_conn.execute(self._upsert_sql)
+            self.duck_conn.execute("DELETE FROM cmdb_staging")
+            self._write_watermarks()
+            self._write_journal()
+
+            self.duck_conn.execute("COMMIT")
         except Exception as e:
-            if "duplicate" not in str(e).lower():
-                print(f"Insert error: {e}")
-    
-    def update_existing_host(self, host: str, record: Dict):
-        existing = self.existing_hosts[host]
-        updates = []
-        values = []
-        
-        current_tables = existing.get('source_tables', '')
-        table_name = record['table_name']
-        
-        if table_name not in current_tables:
-            new_tables = f"{current_tables}, {table_name}" if current_tables else table_name
-            updates.append("source_tables = ?")
-            values.append(new_tables)
-            existing['source_tables'] = new_tables
-            
-            new_count = existing.get('source_count', 0) + 1
-            updates.append("source_count = ?")
-            values.append(new_count)
-            existing['source_count'] = new_count
-        
-        attribute_columns = [
-            'fqdn', 'domain', 'infrastructure_type', 'region', 'country',
-            'data_center', 'cloud_region', 'ip_address', 'class', 'system_classification',
-            'business_unit', 'apm', 'cio', 'edr_coverage', 'tanium_coverage',
-            'dlp_agent_coverage', 'logging_in_splunk', 'logging_in_gso',
-            'present_in_crowdstrike', 'present_in_cmdb'
-        ]
-        
-        for col in attribute_columns:
-            if col in record and record[col]:
-                new_value = record[col]
-                existing_value = existing.get(col)
-                
-                if col in ['present_in_crowdstrike', 'present_in_cmdb'] and new_value == 'yes':
-                    if existing_value != 'yes':
-                        updates.append(f"{col} = ?")
-                        values.append('yes')
-                        existing[col] = 'yes'
-                elif col == 'logging_in_splunk' and new_value == 'yes':
-                    if existing_value != 'yes':
-                        updates.append(f"{col} = ?")
-                        values.append('yes')
-                        existing[col] = 'yes'
-                elif existing_value and new_value != existing_value:
-                    if new_value not in str(existing_value):
-                        merged_value = f"{existing_value} | {new_value}"
-                        updates.append(f"{col} = ?")
-                        values.append(merged_value)
-                        existing[col] = merged_value
-                elif not existing_value:
-                    updates.append(f"{col} = ?")
-                    values.append(new_value)
-                    existing[col] = new_value
-        
-        if updates:
-            updates.append("last_updated = CURRENT_TIMESTAMP")
-            values.append(host)
-            
-            update_sql = f"UPDATE universal_cmdb SET {', '.join(updates)} WHERE host = ?"
-            
-            try:
-                self.duck_conn.execute(update_sql, values)
-                self.stats['hosts_updated'] += 1
-            except Exception as e:
-                print(f"Update error: {e}")
+            self.duck_conn.execute("ROLLBACK")
+            print(f"Batch merge error: {e}")
+            raise
+
+        self.stats['hosts_created'] += new_hosts
+        self.stats['hosts_updated'] += hosts - new_hosts
+        # Every staged record beyond a host's first sighting is a duplicate merged in
+        self.stats['duplicate_hosts_found'] += self._staged_pending - new_hosts
+        print(f"  Merged {self._staged_pending:,} staged records into {hosts:,} hosts "
+              f"({new_hosts:,} new) in {time.time() - started:.2f}s")
+        self._staged_pending = 0
+    
+    def _write_watermarks(self):
+        for table_name, (column, value, rows) in self._pending_watermarks.items():
+            save_watermark(self.duck_conn, table_name, column, value, rows)
+            self.watermarks[table_name] = (column, value)
+        self._pending_watermarks = {}
+    
+    def _write_journal(self):
+        if self.journal.active:
+            self.journal.commit_progress(self._journal_progress, self._journal_finished)
+        self._journal_progress = {}
+        self._journal_finished = set()
     
     def process_all(self):
         print("Starting CMDB processing...\n")
         start_time = time.time()
         
-        metadata = self.load_metadata()
-        discovered_columns = self.discover_columns(metadata)
+        discovery = self.discover_from_file()
+        discovered_columns = discovery.discovered
         
         if not discovered_columns:
             print("No processable columns found")
@@ -552,30 +758,59 @@ class OptimizedCMDBProcessor:
         
         print(f"Processing {len(columns_by_table)} tables\n")
         
-        # Process tables with ThreadPoolExecutor for better parallelism
-        max_workers = 3  # Adjust based on BigQuery quotas
+        run_id = self.journal.begin(resume=self.resume and not self.full_refresh)
+        if self.journal.resumed:
+            counts = self.journal.summary()
+            print(f"Resuming interrupted run {run_id}: {counts.get('done', 0)} tables already merged, "
+                  f"{sum(counts.values()) - counts.get('done', 0)} partial\n")
+        else:
+            print(f"Starting ingest run {run_id}\n")
         
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = []
-            
-            for idx, (table_name, table_columns) in enumerate(columns_by_table.items(), 1):
-                print(f"\n[{idx}/{len(columns_by_table)}] Submitting {table_name}")
-                future = executor.submit(self.process_table, table_name, table_columns)
-                futures.append((future, table_name))
-                self.stats['tables_processed'] += 1
-            
-            # Wait for all futures to complete
-            for future, table_name in futures:
-                try:
-                    result = future.result(timeout=600)  # 10 minute timeout per table
-                except Exception as e:
-                    print(f"Failed to process {table_name}: {e}")
+        # Largest tables first; fetch concurrency adapts to throughput and quota
+        # errors, while a single writer thread owns the DuckDB connection
+        estimates = [(table_name, self._estimate_rows(table_name)) for table_name in columns_by_table]
+        
+        def fetch(table_name):
+            watermark_column = discovery.watermark_columns.get(table_name)
+            return self.process_table(table_name, columns_by_table[table_name], watermark_column)
+        
+        scheduler = TableScheduler(fetch, lambda item: item[0](*item[1]),
+                                   AdaptiveConcurrency(initial=3, maximum=self.max_fetch_workers))
+        self._emit = scheduler.emit
+        try:
+            scheduler.run(estimates)
+        finally:
+            self._emit = None
+        
+        self.stats['tables_processed'] += len(scheduler.results)
+        for table_name, error in scheduler.errors.items():
+            print(f"Failed to process {table_name}: {error}")
+        if scheduler.write_errors:
+            raise RuntimeError(f"{len(scheduler.write_errors)} staging writes failed: {scheduler.write_errors[0]}")
+        print(f"\nFetch concurrency peaked at {scheduler.concurrency.peak} "
+              f"(limit history {scheduler.concurrency.history})")
         
         # Ensure all data is committed
+        self.merge_staged()
+        self.duck_conn.execute("CHECKPOINT")
+        
+        # Materialize coverage flags once so the API never re-scans the raw strings
+        build_host_coverage(self.duck_conn)
+        build_dimension_bridges(self.duck_conn)
+        build_host_search_index(self.duck_conn)
+        generation = bump_generation(self.duck_conn)
+        record_coverage_history(self.duck_conn, generation)
+        self.journal.finish()
         self.duck_conn.execute("CHECKPOINT")
         
         self.generate_report()
-        self.export_csv()
+        self.verify_build()
+        if self.export_format == 'parquet':
+            self.export_snapshot()
+        elif self.export_format == 'csv':
+            self.export_csv()
+        if self.versions:
+            self.publish(generation)
         
         total_time = time.time() - start_time
         print(f"\nProcessing complete in {total_time:.2f} seconds")
@@ -589,6 +824,8 @@ class OptimizedCMDBProcessor:
         
         print(f"\nTotal unique hosts: {total_hosts:,}")
         print(f"Tables processed: {self.stats['tables_processed']}")
+        print(f"Tables unchanged since last run: {self.stats['tables_skipped']}")
+        print(f"Tables resumed from an interrupted run: {self.stats['tables_resumed']}")
         print(f"Records processed: {self.stats['total_records_processed']:,}")
         print(f"New hosts created: {self.stats['hosts_created']:,}")
         print(f"Existing hosts updated: {self.stats['hosts_updated']:,}")
@@ -631,6 +868,49 @@ class OptimizedCMDBProcessor:
         print(f"  Hosts with region 'north america': {na_region_count:,}")
         print(f"  Hosts with country 'united states': {us_country_count:,}")
     
+    def verify_build(self):
+        """Refuse to publish a build that is empty, inconsistent or smaller than the live one"""
+        problems = []
+        hosts = self.duck_conn.execute("SELECT COUNT(*) FROM universal_cmdb").fetchone()[0]
+        coverage = self.duck_conn.execute("SELECT COUNT(*) FROM host_coverage").fetchone()[0]
+        if hosts == 0:
+            problems.append("universal_cmdb is empty")
+        if coverage != hosts:
+            problems.append(f"host_coverage has {coverage:,} rows for {hosts:,} hosts")
+        
+        live = self.versions.current() if self.versions else None
+        if live and live != os.path.realpath(self.build_path):
+            conn = duckdb.connect(live, read_only=True)
+            try:
+                live_hosts = conn.execute("SELECT COUNT(*) FROM universal_cmdb").fetchone()[0]
+            finally:
+                conn.close()
+            # Merges only add or update hosts, so fewer means the build lost data
+            if hosts < live_hosts:
+                problems.append(f"{hosts:,} hosts, fewer than the {live_hosts:,} published")
+        
+        if problems:
+            message = f"Build {self.build_path} failed verification: {'; '.join(problems)}"
+            if self.versions:
+                # Never resume on top of a rejected build: the next run copies the live version again
+                self.duck_conn.close()
+                message += f" (kept as {self.versions.reject()})"
+            raise RuntimeError(message)
+        print(f"\nVerified build: {hosts:,} hosts")
+    
+    def publish(self, version: str):
+        self.duck_conn.close()
+        published = self.versions.publish(version)
+        # Keep a read-only handle on what was published for reporting callers
+        self.duck_conn = duckdb.connect(published, read_only=True)
+        print(f"Published {published} as {self.versions.pointer}")
+    
+    def export_snapshot(self, directory: str = "universal_cmdb_snapshot"):
+        print(f"\nExporting Parquet snapshot to {directory}/...")
+        manifest = export_snapshot(self.duck_conn, directory, overwrite=True)
+        files = sum(len(table['files']) for table in manifest['tables'].values())
+        print(f"Export complete: {len(manifest['tables'])} tables in {files} files")
+    
     def export_csv(self, filename: str = "universal_cmdb_export.csv"):
         print(f"\nExporting to {filename}...")
         
@@ -645,6 +925,10 @@ class OptimizedCMDBProcessor:
         print(f"Export complete: {filename}")
     
     def close(self):
+        try:
+            self.merge_staged()
+        except Exception as e:
+            print(f"Could not merge staged records: {e}")
         try:
             self.duck_conn.close()
         except:
@@ -654,7 +938,22 @@ if __name__ == "__main__":
     processor = None
     
     try:
-        processor = OptimizedCMDBProcessor("reviewed_labeled_columns.json", "universal_cmdb.db")
+        parser = argparse.ArgumentParser(description="Build universal_cmdb.db from labeled BigQuery columns")
+        parser.add_argument('--full', action='store_true',
+                            help="ignore stored watermarks and re-fetch every table in full")
+        parser.add_argument('--no-resume', action='store_true',
+                            help="start a new run even if the previous one was interrupted")
+        parser.add_argument('--in-place', action='store_true',
+                            help="write universal_cmdb.db directly instead of publishing a new version; "
+                                 "stop the API first, its read-only connection holds the file lock")
+        parser.add_argument('--export', choices=['parquet', 'csv', 'none'], default='parquet',
+                            help="parquet: partitioned snapshot in universal_cmdb_snapshot/ (default); "
+                                 "csv: single universal_cmdb_export.csv")
+        args = parser.parse_args()
+        
+        processor = OptimizedCMDBProcessor("reviewed_labeled_columns.json", "universal_cmdb.db",
+                                           full_refresh=args.full, resume=not args.no_resume,
+                                           export_format=args.export, publish=not args.in_place)
         processor.process_all()
         
     except KeyboardInterrupt:
@@ -0,0 +1,162 @@
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+QUOTA_MARKERS = ['quota', 'rate limit', 'ratelimitexceeded', 'too many requests', '429']
+
+def is_quota_error(error):
+    text = str(error).lower()
+    return any(marker in text for marker in QUOTA_MARKERS)
+
+class AdaptiveConcurrency:
+    """AIMD limit on concurrent fetches.
+
+    The limit grows by one after each healthy fetch, halves on a quota or
+    rate-limit error, and steps down by one when a fetch's throughput (rows/s)
+    falls below `slow_factor` times the running average, which is what
+    backend congestion looks like from the client. Fetches smaller than
+    `min_sample_rows` are dominated by query overhead and don't count.
+    """
+
+    def __init__(self, initial=3, minimum=1, maximum=12, slow_factor=0.5, min_sample_rows=10000):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = max(minimum, min(initial, maximum))
+        self.slow_factor = slow_factor
+        self.min_sample_rows = min_sample_rows
+        self.active = 0
+        self.peak = 0
+        self.history = [self.limit]
+        self._throughput = None
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.active >= self.limit:
+                self._cond.wait()
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+    def _set_limit(self, limit):
+        limit = max(self.minimum, min(limit, self.maximum))
+        if limit != self.limit:
+            self.limit = limit
+            self.history.append(limit)
+            self._cond.notify_all()
+
+    def on_success(self, rows, seconds):
+        with self._cond:
+            if rows >= self.min_sample_rows and seconds > 0:
+                throughput = rows / seconds
+                if self._throughput is not None and throughput < self.slow_factor * self._throughput:
+                    self._throughput = 0.8 * self._throughput + 0.2 * throughput
+                    self._set_limit(self.limit - 1)
+                    return
+                self._throughput = throughput if self._throughput is None else 0.8 * self._throughput + 0.2 * throughput
+            self._set_limit(self.limit + 1)
+
+    def on_quota_error(self):
+        with self._cond:
+            self._set_limit(self.limit // 2)
+
+class TableScheduler:
+    """Fans table fetches out to worker threads and funnels writes to one writer.
+
+    `fetch(table)` runs on a worker and returns the number of rows it read;
+    anything it hands to `emit()` is queued (bounded, so fast fetchers block
+    instead of buffering unboundedly) and passed to `write(item)` on the single
+    writer thread, in emission order. Tables run largest estimate first so the
+    long poles start early; quota errors shrink concurrency and requeue the
+    table after an exponential backoff.
+    """
+
+    def __init__(self, fetch, write, concurrency=None, queue_size=32, max_attempts=5,
+                 backoff=2.0, sleep=time.sleep):
+        self.fetch = fetch
+        self.write = write
+        self.concurrency = concurrency or AdaptiveConcurrency()
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.sleep = sleep
+        self.results = {}
+        self.errors = {}
+        self.write_errors = []
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._pending = deque()
+        self._lock = threading.Lock()
+
+    def emit(self, item):
+        self._queue.put(item)
+
+    def _writer(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            try:
+                self.write(item)
+            except Exception as e:
+                # Keep draining so fetch workers never block on a dead writer
+                logger.error(f"Write failed: {e}")
+                self.write_errors.append(e)
+
+    def _next(self):
+        with self._lock:
+            return self._pending.popleft() if self._pending else None
+
+    def _worker(self):
+        while True:
+            entry = self._next()
+            if entry is None:
+                return
+            table, attempt = entry
+
+            self.concurrency.acquire()
+            started = time.monotonic()
+            try:
+                rows = self.fetch(table)
+            except Exception as e:
+                self.concurrency.release()
+                if is_quota_error(e) and attempt + 1 < self.max_attempts:
+                    self.concurrency.on_quota_error()
+                    delay = self.backoff * (2 ** attempt)
+                    logger.warning(f"Quota hit on {table}, concurrency now {self.concurrency.limit}, "
+                                   f"retrying in {delay:.1f}s")
+                    self.sleep(delay)
+                    with self._lock:
+                        self._pending.appendleft((table, attempt + 1))
+                else:
+                    logger.error(f"Failed to fetch {table}: {e}")
+                    self.errors[table] = e
+                continue
+
+            self.concurrency.release()
+            self.concurrency.on_success(rows or 0, time.monotonic() - started)
+            self.results[table] = rows
+
+    def run(self, tables):
+        """Fetch every (table, estimated_rows) pair; returns {table: rows fetched}"""
+        ordered = sorted(tables, key=lambda entry: entry[1] or 0, reverse=True)
+        self._pending.extend((table, 0) for table, _ in ordered)
+
+        writer = threading.Thread(target=self._writer, name='duckdb-writer', daemon=True)
+        writer.start()
+        workers = [threading.Thread(target=self._worker, name=f'fetch-{i}', daemon=True)
+                   for i in range(min(self.concurrency.maximum, len(ordered)))]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self._queue.put(None)
+        writer.join()
+        return self.results
@@ -1,8 +1,15 @@
+import argparse
 import duckdb
 import random
 import string
 from datetime import datetime, timedelta
 import os
+from coverage_snapshot import build_host_coverage
+from dimension_bridges import build_dimension_bridges
+from host_search import build_host_search_index
+from coverage_history import record_coverage_history
+from cmdb_metadata import bump_generation
+from db_versions import DatabaseVersions
 
 # Configuration
 DB_PATH = 'universal_cmdb.db'
@@ -58,7 +65,7 @@ def generate_unique_hostname(index, used_hosts):
             used_hosts.add(host)
             return host
 
-def create_database():
+def create_database(primary_key=True):
     """Create the database and table"""
     if os.path.exists(DB_PATH):
         os.remove(DB_PATH)
@@ -66,9 +73,9 @@ def create_database():
     
     conn = duckdb.connect(DB_PATH)
     
-    create_table_query = """
+    create_table_query = f"""
     CREATE TABLE universal_cmdb (
-        host VARCHAR PRIMARY KEY,
+        host VARCHAR{' PRIMARY KEY' if primary_key else ''},
         region VARCHAR,
         country VARCHAR,
         infrastructure_type VARCHAR,
@@ -283,16 +290,76 @@ def create_indexes(conn):
     
     print(f"Created {len(indexes)} indexes")
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate a mock universal_cmdb database")
+    parser.add_argument('--rows', type=int, default=NUM_ROWS, help="number of hosts to generate")
+    parser.add_argument('--db', default=DB_PATH, help="DuckDB file to (re)create")
+    parser.add_argument('--publish', action='store_true',
+                        help="build a new version beside --db and swap it in, so a running API never sees a partial file")
+    parser.add_argument('--columnar', action='store_true',
+                        help="vectorized, multi-process generation for 10M+ rows (needs numpy and pyarrow)")
+    parser.add_argument('--parquet', metavar='DIR',
+                        help="with --columnar, write Parquet shards to DIR instead of a database")
+    parser.add_argument('--workers', type=int, default=None, help="generator processes (default: CPU count)")
+    parser.add_argument('--seed', type=int, default=42, help="base seed; output is reproducible per seed")
+    parser.add_argument('--shard-rows', type=int, default=1_000_000, help="rows per shard")
+    parser.add_argument('--skew', type=float, default=0.0,
+                        help="Zipf exponent for categorical values (0 = uniform)")
+    parser.add_argument('--multi-value', default='1:0.5,2:0.5',
+                        help="count:weight distribution of values in multi-valued columns")
+    args = parser.parse_args()
+    if args.parquet and not args.columnar:
+        parser.error("--parquet requires --columnar")
+    if args.parquet and args.publish:
+        parser.error("--parquet writes shards, not a database; it cannot be combined with --publish")
+    return args
+
+def generate_columnar(conn, args):
+    """Append NumPy-generated shards from a process pool"""
+    # Imported here: columnar_generator reuses this module's value pools
+    import columnar_generator
+    columnar_generator.append_to_duckdb(
+        conn, args.rows, workers=args.workers, seed=args.seed, shard_rows=args.shard_rows,
+        skew=args.skew, multi_value=args.multi_value)
+
 def main():
+    global DB_PATH, NUM_ROWS
+    args = parse_args()
+    DB_PATH, NUM_ROWS = args.db, args.rows
+    versions = DatabaseVersions(args.db) if args.publish else None
+    if versions:
+        DB_PATH = versions.prepare(fresh=True)
+    random.seed(args.seed)
+    
     print("🚀 Universal CMDB Data Generator")
     print("=" * 50)
     
+    if args.parquet:
+        import columnar_generator
+        columnar_generator.write_parquet(
+            args.parquet, args.rows, workers=args.workers, seed=args.seed, shard_rows=args.shard_rows,
+            skew=args.skew, multi_value=args.multi_value)
+        return
+    
     try:
-        conn = create_database()
-        insert_data(conn)
-        create_indexes(conn)
+        if args.columnar:
+            # Hostnames are unique by construction; a primary key index over
+            # tens of millions of rows would only slow the load down
+            conn = create_database(primary_key=False)
+            generate_columnar(conn, args)
+        else:
+            conn = create_database()
+            insert_data(conn)
+            create_indexes(conn)
+        build_host_coverage(conn)
+        build_dimension_bridges(conn)
+        build_host_search_index(conn)
+        generation = bump_generation(conn)
+        record_coverage_history(conn, generation)
         verify_data(conn)
         conn.close()
+        if versions:
+            DB_PATH = versions.publish(generation)
         
         print("\n✅ Database created successfully!")
         print(f"📁 File: {DB_PATH}")
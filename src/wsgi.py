@@ -0,0 +1,74 @@
+"""Production entry point for the dashboard API.
+
+    gunicorn --chdir src -w 4 -k gthread --threads 8 -b 0.0.0.0:5000 wsgi:application
+    python src/wsgi.py --workers 4 --threads 8 --bind 0.0.0.0:5000
+
+Each worker process opens its own read-only DuckDB connection on first use,
+so the app is not preloaded: a connection created before fork would be
+shared between workers. Workers also build their own coverage cube and
+response cache, and /metrics and /api/_debug/profile describe only the worker
+that answered. Threads serve concurrent requests within a worker, and
+independent queries inside a request fan out over DatabaseManager's query
+pool (CMDB_QUERY_WORKERS). Without gunicorn installed the script falls back
+to werkzeug's threaded server, single process and without the debugger.
+"""
+import argparse
+import os
+from app import app
+
+application = app
+
+def gunicorn_options(args):
+    return {
+        'bind': args.bind,
+        'workers': args.workers,
+        'worker_class': 'gthread',
+        'threads': args.threads,
+        'timeout': args.timeout,
+        'preload_app': False,
+        'accesslog': '-' if args.access_log else None,
+    }
+
+def serve_gunicorn(options):
+    from gunicorn.app.base import BaseApplication
+
+    class StandaloneApplication(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                if value is not None:
+                    self.cfg.set(key, value)
+
+        def load(self):
+            return application
+
+    StandaloneApplication().run()
+
+def serve_werkzeug(args):
+    from werkzeug.serving import run_simple
+    host, _, port = args.bind.rpartition(':')
+    print("gunicorn is not installed; serving with werkzeug's threaded server (pip install gunicorn)")
+    run_simple(host or '0.0.0.0', int(port), application, threaded=True)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve the CMDB dashboard API")
+    parser.add_argument('--bind', default=os.getenv('CMDB_BIND', '0.0.0.0:5000'))
+    parser.add_argument('--workers', type=int, default=int(os.getenv('CMDB_WORKERS', min(4, os.cpu_count() or 1))),
+                        help="worker processes")
+    parser.add_argument('--threads', type=int, default=int(os.getenv('CMDB_THREADS', 8)),
+                        help="request threads per worker")
+    parser.add_argument('--timeout', type=int, default=120,
+                        help="seconds before a silent worker is restarted; cold cube builds on large data take a while")
+    parser.add_argument('--access-log', action='store_true')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        serve_werkzeug(args)
+        return
+    serve_gunicorn(gunicorn_options(args))
+
+if __name__ == '__main__':
+    main()